@@ -1,16 +1,134 @@
-from flask import Flask, render_template, redirect, url_for, flash, request, jsonify
+from flask import Flask, Response, render_template, redirect, url_for, flash, request, jsonify, session, g, has_request_context
+from flask import abort, before_render_template, template_rendered
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import String, event, literal, tuple_, type_coerce
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import defer, joinedload
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+import atexit
+import sqlite3
 import os
 
+from build_static import StaticSite
+from content import process_content
+from db_pool import apply_pragmas
+from db_writer import DatabaseWriter
+from instrumentation import Instrumentation, current, gauge_lines, phase
+from http_cache import COMPRESSIBLE_TYPES, STATIC_MAX_AGE, CachedPage, compress_body, file_version, http_date, is_not_modified
+from listing import LISTING_FILTERS, LISTING_LABELS, listing_owner
+from migrations import migrate
+from page_cache import PageCache, article_tags
+from pagination import PAGE_SIZE, decode_cursor, split_page
+from passwords import HasherBusy, PasswordHasher
+from recommendations import related_articles
+from retention import HISTORY_DAYS, HistoryPruner, dedicated_connection
+from search import SearchIndexer, search_articles, search_page
+from session_store import SessionStore
+from trending import BOARD_LABELS, Trending
+from view_buffer import ViewBuffer
+
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///blog.db'
+# 可通过环境变量指定数据库，例如压测时使用临时库
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('BLOG_DATABASE_URI', 'sqlite:///blog.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# 单个请求允许执行的 SQL 条数，超出时测试中直接失败，线上记录警告
+app.config['SQL_STATEMENT_BUDGET'] = 10
+app.config['SQL_STATEMENT_BUDGETS'] = {}
+# 静态文件 URL 带内容版本号，可以长期缓存
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = STATIC_MAX_AGE
 
 db = SQLAlchemy(app)
+
+# 请求埋点：各路由耗时直方图、DB / 渲染 / 写出耗时，慢请求记录和可选的 cProfile 采样
+instrumentation = Instrumentation(
+    slow_ms=float(os.environ.get('BLOG_SLOW_MS', 500)),
+    profile_rate=float(os.environ.get('BLOG_PROFILE_RATE', 0)),
+    profile_dir=os.environ.get('BLOG_PROFILE_DIR', 'profiles'),
+)
+app.wsgi_app = instrumentation.wsgi_middleware(app.wsgi_app)
+
+# 指标按路由规则汇总，不把文章 id 等参数带进标签
+@app.before_request
+def set_metrics_route():
+    timer = current()
+    if timer is not None and request.url_rule is not None:
+        timer.route = request.url_rule.rule
+
+# 新建的 SQLite 连接统一使用 WAL 和调优过的 PRAGMA。
+# ORM 连接只读（query_only），所有写入交给写线程（见 db_writer）
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        apply_pragmas(dbapi_connection)
+        dbapi_connection.execute('PRAGMA query_only = ON')
+
+# 统计每个请求执行的 SQL 条数和耗时
+@event.listens_for(Engine, 'before_cursor_execute')
+def count_sql_statements(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.sql_statements = g.get('sql_statements', 0) + 1
+    timer = current()
+    if timer is not None:
+        timer.statements += 1
+        timer.begin('db')
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def end_sql_timing(conn, cursor, statement, parameters, context, executemany):
+    timer = current()
+    if timer is not None:
+        timer.end('db')
+
+@event.listens_for(Engine, 'handle_error')
+def end_sql_timing_on_error(context):
+    timer = current()
+    if timer is not None:
+        timer.end('db')
+
+# 模板渲染耗时
+@before_render_template.connect_via(app)
+def begin_render_timing(sender, template, context, **extra):
+    timer = current()
+    if timer is not None:
+        timer.begin('render')
+
+@template_rendered.connect_via(app)
+def end_render_timing(sender, template, context, **extra):
+    timer = current()
+    if timer is not None:
+        timer.end('render')
+
+@app.after_request
+def check_sql_budget(response):
+    count = g.get('sql_statements', 0)
+    budget = app.config['SQL_STATEMENT_BUDGETS'].get(request.endpoint, app.config['SQL_STATEMENT_BUDGET'])
+    if budget is not None and count > budget:
+        message = f'{request.method} {request.path} 执行了 {count} 条 SQL，超过预算 {budget}'
+        if app.testing:
+            raise AssertionError(message)
+        app.logger.warning(message)
+    return response
+
+# 未缓存的动态响应按 Accept-Encoding 做 gzip 压缩
+@app.after_request
+def compress_response(response):
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+    encoding, body = compress_body(response.get_data(), request.headers.get('Accept-Encoding'))
+    if encoding:
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+# 带内容版本号的静态文件 URL，文件内容变化后 URL 随之变化
+@app.template_global()
+def static_url(filename):
+    return url_for('static', filename=filename, v=file_version(os.path.join(app.static_folder, filename)))
+
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
@@ -42,9 +160,20 @@ class Article(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     views = db.Column(db.Integer, default=0)
+    # 写入时由 content.process_content 生成。ORM 连接只读，
+    # 文章通过 db_writer.run(content.insert_article / update_article) 写入
+    content_html = db.Column(db.Text)
+    excerpt = db.Column(db.Text)
+    word_count = db.Column(db.Integer)
+    reading_time = db.Column(db.Integer)
+    
+    author = db.relationship('User')
     
     # 浏览历史关系
     view_history = db.relationship('ArticleViewHistory', backref='article', lazy='dynamic', cascade='all, delete-orphan')
+    
+    # 首页按 (created_at, id) 倒序分页
+    __table_args__ = (db.Index('idx_article_created', 'created_at', 'id'),)
 
 class ArticleViewHistory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -52,47 +181,297 @@ class ArticleViewHistory(db.Model):
     article_id = db.Column(db.Integer, db.ForeignKey('article.id'), nullable=False)
     viewed_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    # 复合唯一约束，确保同一用户对同一文章只有一条记录
-    __table_args__ = (db.UniqueConstraint('user_id', 'article_id', name='_user_article_uc'),)
+    # 复合唯一约束，确保同一用户对同一文章只有一条记录；
+    # (user_id, viewed_at, article_id) 覆盖浏览历史页的查询，(viewed_at) 用于清理过期记录
+    __table_args__ = (db.UniqueConstraint('user_id', 'article_id', name='_user_article_uc'),
+                      db.Index('idx_history_user_viewed', 'user_id', 'viewed_at', 'article_id'),
+                      db.Index('idx_history_viewed', 'viewed_at'))
+
+# 文章列表的读模型，由 listing.py 中的触发器维护，应用只读取
+class ArticleListing(db.Model):
+    __tablename__ = 'article_listing'
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(200), nullable=False)
+    summary = db.Column(db.String(500))
+    excerpt = db.Column(db.Text)
+    author_id = db.Column(db.Integer, nullable=False)
+    author_name = db.Column(db.String(80), nullable=False)
+    category_id = db.Column(db.Integer, nullable=False)
+    category_name = db.Column(db.String(50), nullable=False)
+    created_at = db.Column(db.DateTime)
+    views = db.Column(db.Integer)
+    
+    __table_args__ = (db.Index('idx_listing_created', 'created_at', 'id'),
+                      db.Index('idx_listing_category', 'category_id', 'created_at', 'id'),
+                      db.Index('idx_listing_author', 'author_id', 'created_at', 'id'))
+
+# 底层 DB-API 连接（与 ORM 一样只读），用于绕过 ORM 的查询
+@contextmanager
+def raw_connection():
+    with app.app_context():
+        conn = db.engine.raw_connection()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+# 渲染好的页面缓存，数据变化时按标签失效
+page_cache = PageCache()
+
+# 文章新增、修改或浏览量落库后调用，使首页和对应文章页失效
+def invalidate_article_pages(article_ids):
+    page_cache.invalidate('index', *article_tags(article_ids))
+
+def database_path():
+    with app.app_context():
+        return db.engine.url.database
+
+# 所有写入（浏览落库、热门榜快照、会话、用户、历史清理）交给唯一的写线程组提交
+def writer_connection():
+    return sqlite3.connect(database_path(), timeout=30.0, check_same_thread=False)
+
+db_writer = DatabaseWriter(writer_connection)
+
+# 浏览次数和浏览历史先写入内存，由后台线程批量落库
+view_buffer = ViewBuffer(raw_connection, on_flush=invalidate_article_pages, write=db_writer.run)
+
+# 定期删除超过保留期的浏览历史，可选归档到单独的数据库文件。
+# 删除交给写线程；归档要 ATTACH 归档库，只能在单独的可写连接上进行
+history_pruner = HistoryPruner(
+    lambda: dedicated_connection(database_path()),
+    days=int(os.environ.get('BLOG_RETENTION_DAYS', HISTORY_DAYS)),
+    interval=float(os.environ.get('BLOG_PRUNE_INTERVAL', 3600)),
+    archive_path=os.environ.get('BLOG_HISTORY_ARCHIVE'),
+    write=db_writer.run,
+)
+
+# 新写入或修改的文章在后台补进短词搜索索引
+search_indexer = SearchIndexer(raw_connection, write=db_writer.run)
+
+# 热门文章榜：每次文章页访问（包括命中缓存的匿名访问）计入内存中的衰减计数，定期快照到数据库。
+# 启动时由 create_app 从快照恢复后再开始定时保存
+trending = Trending(raw_connection, snapshot_interval=float(os.environ.get('BLOG_TRENDING_INTERVAL', 60)),
+                    write=db_writer.run)
+
+# 密码哈希在独立的进程池中计算，排队过多时返回 503
+password_hasher = PasswordHasher(
+    workers=int(os.environ['BLOG_HASH_WORKERS']) if 'BLOG_HASH_WORKERS' in os.environ else None,
+    max_pending=int(os.environ.get('BLOG_HASH_QUEUE', 0)) or None,
+)
+atexit.register(password_hasher.shutdown)
+
+@app.errorhandler(HasherBusy)
+def hasher_busy(error):
+    return Response('服务器繁忙，请稍后再试', status=503, mimetype='text/plain', headers={'Retry-After': '1'})
+
+# 记录一次浏览；该用户自己的缓存页面立即失效，保证能看到自己的浏览计数
+def record_view(user_id, article_id):
+    view_buffer.record(user_id, article_id)
+    page_cache.invalidate(f'user:{user_id}')
+
+# 先查页面缓存，未命中时渲染并写入缓存；有待显示的 flash 消息时不走缓存。
+# render 可以设置 g.last_modified 作为页面的 Last-Modified
+def cached_page(key, tags, render):
+    if session.get('_flashes'):
+        return render()
+    page = page_cache.get(key)
+    if page is None:
+        token = page_cache.token(tags)
+        g.pop('last_modified', None)
+        page = CachedPage(render().encode(), g.pop('last_modified', None))
+        page_cache.set(key, page, tags, token, size=page.size)
+    return page_response(page)
+
+# 由缓存的页面生成响应：条件请求命中时返回 304，不需要重新渲染；否则按 Accept-Encoding 选择预压缩版本
+def page_response(page):
+    if is_not_modified(request.headers, page.etag, page.last_modified):
+        response = Response(status=304)
+    else:
+        encoding, body = page.select(request.headers.get('Accept-Encoding'))
+        response = Response(body, mimetype='text/html')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.headers['ETag'] = page.etag
+    if page.last_modified:
+        response.headers['Last-Modified'] = http_date(page.last_modified)
+    response.headers['Cache-Control'] = 'private, no-cache' if current_user.is_authenticated else 'no-cache'
+    response.vary.update(('Accept-Encoding', 'Cookie'))
+    return response
+
+# 预先生成的静态页面（build_static.py），设置 BLOG_STATIC_SITE 后匿名访问直接发送其中仍然新鲜的页面，
+# 浏览量为生成时的数值
+static_site = StaticSite(os.environ['BLOG_STATIC_SITE'], raw_connection) if os.environ.get('BLOG_STATIC_SITE') else None
+
+# 匿名访问且没有待显示的 flash 消息时才使用静态页面
+def static_page(load):
+    if static_site is None or current_user.is_authenticated or session.get('_flashes'):
+        return None
+    return load()
+
+# 登录会话：Flask 的 session cookie 中保存会话 id，用户信息缓存在 session_store 中，
+# 已登录请求不再查询 user 表；会话同时写入 user_session 表，重启后仍然有效
+session_store = SessionStore(
+    raw_connection,
+    ttl=int(os.environ.get('BLOG_SESSION_TTL', 7 * 24 * 3600)),
+    max_entries=int(os.environ.get('BLOG_SESSION_CACHE', 10000)),
+    write=db_writer.run,
+)
+
+# current_user 只用到 id 和用户名，用轻量对象代替 ORM 实例
+class SessionUser(UserMixin):
+    def __init__(self, record):
+        self.id = record['id']
+        self.username = record['username']
+        self.email = record['email']
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    record = session_store.get(session.get('sid'))
+    if record is not None and str(record['id']) == user_id:
+        return SessionUser(record)
+    # 服务端会话已注销或过期
+    return None
 
 # 路由
 @app.route('/')
 def index():
-    articles = Article.query.order_by(Article.created_at.desc()).all()
-    return render_template('index.html', articles=articles)
+    cursor = request.args.get('cursor')
+    try:
+        position = decode_cursor(cursor)
+    except ValueError:
+        return '无效的分页游标', 400
+    
+    page = static_page(lambda: static_site.index(cursor))
+    if page is not None:
+        return page_response(page)
+    render = lambda: render_index(position)
+    if current_user.is_authenticated:
+        return cached_page(('/', cursor, current_user.id), ('index', f'user:{current_user.id}'), render)
+    return cached_page(('/', cursor, None), ('index',), render)
+
+def render_index(position=None):
+    rows, pending = view_buffer.consistent_read(lambda: list_articles(position))
+    articles, next_cursor = split_page(rows, PAGE_SIZE, lambda article: (article.cursor_time, article.id))
+    return render_template('index.html', articles=articles, pending=pending, next_cursor=next_cursor)
+
+# 文章卡片需要的列。cursor_time 是库中 created_at 的原始字符串，用于分页游标
+def card_query():
+    return db.session.query(
+        ArticleListing.id, ArticleListing.title, ArticleListing.summary, ArticleListing.excerpt,
+        ArticleListing.created_at, ArticleListing.views, ArticleListing.author_name, ArticleListing.category_name,
+        ArticleListing.author_id, ArticleListing.category_id,
+        type_coerce(ArticleListing.created_at, String).label('cursor_time'),
+    )
+
+# 首页列表：从读模型中只查询列表需要的列，作者名、分类名和正文开头已经预先算好；
+# 指定分类或作者时按对应的 (分类/作者, created_at, id) 索引扫描。
+# 游标中的时间按字符串绑定：库中的值有的带微秒有的不带，转成 datetime 再绑定会统一补上微秒，
+# 与排序用的原始字符串比较结果不一致，同一秒内的文章会在下一页重复出现
+def list_articles(position=None, **filters):
+    query = card_query().filter_by(**filters)
+    if position:
+        query = query.filter(tuple_(ArticleListing.created_at, ArticleListing.id)
+                             < tuple_(literal(position[0], String), position[1]))
+    return query.order_by(ArticleListing.created_at.desc(), ArticleListing.id.desc()).limit(PAGE_SIZE + 1).all()
+
+# 分类页、作者页：与首页一样缓存，随首页一起失效；文章数取自增量维护的计数表
+@app.route('/category/<int:category_id>')
+def category_articles(category_id):
+    return listing('category', category_id)
+
+@app.route('/author/<int:author_id>')
+def author_articles(author_id):
+    return listing('author', author_id)
+
+def listing(kind, owner_id):
+    cursor = request.args.get('cursor')
+    try:
+        position = decode_cursor(cursor)
+    except ValueError:
+        return '无效的分页游标', 400
+    with raw_connection() as conn:
+        owner = listing_owner(conn, kind, owner_id)
+    if owner is None:
+        abort(404)
+    
+    render = lambda: render_listing(kind, owner_id, owner, position)
+    key = (request.path, cursor, current_user.id if current_user.is_authenticated else None)
+    if current_user.is_authenticated:
+        return cached_page(key, ('index', f'user:{current_user.id}'), render)
+    return cached_page(key, ('index',), render)
+
+def render_listing(kind, owner_id, owner, position=None):
+    filters = {LISTING_FILTERS[kind][0]: owner_id}
+    rows, pending = view_buffer.consistent_read(lambda: list_articles(position, **filters))
+    articles, next_cursor = split_page(rows, PAGE_SIZE, lambda article: (article.cursor_time, article.id))
+    return render_template('listing.html', label=LISTING_LABELS[kind], name=owner[0], count=owner[1],
+                           articles=articles, pending=pending, next_cursor=next_cursor)
+
+# 热门榜：前 K 篇的 id 来自内存中的榜单，再按主键取出卡片字段，耗时只与 K 有关
+@app.route('/trending')
+def trending_articles():
+    return render_ranking('trending')
+
+@app.route('/popular')
+def popular_articles():
+    return render_ranking('popular')
+
+def render_ranking(name):
+    article_ids = [article_id for article_id, _ in trending.top(name)]
+    load = lambda: card_query().filter(ArticleListing.id.in_(article_ids)).all() if article_ids else []
+    rows, pending = view_buffer.consistent_read(load)
+    by_id = {row.id: row for row in rows}
+    label, description = BOARD_LABELS[name]
+    return render_template('ranking.html', label=label, description=description, pending=pending,
+                           articles=[by_id[article_id] for article_id in article_ids if article_id in by_id])
 
 @app.route('/article/<int:article_id>')
 def article_detail(article_id):
-    article = Article.query.get_or_404(article_id)
+    response = article_response(article_id)
+    # 文章不存在时上面已经抛出 404，不计入热门榜
+    trending.record(article_id)
+    return response
+
+def article_response(article_id):
+    # 登录用户的浏览会产生写入，只缓存匿名访问的文章页
+    if current_user.is_authenticated:
+        return render_article(article_id)
+    page = static_page(lambda: static_site.article(article_id))
+    if page is not None:
+        return page_response(page)
+    return cached_page((f'/article/{article_id}', None), article_tags([article_id]),
+                       lambda: render_article(article_id))
+
+def render_article(article_id):
+    # 作者和分类随文章一次查出；正文只读写入时生成的 content_html，原文不查询
+    query = Article.query.options(joinedload(Article.author), joinedload(Article.category),
+                                  defer(Article.content)).filter_by(id=article_id)
+    article, pending = view_buffer.consistent_read(query.first_or_404)
+    views = article.views + pending.get(article_id, 0)
+    if article.content_html is None:
+        # 预计算列还没补齐（python content.py backfill），临时计算
+        content_html, _, word_count, reading_time = process_content(article.content)
+    else:
+        content_html, word_count, reading_time = article.content_html, article.word_count, article.reading_time
+    # Last-Modified 取文章修改时间；浏览量变化只体现在 ETag（内容哈希）中
+    g.last_modified = article.updated_at
     
-    # 记录浏览历史（仅登录用户）
+    # 记录浏览历史和浏览计数（仅登录用户）
     if current_user.is_authenticated:
-        # 检查是否已有浏览记录
-        existing_history = ArticleViewHistory.query.filter_by(
-            user_id=current_user.id,
-            article_id=article_id
-        ).first()
-        
-        if existing_history:
-            # 更新浏览时间
-            existing_history.viewed_at = datetime.utcnow()
-        else:
-            # 创建新记录
-            new_history = ArticleViewHistory(
-                user_id=current_user.id,
-                article_id=article_id
-            )
-            db.session.add(new_history)
-        
-        # 更新文章浏览计数
-        article.views += 1
-        db.session.commit()
+        record_view(current_user.id, article_id)
+        views += 1
     
-    return render_template('article_detail.html', article=article)
+    with raw_connection() as conn:
+        related = related_articles(conn, article_id)
+    return render_template('article_detail.html', article=article, views=views, content_html=content_html,
+                           word_count=word_count, reading_time=reading_time, related=related)
+
+# 用户写入交给写线程（ORM 连接只读），提交由写线程负责
+def upgrade_password_hash(conn, user_id, old_hash, new_hash):
+    conn.execute('UPDATE user SET password_hash = ? WHERE id = ? AND password_hash = ?', (new_hash, user_id, old_hash))
+
+def insert_user(conn, username, email, password_hash):
+    conn.execute('INSERT INTO user (username, email, password_hash) VALUES (?, ?, ?)', (username, email, password_hash))
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -101,8 +480,16 @@ def login():
         password = request.form['password']
         user = User.query.filter_by(username=username).first()
         
-        if user and check_password_hash(user.password_hash, password):
+        valid = False
+        if user is not None:
+            with phase('hash'):
+                valid, new_hash = password_hasher.verify(user.password_hash, password)
+            if new_hash:
+                # 旧格式或迭代次数不足的哈希升级为当前设置
+                db_writer.run(upgrade_password_hash, user.id, user.password_hash, new_hash)
+        if valid:
             login_user(user)
+            session['sid'] = session_store.create({'id': user.id, 'username': user.username, 'email': user.email})
             return redirect(url_for('index'))
         else:
             flash('用户名或密码错误')
@@ -126,13 +513,14 @@ def register():
             return render_template('register.html')
         
         # 创建新用户
-        new_user = User(
-            username=username,
-            email=email,
-            password_hash=generate_password_hash(password)
-        )
-        db.session.add(new_user)
-        db.session.commit()
+        with phase('hash'):
+            password_hash = password_hasher.hash(password)
+        try:
+            db_writer.run(insert_user, username, email, password_hash)
+        except sqlite3.IntegrityError:
+            # 计算哈希期间同名用户或同一邮箱已注册
+            flash('用户名或邮箱已被注册')
+            return render_template('register.html')
         
         flash('注册成功，请登录')
         return redirect(url_for('login'))
@@ -142,76 +530,106 @@ def register():
 @app.route('/logout')
 @login_required
 def logout():
+    session_store.delete(session.pop('sid', None))
     logout_user()
     return redirect(url_for('index'))
 
 @app.route('/browsing-history')
 @login_required
 def browsing_history():
+    # 先写入缓冲中的浏览记录，保证能看到刚浏览过的文章
+    view_buffer.flush()
+    
     # 获取当前用户的浏览历史，只显示最近一个月的记录
-    one_month_ago = datetime.utcnow() - timedelta(days=30)
+    one_month_ago = datetime.utcnow() - timedelta(days=HISTORY_DAYS)
     
-    history = ArticleViewHistory.query.filter_by(user_id=current_user.id)\
+    # 标题和分类名从读模型中取，只连接一张表
+    history = db.session.query(
+        ArticleViewHistory.viewed_at, ArticleListing.id, ArticleListing.title, ArticleListing.category_name,
+    ).join(ArticleListing, ArticleViewHistory.article_id == ArticleListing.id)\
+        .filter(ArticleViewHistory.user_id == current_user.id)\
         .filter(ArticleViewHistory.viewed_at >= one_month_ago)\
         .order_by(ArticleViewHistory.viewed_at.desc())\
         .all()
     
     return render_template('browsing_history.html', history=history)
 
-@app.before_first_request
-def create_tables():
-    db.create_all()
-    
-    # 创建示例数据
-    if not User.query.first():
-        # 创建示例用户
-        demo_user = User(
-            username='demo',
-            email='demo@example.com',
-            password_hash=generate_password_hash('demo123')
-        )
-        db.session.add(demo_user)
-        
-        # 创建示例分类
-        categories = [
-            Category(name='技术', description='技术相关文章'),
-            Category(name='生活', description='生活感悟'),
-            Category(name='学习', description='学习笔记')
-        ]
-        for cat in categories:
-            db.session.add(cat)
-        
-        db.session.commit()
-        
-        # 创建示例文章
-        demo_articles = [
-            Article(
-                title='Flask入门指南',
-                content='Flask是一个轻量级的Python Web框架，非常适合快速开发Web应用...',
-                summary='本文介绍了Flask框架的基础知识和使用方法',
-                author_id=1,
-                category_id=1
-            ),
-            Article(
-                title='Python装饰器详解',
-                content='装饰器是Python中一个非常强大的功能，它可以让你在不修改原函数代码的情况下...',
-                summary='深入理解Python装饰器的原理和应用',
-                author_id=1,
-                category_id=1
-            ),
-            Article(
-                title='我的编程学习之路',
-                content='从开始接触编程到现在，已经有好几年的时间了。在这个过程中...',
-                summary='分享我的编程学习经验和心得体会',
-                author_id=1,
-                category_id=3
-            )
-        ]
-        
-        for article in demo_articles:
-            db.session.add(article)
-        
-        db.session.commit()
+@app.route('/search')
+def search():
+    q = request.args.get('q', '').strip()
+    page = search_page(request.args.get('page', 1, type=int))
+    results, has_next = [], False
+    if q:
+        with raw_connection() as conn:
+            results, has_next = search_articles(conn, q, page)
+    return render_template('search.html', q=q, page=page, results=results, has_next=has_next)
+
+# Prometheus 文本格式的指标
+@app.route('/_metrics')
+def metrics():
+    text = instrumentation.metrics.render()
+    text += gauge_lines('blog_view_buffer', view_buffer.metrics())
+    text += gauge_lines('blog_page_cache', page_cache.stats())
+    text += gauge_lines('blog_history_pruner', history_pruner.metrics())
+    text += gauge_lines('blog_search_indexer', search_indexer.metrics())
+    text += gauge_lines('blog_sessions', session_store.metrics())
+    text += gauge_lines('blog_password_hasher', password_hasher.metrics())
+    if static_site:
+        text += gauge_lines('blog_static_site', static_site.metrics())
+    text += gauge_lines('blog_trending', trending.metrics())
+    text += gauge_lines('blog_db_writer', db_writer.metrics())
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
+# 运行状态统计
+@app.route('/_stats')
+def stats():
+    return jsonify(view_buffer=view_buffer.metrics(), page_cache=page_cache.stats(),
+                   history_pruner=history_pruner.metrics(), search_indexer=search_indexer.metrics(),
+                   sessions=session_store.metrics(), password_hasher=password_hasher.metrics(),
+                   trending=trending.metrics(),
+                   static_site=static_site.metrics() if static_site else None, db_writer=db_writer.metrics())
+
+# 启动服务：执行未完成的数据库迁移（结构已是最新时只读取 user_version），启动后台线程，
+# 并在开始接受请求之前预热：首页和最新一篇文章的匿名页面渲染进页面缓存，同时完成模板和 ORM 查询的编译。
+# 导入本模块不访问数据库也不启动线程（测试、build_static 直接使用 app）。
+# 运行: flask --app 'app:create_app()' run 或 python app.py。演示数据由 migrations.py seed 写入
+_started = False
+
+def create_app():
+    global _started
+    if _started:
+        return app
+    _started = True
+    with dedicated_connection(database_path()) as conn:
+        for version, description in migrate(conn):
+            print(f'数据库迁移 {version}: {description}')
+    # atexit 按注册的相反顺序执行：写线程最先注册、最后停止，其他组件退出前的写入都能完成
+    db_writer.start()
+    atexit.register(db_writer.stop)
+    view_buffer.start()
+    atexit.register(view_buffer.stop)
+    history_pruner.start()
+    atexit.register(history_pruner.stop)
+    search_indexer.start()
+    atexit.register(search_indexer.stop)
+    trending.load()
+    trending.start()
+    atexit.register(trending.stop)
+    session_store.setup()
+    warm_up()
+    return app
+
+def warm_up():
+    with app.test_request_context('/'):
+        index()
+        latest = db.session.query(ArticleListing.id).order_by(ArticleListing.created_at.desc(),
+                                                               ArticleListing.id.desc()).first()
+    if latest is not None:
+        with app.test_request_context(f'/article/{latest.id}'):
+            article_response(latest.id)
 
 if __name__ == '__main__':
+    # 调试模式的重载器由父进程监视文件、子进程处理请求，只在子进程中启动
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        create_app()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,1220 @@
+import argparse
+import concurrent.futures
+import contextlib
+import datetime
+import http.client
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import urllib.parse
+import urllib.request
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 在临时目录中启动 simple_blog，避免改动仓库里的 blog.db
+def start_simple_blog(port, workers, workdir, extra_args=()):
+    proc = spawn_simple_blog(port, workers, workdir, extra_args)
+    wait_for_port(port)
+    return proc
+
+def spawn_simple_blog(port, workers, workdir, extra_args=()):
+    return subprocess.Popen(
+        [sys.executable, os.path.join(BASE_DIR, 'simple_blog.py'), '--port', str(port), '--workers', str(workers),
+         *extra_args],
+        cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+# Flask 开发服务器（多线程），通过 BLOG_DATABASE_URI 指向临时库
+def start_flask_app(port, workdir, extra_env=None):
+    proc = spawn_flask_app(port, workdir, extra_env)
+    wait_for_port(port, proc=proc, log=os.path.join(workdir, 'server.log'))
+    return proc
+
+def spawn_flask_app(port, workdir, extra_env=None):
+    env = dict(os.environ, BLOG_DATABASE_URI='sqlite:///' + os.path.join(workdir, 'blog.db'), **(extra_env or {}))
+    log = open(os.path.join(workdir, 'server.log'), 'wb')
+    return subprocess.Popen(
+        [sys.executable, '-m', 'flask', '--app', 'app:create_app()', 'run', '--host', '127.0.0.1', '--port', str(port),
+         '--with-threads'],
+        cwd=BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+def wait_for_port(port, timeout=10.0, proc=None, log=None):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc is not None and proc.poll() is not None:
+            output = open(log, errors='replace').read()[-2000:] if log else ''
+            raise RuntimeError(f'服务器启动失败，退出码 {proc.returncode}\n{output}')
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f'服务器未在 {timeout} 秒内启动: 端口 {port}')
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+# 慢客户端只发送半个请求并一直占住连接，用来模拟网络很慢的用户
+def open_slow_clients(port, count):
+    sockets = []
+    for _ in range(count):
+        s = socket.create_connection(('127.0.0.1', port))
+        s.sendall(b'GET / HTTP/1.1\r\n')
+        sockets.append(s)
+    return sockets
+
+# 每个客户端线程顺序发送请求，统计整体吞吐
+def run_clients(url, clients, requests_per_client, timeout=30):
+    errors = []
+
+    def client():
+        for _ in range(requests_per_client):
+            try:
+                with urllib.request.urlopen(url, timeout=timeout) as resp:
+                    resp.read()
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return clients * requests_per_client / elapsed, len(errors)
+
+def cmd_load(args):
+    levels = [int(x) for x in args.concurrency.split(',')]
+    workdir = tempfile.mkdtemp(prefix='blog-bench-')
+    seed_articles(os.path.join(workdir, 'blog.db'), 0).close()
+    port = free_port()
+    proc = start_simple_blog(port, args.workers, workdir)
+    slow = []
+    try:
+        url = f'http://127.0.0.1:{port}{args.path}'
+        slow = open_slow_clients(port, args.slow_clients)
+        print(f'simple_blog workers={args.workers} slow_clients={args.slow_clients} url={url}')
+        print(f'{"clients":>8} {"req/s":>10} {"errors":>7}')
+        for clients in levels:
+            throughput, errors = run_clients(url, clients, args.requests, args.timeout)
+            print(f'{clients:>8} {throughput:>10.1f} {errors:>7}')
+    finally:
+        for s in slow:
+            s.close()
+        proc.terminate()
+        proc.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+WORDS = ('性能', '数据库', '索引', '缓存', '并发', '线程', '模板', '渲染', '查询', '事务',
+         'Python', 'Flask', 'SQLite', '装饰器', '生成器', '协程', '网络', '服务器', '学习', '生活',
+         '旅行', '读书', '笔记', '算法', '架构', '部署', '监控', '日志', '测试', '优化')
+
+# 常用汉字范围内的随机字符作为正文，再随机插入几个词表中的词，用于全文搜索测试
+def random_text(rng, words):
+    parts = [''.join(chr(rng.randint(0x4E00, 0x4E00 + 3000)) for _ in range(4)) for _ in range(words)]
+    for _ in range(3):
+        parts[rng.randrange(words)] = rng.choice(WORDS)
+    return '，'.join(parts) + '。'
+
+# 与服务器写入文章时一样，同时写入正文的预计算列
+ARTICLE_INSERT = '''
+    INSERT INTO article (title, content, summary, author_id, category_id, created_at, updated_at, views,
+                         content_html, excerpt, word_count, reading_time)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# 建一个带示例数据的空库，再批量写入 count 篇文章，created_at 按分钟递增
+def seed_articles(path, count, batch=10000, content=None):
+    sys.path.insert(0, BASE_DIR)
+    from content import process_content
+    from migrations import migrate, seed_demo
+
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    seed_demo(conn)
+    start = datetime.datetime(2020, 1, 1)
+    fixed_content = '这是一段用于性能测试的文章正文。' * 40
+    fixed_fields = process_content(fixed_content)
+    cursor = conn.cursor()
+    for offset in range(0, count, batch):
+        rows = []
+        for i in range(offset, min(offset + batch, count)):
+            created_at = (start + datetime.timedelta(minutes=i)).strftime('%Y-%m-%d %H:%M:%S')
+            text = content(i) if content else fixed_content
+            fields = process_content(text) if content else fixed_fields
+            rows.append((f'测试文章 {i}', text, f'摘要 {i}', 1, i % 3 + 1, created_at, created_at, i % 100) + fields)
+        cursor.executemany(ARTICLE_INSERT, rows)
+        conn.commit()
+    return conn
+
+def best_of(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+# 首页查询：全量查询 vs 游标分页
+def cmd_pagination(args):
+    sys.path.insert(0, BASE_DIR)
+    from pagination import PAGE_SIZE
+
+    workdir = tempfile.mkdtemp(prefix='blog-bench-')
+    try:
+        print(f'写入 {args.articles} 篇文章...')
+        conn = seed_articles(os.path.join(workdir, 'blog.db'), args.articles)
+        list_sql = '''
+            SELECT a.id, a.title, a.summary, a.created_at, a.views, u.username, c.name
+            FROM article a JOIN user u ON a.author_id = u.id JOIN category c ON a.category_id = c.id
+        '''
+        middle = conn.execute('SELECT created_at, id FROM article ORDER BY created_at DESC, id DESC LIMIT 1 OFFSET ?',
+                              (args.articles // 2,)).fetchone()
+        cases = [
+            ('全量查询 (旧首页)', lambda: conn.execute(list_sql + ' ORDER BY a.created_at DESC').fetchall()),
+            ('OFFSET 分页 (中间页)', lambda: conn.execute(list_sql + ' ORDER BY a.created_at DESC, a.id DESC LIMIT ? OFFSET ?',
+                                                     (PAGE_SIZE + 1, args.articles // 2)).fetchall()),
+            ('游标分页 (第一页)', lambda: conn.execute(list_sql + ' ORDER BY a.created_at DESC, a.id DESC LIMIT ?',
+                                                  (PAGE_SIZE + 1,)).fetchall()),
+            ('游标分页 (中间页)', lambda: conn.execute(list_sql + ' WHERE (a.created_at, a.id) < (?, ?) ORDER BY a.created_at DESC, a.id DESC LIMIT ?',
+                                                  (middle[0], middle[1], PAGE_SIZE + 1)).fetchall()),
+        ]
+        for name, func in cases:
+            print(f'{name:<20} {best_of(func, args.repeat) * 1000:10.2f} ms')
+        conn.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+# 全文搜索延迟：常见词、罕见组合、短词（常见和不存在的双字词）
+def cmd_search(args):
+    sys.path.insert(0, BASE_DIR)
+    from search import index_pending, search_articles
+
+    workdir = tempfile.mkdtemp(prefix='blog-bench-')
+    try:
+        rng = random.Random(42)
+        print(f'写入 {args.articles} 篇文章并建立全文索引...')
+        start = time.perf_counter()
+        conn = seed_articles(os.path.join(workdir, 'blog.db'), args.articles,
+                             content=lambda i: random_text(rng, args.words))
+        print(f'写入耗时 {time.perf_counter() - start:.1f} s')
+        # 与服务器的后台补建相同，写入的文章在待索引队列中，补进短词索引
+        start = time.perf_counter()
+        while index_pending(conn, 5000):
+            pass
+        conn.commit()
+        print(f'短词索引耗时 {time.perf_counter() - start:.1f} s')
+        queries = [
+            ('常见词', '数据库'),
+            ('两个词', '装饰器 服务器'),
+            ('罕见组合', '协程部署监控'),
+            ('第 5 页', '数据库'),
+            ('常见短词', '笔记'),
+            ('罕见短词', '鲸鱼'),
+            ('短词加长词', '笔记 数据库'),
+            ('LIKE 全表扫描', '%协程部署监控%'),
+            ('LIKE 短词扫描', '%鲸鱼%'),
+        ]
+        for name, q in queries:
+            if q.startswith('%'):
+                func = lambda q=q: conn.execute('SELECT id FROM article WHERE content LIKE ? LIMIT 11', (q,)).fetchall()
+            else:
+                page = 5 if name == '第 5 页' else 1
+                func = lambda q=q, page=page: search_articles(conn, q, page)
+            print(f'{name:<12} {best_of(func, args.repeat) * 1000:10.2f} ms')
+        conn.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+# 压测数据：所有压测用户使用同一个密码，password_hash 由调用方按服务器的哈希方式生成
+BENCH_PASSWORD = 'bench123'
+
+def seed_database(path, users, categories, articles, history, password_hash, rng, words=120, batch=10000):
+    sys.path.insert(0, BASE_DIR)
+    from content import process_content
+    from migrations import migrate, seed_demo
+
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    seed_demo(conn)
+    cursor = conn.cursor()
+    cursor.executemany('INSERT INTO user (username, email, password_hash) VALUES (?, ?, ?)',
+                       [(f'bench{i}', f'bench{i}@example.com', password_hash) for i in range(users)])
+    cursor.executemany('INSERT INTO category (name, description) VALUES (?, ?)',
+                       [(f'压测分类 {i}', f'压测分类 {i}') for i in range(categories)])
+    user_ids = [row[0] for row in cursor.execute('SELECT id FROM user')]
+    category_ids = [row[0] for row in cursor.execute('SELECT id FROM category')]
+    start = datetime.datetime(2020, 1, 1)
+    for offset in range(0, articles, batch):
+        rows = []
+        for i in range(offset, min(offset + batch, articles)):
+            created_at = (start + datetime.timedelta(minutes=i)).strftime('%Y-%m-%d %H:%M:%S')
+            text = random_text(rng, words)
+            rows.append((f'压测文章 {i}', text, f'压测摘要 {i}', rng.choice(user_ids),
+                         rng.choice(category_ids), created_at, created_at, rng.randrange(1000)) + process_content(text))
+        cursor.executemany(ARTICLE_INSERT, rows)
+    conn.commit()
+    # 浏览时间分布在最近 60 天，浏览历史页只显示其中 30 天内的记录
+    article_ids = [row[0] for row in cursor.execute('SELECT id FROM article')]
+    now = datetime.datetime.utcnow()
+    for offset in range(0, history, batch):
+        rows = [(rng.choice(user_ids), rng.choice(article_ids),
+                 (now - datetime.timedelta(seconds=rng.randrange(60 * 86400))).strftime('%Y-%m-%d %H:%M:%S'))
+                for _ in range(offset, min(offset + batch, history))]
+        cursor.executemany('INSERT OR IGNORE INTO article_view_history (user_id, article_id, viewed_at) VALUES (?, ?, ?)', rows)
+    conn.commit()
+    conn.close()
+    return len(article_ids)
+
+# 列表查询：三表连接 vs 读模型单表扫描，以及读模型给浏览量写入带来的额外开销
+def cmd_listing(args):
+    sys.path.insert(0, BASE_DIR)
+    from listing import check_listing, check_query_plans, format_check, list_articles, listing_owner
+    from pagination import PAGE_SIZE
+
+    workdir = tempfile.mkdtemp(prefix='blog-bench-')
+    try:
+        rng = random.Random(args.seed)
+        print(f'写入 {args.articles} 篇文章、{args.history} 条浏览历史...')
+        path = os.path.join(workdir, 'blog.db')
+        start = time.perf_counter()
+        seed_database(path, args.users, args.categories, args.articles, args.history, 'x', rng, words=30)
+        print(f'写入耗时 {time.perf_counter() - start:.1f} s')
+        conn = sqlite3.connect(path)
+        join_sql = '''
+            SELECT a.id, a.title, a.summary, a.created_at, a.views, u.username, c.name
+            FROM article a JOIN user u ON a.author_id = u.id JOIN category c ON a.category_id = c.id
+        '''
+        listing_sql = '''
+            SELECT id, title, summary, created_at, views, author_name, category_name FROM article_listing
+        '''
+        middle = conn.execute('SELECT created_at, id FROM article ORDER BY created_at DESC, id DESC LIMIT 1 OFFSET ?',
+                              (args.articles // 2,)).fetchone()
+        # 浏览记录最多的用户
+        user_id = conn.execute('''SELECT user_id FROM article_view_history GROUP BY user_id
+                                  ORDER BY COUNT(*) DESC LIMIT 1''').fetchone()[0]
+        history_join = '''
+            SELECT a.title, c.name, h.viewed_at, a.id FROM article_view_history h
+            JOIN article a ON h.article_id = a.id JOIN category c ON a.category_id = c.id
+            WHERE h.user_id = ? AND h.viewed_at >= datetime('now', '-30 days') ORDER BY h.viewed_at DESC
+        '''
+        history_listing = '''
+            SELECT l.title, l.category_name, h.viewed_at, l.id FROM article_view_history h
+            JOIN article_listing l ON h.article_id = l.id
+            WHERE h.user_id = ? AND h.viewed_at >= datetime('now', '-30 days') ORDER BY h.viewed_at DESC
+        '''
+        cases = [
+            ('首页第一页', join_sql + ' ORDER BY a.created_at DESC, a.id DESC LIMIT ?',
+             listing_sql + ' ORDER BY created_at DESC, id DESC LIMIT ?', (PAGE_SIZE + 1,)),
+            ('首页中间页', join_sql + ' WHERE (a.created_at, a.id) < (?, ?) ORDER BY a.created_at DESC, a.id DESC LIMIT ?',
+             listing_sql + ' WHERE (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT ?',
+             (middle[0], middle[1], PAGE_SIZE + 1)),
+            ('浏览历史', history_join, history_listing, (user_id,)),
+        ]
+        print(f"{'查询':<12} {'连接 (ms)':>10} {'读模型 (ms)':>12} {'倍数':>8}")
+        for name, join_query, listing_query, params in cases:
+            assert sorted(conn.execute(join_query, params).fetchall()) == \
+                sorted(conn.execute(listing_query, params).fetchall()), f'{name}: 两种查询结果不一致'
+            join_ms = best_of(lambda: conn.execute(join_query, params).fetchall(), args.repeat) * 1000
+            listing_ms = best_of(lambda: conn.execute(listing_query, params).fetchall(), args.repeat) * 1000
+            print(f'{name:<12} {join_ms:10.3f} {listing_ms:12.3f} {join_ms / listing_ms:7.1f}x')
+
+        # 分类页：读模型上的 (category_id, created_at, id) 索引；文章数取计数表而不是 COUNT(*)
+        for name, ok, plan in check_query_plans(conn):
+            assert ok, f'{name} 未使用预期索引: {plan}'
+        category_id = conn.execute('SELECT id FROM category LIMIT 1').fetchone()[0]
+        category_join = join_sql + ' WHERE a.category_id = ? ORDER BY a.created_at DESC, a.id DESC LIMIT ?'
+        join_ms = best_of(lambda: conn.execute(category_join, (category_id, PAGE_SIZE + 1)).fetchall(), args.repeat) * 1000
+        listing_ms = best_of(lambda: list_articles(conn, None, 'category', category_id), args.repeat) * 1000
+        print(f"{'分类页':<12} {join_ms:10.3f} {listing_ms:12.3f} {join_ms / listing_ms:7.1f}x")
+        count_sql = 'SELECT COUNT(*) FROM article WHERE category_id = ?'
+        count_ms = best_of(lambda: conn.execute(count_sql, (category_id,)).fetchone(), args.repeat) * 1000
+        stats_ms = best_of(lambda: listing_owner(conn, 'category', category_id), args.repeat) * 1000
+        print(f"{'分类文章数':<12} {count_ms:10.3f} {stats_ms:12.3f} {count_ms / stats_ms:7.1f}x  (COUNT(*) vs 计数表)")
+
+        # 浏览量落库的写放大：同一批更新在删除触发器前后各执行一次，事务回滚不留痕迹
+        ids = [(rng.randrange(1, args.articles + 1),) for _ in range(args.updates)]
+        def flush(drop_trigger):
+            conn.execute('BEGIN')
+            if drop_trigger:
+                conn.execute('DROP TRIGGER article_listing_views')
+            start = time.perf_counter()
+            conn.executemany('UPDATE article SET views = views + 1 WHERE id = ?', ids)
+            elapsed = time.perf_counter() - start
+            conn.rollback()
+            return elapsed
+        plain = min(flush(True) for _ in range(args.repeat))
+        maintained = min(flush(False) for _ in range(args.repeat))
+        print(f'{args.updates} 次浏览量更新: 无读模型 {plain * 1000:.1f} ms, '
+              f'维护读模型 {maintained * 1000:.1f} ms (+{(maintained / plain - 1) * 100:.0f}%)')
+
+        start = time.perf_counter()
+        print(format_check(check_listing(conn)), f'({time.perf_counter() - start:.2f} s)')
+        conn.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+# 两个服务器使用同一种哈希格式，所有压测用户共用一个哈希，只需计算一次
+def bench_password_hash():
+    sys.path.insert(0, BASE_DIR)
+    from passwords import hash_password
+    return hash_password(BENCH_PASSWORD)
+
+# 混合负载中各路由的权重
+WORKLOAD = (
+    ('/', 40),
+    ('/article/<id>', 35),
+    ('/browsing-history', 15),
+    ('/login', 5),
+    ('/register', 5),
+)
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(p / 100 * len(sorted_values)) - 1))]
+
+# 模拟一个用户：保持长连接和 cookie，按权重随机访问各路由。
+# 奇数编号的客户端先登录，偶数编号的保持匿名（登录请求的 cookie 不保留）
+class WorkloadClient:
+    def __init__(self, port, index, users, articles, rng):
+        self.port = port
+        self.index = index
+        self.users = users
+        self.articles = articles
+        self.rng = rng
+        self.cookies = {}
+        self.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        self.registered = 0
+
+    def request(self, method, path, form=None):
+        headers = {}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{k}={v}' for k, v in self.cookies.items())
+        body = None
+        if form is not None:
+            body = urllib.parse.urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            resp = self.conn.getresponse()
+        except (http.client.HTTPException, OSError):
+            # 服务器关闭了长连接，重连后重试一次
+            self.conn.close()
+            self.conn.request(method, path, body=body, headers=headers)
+            resp = self.conn.getresponse()
+        resp.read()
+        return resp
+
+    def login(self, keep_cookie):
+        user = self.rng.randrange(self.users)
+        resp = self.request('POST', '/login', {'username': f'bench{user}', 'password': BENCH_PASSWORD})
+        if keep_cookie:
+            for header in resp.headers.get_all('Set-Cookie') or ():
+                name, _, value = header.split(';', 1)[0].partition('=')
+                self.cookies[name.strip()] = value.strip()
+        return resp
+
+    def run_one(self, route):
+        if route == '/':
+            return self.request('GET', '/')
+        if route == '/article/<id>':
+            return self.request('GET', f'/article/{self.rng.randint(1, self.articles)}')
+        if route == '/browsing-history':
+            return self.request('GET', '/browsing-history')
+        if route == '/login':
+            return self.login(keep_cookie=self.index % 2 == 1)
+        self.registered += 1
+        name = f'new{self.index}_{self.registered}_{self.rng.randrange(10 ** 9)}'
+        return self.request('POST', '/register', {'username': name, 'email': f'{name}@example.com', 'password': BENCH_PASSWORD})
+
+def run_workload(port, clients, duration, warmup, users, articles, seed):
+    routes = [route for route, _ in WORKLOAD]
+    weights = [weight for _, weight in WORKLOAD]
+    samples = {route: [] for route in routes}
+    errors = {route: 0 for route in routes}
+    lock = threading.Lock()
+    start = time.perf_counter()
+    measure_from = start + warmup
+    stop_at = measure_from + duration
+
+    def client(index):
+        rng = random.Random(seed * 1000 + index)
+        worker = WorkloadClient(port, index, users, articles, rng)
+        if index % 2 == 1:
+            worker.login(keep_cookie=True)
+        local = {route: [] for route in routes}
+        local_errors = {route: 0 for route in routes}
+        while True:
+            now = time.perf_counter()
+            if now >= stop_at:
+                break
+            route = rng.choices(routes, weights)[0]
+            began = time.perf_counter()
+            try:
+                status = worker.run_one(route).status
+                failed = status >= 500
+            except Exception:
+                failed = True
+            ended = time.perf_counter()
+            if began >= measure_from:
+                local[route].append((ended - began) * 1000)
+                if failed:
+                    local_errors[route] += 1
+        worker.conn.close()
+        with lock:
+            for route in routes:
+                samples[route].extend(local[route])
+                errors[route] += local_errors[route]
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    result = {'routes': {}}
+    total = 0
+    for route in routes:
+        values = sorted(samples[route])
+        total += len(values)
+        result['routes'][route] = {
+            'requests': len(values),
+            'errors': errors[route],
+            'throughput': round(len(values) / duration, 2),
+            'mean_ms': round(sum(values) / len(values), 3) if values else 0.0,
+            'p50_ms': round(percentile(values, 50), 3),
+            'p95_ms': round(percentile(values, 95), 3),
+            'p99_ms': round(percentile(values, 99), 3),
+            'max_ms': round(values[-1], 3) if values else 0.0,
+        }
+    result['requests'] = total
+    result['errors'] = sum(errors.values())
+    result['throughput'] = round(total / duration, 2)
+    return result
+
+# 与基线比较：吞吐下降或 p95 上升超过阈值视为退化
+def compare_with_baseline(results, baseline, threshold):
+    regressions = []
+    print(f'\n与基线比较 (阈值 {threshold:.0%}):')
+    print(f'{"server":<8} {"route":<20} {"req/s":>18} {"p95 ms":>22}')
+    for server, current in results['servers'].items():
+        base = baseline.get('servers', {}).get(server)
+        if not base:
+            continue
+        for route, stats in current['routes'].items():
+            old = base['routes'].get(route)
+            if not old or not old['requests'] or not stats['requests']:
+                continue
+            throughput_change = stats['throughput'] / old['throughput'] - 1 if old['throughput'] else 0.0
+            p95_change = stats['p95_ms'] / old['p95_ms'] - 1 if old['p95_ms'] else 0.0
+            flag = ''
+            if throughput_change < -threshold or p95_change > threshold:
+                flag = '  <-- 退化'
+                regressions.append((server, route))
+            print(f'{server:<8} {route:<20} {old["throughput"]:>8.1f} -> {stats["throughput"]:<8.1f}'
+                  f' {old["p95_ms"]:>9.2f} -> {stats["p95_ms"]:<9.2f} ({p95_change:+.0%}){flag}')
+    return regressions
+
+# 混合负载压测：为每个服务器准备一份同样规模的数据，统计各路由的吞吐和延迟分位数
+def cmd_workload(args):
+    servers = ['simple', 'flask'] if args.server == 'both' else [args.server]
+    results = {
+        'meta': {
+            'timestamp': datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'clients': args.clients,
+            'duration': args.duration,
+            'warmup': args.warmup,
+            'workers': args.workers,
+            'seed': args.seed,
+            'data': {'users': args.users, 'categories': args.categories,
+                     'articles': args.articles, 'history': args.history},
+        },
+        'servers': {},
+    }
+    for server in servers:
+        workdir = tempfile.mkdtemp(prefix='blog-bench-')
+        proc = None
+        try:
+            password_hash = bench_password_hash()
+            print(f'[{server}] 写入数据: {args.users} 用户, {args.categories} 分类, '
+                  f'{args.articles} 文章, {args.history} 浏览记录...')
+            articles = seed_database(os.path.join(workdir, 'blog.db'), args.users, args.categories, args.articles,
+                                     args.history, password_hash, random.Random(args.seed))
+            port = free_port()
+            if server == 'simple':
+                proc = start_simple_blog(port, args.workers, workdir)
+            else:
+                proc = start_flask_app(port, workdir)
+            print(f'[{server}] {args.clients} 个客户端, 预热 {args.warmup}s, 压测 {args.duration}s')
+            result = run_workload(port, args.clients, args.duration, args.warmup, args.users, articles, args.seed)
+        except RuntimeError as e:
+            print(f'[{server}] {e}')
+            continue
+        finally:
+            if proc is not None:
+                proc.terminate()
+                proc.wait()
+            shutil.rmtree(workdir, ignore_errors=True)
+        results['servers'][server] = result
+        print(f'{"route":<20} {"requests":>9} {"errors":>7} {"req/s":>9} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9}')
+        for route, stats in result['routes'].items():
+            print(f'{route:<20} {stats["requests"]:>9} {stats["errors"]:>7} {stats["throughput"]:>9.1f} '
+                  f'{stats["p50_ms"]:>9.2f} {stats["p95_ms"]:>9.2f} {stats["p99_ms"]:>9.2f}')
+        print(f'{"total":<20} {result["requests"]:>9} {result["errors"]:>7} {result["throughput"]:>9.1f}')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f'\n结果已保存到 {args.output}')
+    regressions = []
+    if args.baseline and os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline) as f:
+            regressions = compare_with_baseline(results, json.load(f), args.threshold)
+    if args.baseline and (args.update_baseline or not os.path.exists(args.baseline)):
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f'基线已写入 {args.baseline}')
+    if regressions:
+        sys.exit(1)
+
+# 多进程扩展性：匿名访问文章页、首页和热门榜（热门榜不缓存，每次都渲染）
+PREFORK_ROUTES = (('/article/<id>', 70), ('/', 20), ('/trending', 10))
+
+# 在单独的进程中运行一个压测客户端，避免客户端自己受 GIL 限制。返回请求延迟列表（毫秒）和错误数
+def prefork_client(port, articles, duration, seed):
+    rng = random.Random(seed)
+    routes = [route for route, _ in PREFORK_ROUTES]
+    weights = [weight for _, weight in PREFORK_ROUTES]
+    client = WorkloadClient(port, seed, 0, articles, rng)
+    latencies = []
+    errors = 0
+    stop_at = time.perf_counter() + duration
+    while time.perf_counter() < stop_at:
+        route = rng.choices(routes, weights)[0]
+        if route == '/article/<id>':
+            route = f'/article/{rng.randint(1, articles)}'
+        began = time.perf_counter()
+        try:
+            failed = client.request('GET', route).status >= 500
+        except Exception:
+            failed = True
+        latencies.append((time.perf_counter() - began) * 1000)
+        errors += failed
+    client.conn.close()
+    return latencies, errors
+
+def cmd_prefork(args):
+    workdir = tempfile.mkdtemp(prefix='blog-bench-')
+    try:
+        path = os.path.join(workdir, 'blog.db')
+        print(f'写入 {args.articles} 篇文章...')
+        seed_articles(path, args.articles).close()
+        print(f'CPU 核数 {os.cpu_count()}, 每个进程 {args.workers} 个线程, {args.clients} 个客户端进程, '
+              f'预热 {args.warmup}s, 压测 {args.duration}s')
+        print(f"{'进程数':>6} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'错误':>6} {'加速比':>8} {'效率':>7}")
+        context = multiprocessing.get_context('fork')
+        base = None
+        for processes in [int(value) for value in args.processes.split(',')]:
+            port = free_port()
+            proc = start_simple_blog(port, args.workers, workdir,
+                                     ('--processes', str(processes), '--hash-workers', '0'))
+            try:
+                # 等所有工作进程就绪：连续请求直到见过 processes 个不同的 pid
+                deadline = time.monotonic() + 30
+                pids = set()
+                while len(pids) < processes and time.monotonic() < deadline:
+                    with urllib.request.urlopen(f'http://127.0.0.1:{port}/_stats') as resp:
+                        pids.add(json.loads(resp.read())['process']['pid'])
+                with concurrent.futures.ProcessPoolExecutor(args.clients, mp_context=context) as pool:
+                    list(pool.map(prefork_client, [port] * args.clients, [args.articles] * args.clients,
+                                  [args.warmup] * args.clients, range(args.clients)))
+                    results = list(pool.map(prefork_client, [port] * args.clients, [args.articles] * args.clients,
+                                            [args.duration] * args.clients, range(args.clients)))
+            finally:
+                proc.terminate()
+                proc.wait()
+            latencies = sorted(value for values, _ in results for value in values)
+            errors = sum(count for _, count in results)
+            throughput = len(latencies) / args.duration
+            base = base or throughput / processes
+            speedup = throughput / base
+            print(f'{processes:>6} {throughput:>10.1f} {percentile(latencies, 50):>9.2f} '
+                  f'{percentile(latencies, 99):>9.2f} {errors:>6} {speedup:>8.2f} {speedup / processes:>7.0%}')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+# 登录风暴：页面客户端持续访问首页和文章页，先单独压测一段时间作为对照，
+# 再加入大量不断登录的客户端，比较两个阶段页面请求的延迟
+def run_login_storm(port, page_clients, login_clients, duration, users, articles, seed):
+    phases = {}
+    for name, storm in (('baseline', False), ('storm', True)):
+        pages = []
+        logins = {'ok': 0, 'busy': 0, 'errors': 0, 'latencies': []}
+        lock = threading.Lock()
+        stop_at = time.perf_counter() + duration
+
+        def page_client(index):
+            rng = random.Random(seed * 1000 + index)
+            worker = WorkloadClient(port, index, users, articles, rng)
+            local = []
+            while time.perf_counter() < stop_at:
+                route = '/' if rng.random() < 0.5 else '/article/<id>'
+                began = time.perf_counter()
+                worker.run_one(route)
+                local.append((time.perf_counter() - began) * 1000)
+            worker.conn.close()
+            with lock:
+                pages.extend(local)
+
+        def login_client(index):
+            rng = random.Random(seed * 1000 + 500 + index)
+            worker = WorkloadClient(port, index, users, articles, rng)
+            while time.perf_counter() < stop_at:
+                began = time.perf_counter()
+                try:
+                    status = worker.login(keep_cookie=False).status
+                except Exception:
+                    status = None
+                elapsed = (time.perf_counter() - began) * 1000
+                with lock:
+                    if status == 503:
+                        logins['busy'] += 1
+                    elif status is None or status >= 500:
+                        logins['errors'] += 1
+                    else:
+                        logins['ok'] += 1
+                        logins['latencies'].append(elapsed)
+                if status == 503:
+                    # 按 Retry-After 的意思稍等再试，而不是立即重试
+                    time.sleep(0.1)
+            worker.conn.close()
+
+        threads = [threading.Thread(target=page_client, args=(i,)) for i in range(page_clients)]
+        if storm:
+            threads += [threading.Thread(target=login_client, args=(i,)) for i in range(login_clients)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        pages.sort()
+        latencies = sorted(logins.pop('latencies'))
+        phases[name] = {
+            'page_requests': len(pages),
+            'page_throughput': round(len(pages) / duration, 2),
+            'page_p50_ms': round(percentile(pages, 50), 3),
+            'page_p95_ms': round(percentile(pages, 95), 3),
+            'page_p99_ms': round(percentile(pages, 99), 3),
+            'logins': logins,
+            'login_p50_ms': round(percentile(latencies, 50), 3),
+        }
+    return phases
+
+def cmd_login_storm(args):
+    workdir = tempfile.mkdtemp(prefix='blog-bench-')
+    proc = None
+    try:
+        print(f'[{args.server}] 写入数据: {args.users} 用户, {args.articles} 文章...')
+        articles = seed_database(os.path.join(workdir, 'blog.db'), args.users, 5, args.articles, 0,
+                                 bench_password_hash(), random.Random(args.seed))
+        port = free_port()
+        if args.server == 'simple':
+            extra = []
+            if args.hash_workers is not None:
+                extra += ['--hash-workers', str(args.hash_workers)]
+            if args.hash_queue is not None:
+                extra += ['--hash-queue', str(args.hash_queue)]
+            proc = start_simple_blog(port, args.workers, workdir, extra)
+        else:
+            env = {}
+            if args.hash_workers is not None:
+                env['BLOG_HASH_WORKERS'] = str(args.hash_workers)
+            if args.hash_queue is not None:
+                env['BLOG_HASH_QUEUE'] = str(args.hash_queue)
+            proc = start_flask_app(port, workdir, env)
+        print(f'[{args.server}] {args.page_clients} 个页面客户端, 登录风暴 {args.login_clients} 个客户端, 每阶段 {args.duration}s')
+        phases = run_login_storm(port, args.page_clients, args.login_clients, args.duration,
+                                 args.users, articles, args.seed)
+    except RuntimeError as e:
+        print(f'[{args.server}] {e}')
+        sys.exit(1)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(f'{"phase":<10} {"pages/s":>9} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"login ok":>9} {"503":>6} {"login p50":>10}')
+    for name, stats in phases.items():
+        logins = stats['logins']
+        print(f'{name:<10} {stats["page_throughput"]:>9.1f} {stats["page_p50_ms"]:>9.2f} {stats["page_p95_ms"]:>9.2f} '
+              f'{stats["page_p99_ms"]:>9.2f} {logins["ok"]:>9} {logins["busy"]:>6} {stats["login_p50_ms"]:>10.1f}')
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(phases, f, ensure_ascii=False, indent=2)
+        print(f'\n结果已保存到 {args.output}')
+
+# 模板渲染微基准：对比逐次 str.format 与预编译模板
+# 冷启动：从启动进程到第一个成功响应的时间，以及第一、第二个请求各自的延迟
+def measure_startup(spawn, port, path='/', timeout=30.0):
+    start = time.perf_counter()
+    proc = spawn()
+    try:
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError(f'服务器启动失败，退出码 {proc.returncode}')
+            if time.perf_counter() - start > timeout:
+                raise RuntimeError(f'服务器未在 {timeout} 秒内响应')
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+            try:
+                sent = time.perf_counter()
+                conn.request('GET', path)
+                response = conn.getresponse()
+                response.read()
+            except OSError:
+                time.sleep(0.005)
+                continue
+            finally:
+                conn.close()
+            if response.status == 200:
+                first = time.perf_counter() - sent
+                ready = time.perf_counter() - start
+                break
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+        try:
+            sent = time.perf_counter()
+            conn.request('GET', path)
+            conn.getresponse().read()
+            second = time.perf_counter() - sent
+        finally:
+            conn.close()
+        return ready, first, second
+    finally:
+        proc.terminate()
+        proc.wait()
+
+def cmd_startup(args):
+    workdir = tempfile.mkdtemp(prefix='blog-bench-')
+    try:
+        path = os.path.join(workdir, 'blog.db')
+        print(f'写入 {args.articles} 篇文章...')
+        seed_articles(path, args.articles).close()
+        servers = ['simple', 'flask'] if args.server == 'both' else [args.server]
+        print(f"{'服务器':<8} {'数据库':<14} {'就绪 (ms)':>10} {'首个请求 (ms)':>14} {'第二个请求 (ms)':>16}")
+        for server in servers:
+            for label, reset in (('结构已是最新', False), ('user_version=0', True)):
+                results = []
+                for _ in range(args.repeat):
+                    if reset:
+                        # 模拟旧库首次升级：所有迁移重新执行一遍（均为幂等 DDL）
+                        conn = sqlite3.connect(path)
+                        conn.execute('PRAGMA user_version = 0')
+                        conn.close()
+                    port = free_port()
+                    if server == 'simple':
+                        spawn = lambda: spawn_simple_blog(port, args.workers, workdir, ('--hash-workers', '0'))
+                    else:
+                        spawn = lambda: spawn_flask_app(port, workdir, {'BLOG_HASH_WORKERS': '0'})
+                    results.append(measure_startup(spawn, port))
+                ready, first, second = (percentile(sorted(r[i] for r in results), 50) * 1000 for i in range(3))
+                print(f'{server:<8} {label:<14} {ready:10.1f} {first:14.2f} {second:16.2f}')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+# 文章页：查看时渲染正文 vs 读取写入时生成的预计算列，以及 backfill 补齐旧文章的吞吐
+def cmd_content(args):
+    sys.path.insert(0, BASE_DIR)
+    from build_static import SimpleRenderer
+    from content import CONTENT_COLUMNS, backfill
+
+    workdir = tempfile.mkdtemp(prefix='blog-bench-')
+    try:
+        rng = random.Random(42)
+        path = os.path.join(workdir, 'blog.db')
+        print(f'写入 {args.articles} 篇文章（每篇 {args.paragraphs} 段）...')
+        seed_articles(path, args.articles,
+                      content=lambda i: '\n\n'.join(random_text(rng, args.words) for _ in range(args.paragraphs))).close()
+        conn = sqlite3.connect(path)
+        article_ids = [row[0] for row in conn.execute('SELECT id FROM article')]
+        lookups = [rng.choice(article_ids) for _ in range(args.lookups)]
+        renderer = SimpleRenderer(path)
+
+        def clear():
+            conn.execute('UPDATE article SET ' + ', '.join(f'{name} = NULL' for name, _ in CONTENT_COLUMNS))
+            conn.commit()
+
+        def render_pages():
+            for article_id in lookups:
+                renderer.article(article_id)
+
+        clear()
+        before = best_of(render_pages, args.repeat) / len(lookups)
+        for workers in (0, args.workers):
+            clear()
+            report = backfill(path, workers, args.batch)
+            label = f'{workers} 个进程' if workers else '当前进程'
+            print(f"backfill（{label}）: {report['updated']} 篇, {report['seconds']:.2f} s"
+                  f"（{report['updated'] / report['seconds']:.0f} 篇/秒）")
+        after = best_of(render_pages, args.repeat) / len(lookups)
+        print(f'{"文章页（查看时渲染正文）":<20} {before * 1e6:10.1f} us/页')
+        print(f'{"文章页（预计算列）":<20} {after * 1e6:10.1f} us/页')
+        conn.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+# 热门榜：ORDER BY views 全表排序 vs 内存中的前 K 名 + 按主键取卡片，以及记录一次浏览的开销
+def cmd_trending(args):
+    sys.path.insert(0, BASE_DIR)
+    from listing import CARD_COLUMNS, articles_by_id
+    from trending import Trending
+
+    print(f"{'文章数':>8} {'ORDER BY views (ms)':>20} {'前 K 名 (ms)':>14} {'记录浏览 (us)':>14}")
+    for count in [int(value) for value in args.articles.split(',')]:
+        workdir = tempfile.mkdtemp(prefix='blog-bench-')
+        try:
+            conn = seed_articles(os.path.join(workdir, 'blog.db'), count)
+            rng = random.Random(42)
+            conn.executemany('UPDATE article SET views = ? WHERE id = ?',
+                             [(rng.randrange(100000), article_id) for article_id in range(1, count + 1)])
+            conn.commit()
+
+            @contextlib.contextmanager
+            def connection():
+                yield conn
+
+            trending = Trending(connection, k=args.k)
+            trending.load()
+            # 浏览按 Zipf 分布落在各篇文章上
+            views = [min(count, int(rng.paretovariate(1.1))) for _ in range(args.views)]
+            start = time.perf_counter()
+            for article_id in views:
+                trending.record(article_id)
+            record_us = (time.perf_counter() - start) / len(views) * 1e6
+
+            scan = lambda: conn.execute(f'SELECT {CARD_COLUMNS} FROM article_listing ORDER BY views DESC LIMIT ?',
+                                        (args.k,)).fetchall()
+            top = lambda: articles_by_id(conn, [article_id for article_id, _ in trending.top('trending')])
+            print(f'{count:>8} {best_of(scan, args.repeat) * 1000:20.2f} {best_of(top, args.repeat) * 1000:14.3f} '
+                  f'{record_us:14.2f}')
+            conn.close()
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+# 并发写入：每个线程反复执行一次小写入（写入一条会话并给一篇文章加浏览量），
+# 对比各线程用自己的连接直接提交与交给单写线程组提交的吞吐、锁超时错误和延迟
+def cmd_writer(args):
+    sys.path.insert(0, BASE_DIR)
+    from db_pool import apply_pragmas
+    from db_writer import DatabaseWriter
+    from session_store import insert_session
+    from view_buffer import UPDATE_VIEWS_SQL
+
+    def write(conn, key, article_id):
+        insert_session(conn, key, {'id': 1, 'username': 'demo', 'email': ''},
+                       time.time() + 3600)
+        conn.execute(UPDATE_VIEWS_SQL, (1, article_id))
+
+    def connect(path):
+        conn = sqlite3.connect(path, timeout=args.busy_timeout, check_same_thread=False)
+        apply_pragmas(conn)
+        return conn
+
+    def run(path, threads, submit):
+        latencies, errors = [], []
+        deadline = time.perf_counter() + args.duration
+
+        def worker(seed):
+            rng = random.Random(seed)
+            index = 0
+            while time.perf_counter() < deadline:
+                index += 1
+                start = time.perf_counter()
+                try:
+                    submit(write, f'{seed}-{index}', rng.randint(1, args.articles))
+                except sqlite3.OperationalError as e:
+                    errors.append(str(e))
+                    continue
+                latencies.append(time.perf_counter() - start)
+
+        pool = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        latencies.sort()
+        return len(latencies) / args.duration, len(errors), latencies
+
+    print(f"{'线程':>4} {'方式':>8} {'写入/s':>9} {'锁错误':>7} {'p50 (ms)':>9} {'p99 (ms)':>9} "
+          f"{'每批':>7} {'排队 (ms)':>10}")
+    for threads in [int(value) for value in args.threads.split(',')]:
+        for mode in ('direct', 'writer'):
+            workdir = tempfile.mkdtemp(prefix='blog-bench-')
+            try:
+                path = os.path.join(workdir, 'blog.db')
+                seed_articles(path, args.articles).close()
+                batch = wait = '-'
+                if mode == 'direct':
+                    local = threading.local()
+
+                    def submit(fn, *fn_args):
+                        if not hasattr(local, 'conn'):
+                            local.conn = connect(path)
+                        try:
+                            fn(local.conn, *fn_args)
+                            local.conn.commit()
+                        except sqlite3.Error:
+                            local.conn.rollback()
+                            raise
+
+                    rate, errors, latencies = run(path, threads, submit)
+                else:
+                    writer = DatabaseWriter(lambda: connect(path))
+                    writer.start()
+                    try:
+                        rate, errors, latencies = run(path, threads, writer.run)
+                    finally:
+                        writer.stop()
+                    metrics = writer.metrics()
+                    batch = f"{metrics['batch_avg']:.1f}"
+                    wait = f"{metrics['queue_wait_avg_ms']:.2f}"
+                print(f'{threads:>4} {mode:>8} {rate:9.0f} {errors:7} {percentile(latencies, 50) * 1000:9.2f} '
+                      f'{percentile(latencies, 99) * 1000:9.2f} {batch:>7} {wait:>10}')
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+# 相关文章：1M 行浏览历史上的全量构建、增量构建耗时，文章页读取预计算结果与现场自连接统计的对比。
+# 每个用户有一个偏好主题，80% 的浏览落在该主题的文章上
+def cmd_recommendations(args):
+    sys.path.insert(0, BASE_DIR)
+    import numpy
+    from recommendations import build, related_articles
+
+    workdir = tempfile.mkdtemp(prefix='blog-bench-')
+    try:
+        path = os.path.join(workdir, 'blog.db')
+        conn = seed_articles(path, args.articles)
+        conn.executemany('INSERT INTO user (username, email, password_hash) VALUES (?, ?, ?)',
+                         [(f'bench{i}', f'bench{i}@example.com', '') for i in range(args.users)])
+        user_ids = numpy.array([row[0] for row in conn.execute('SELECT id FROM user')])
+        article_ids = numpy.array([row[0] for row in conn.execute('SELECT id FROM article ORDER BY id')])
+        rng = numpy.random.default_rng(42)
+        now = datetime.datetime.utcnow()
+        timestamps = [(now - datetime.timedelta(seconds=int(offset))).strftime('%Y-%m-%d %H:%M:%S')
+                      for offset in rng.integers(0, 30 * 86400, 10000)]
+        per_topic = len(article_ids) // args.topics
+
+        def history_rows(count):
+            users = rng.choice(user_ids, count)
+            topic = users % args.topics
+            in_topic = article_ids[topic * per_topic + rng.integers(0, per_topic, count)]
+            articles = numpy.where(rng.random(count) < 0.8, in_topic, rng.choice(article_ids, count))
+            stamps = rng.integers(0, len(timestamps), count)
+            return [(user, article, timestamps[stamp]) for user, article, stamp
+                    in zip(users.tolist(), articles.tolist(), stamps.tolist())]
+
+        def add_history(count):
+            conn.executemany('''INSERT INTO article_view_history (user_id, article_id, viewed_at) VALUES (?, ?, ?)
+                                ON CONFLICT (user_id, article_id) DO UPDATE SET viewed_at = excluded.viewed_at''',
+                             history_rows(count))
+            conn.commit()
+
+        add_history(args.history)
+        rows = conn.execute('SELECT COUNT(*) FROM article_view_history').fetchone()[0]
+        print(f'浏览历史 {rows} 行, {args.users} 个用户, {args.articles} 篇文章')
+
+        report = build(path, verbose=args.verbose)
+        print(f"全量构建: {report['seconds']:.2f} s, 共现计数 {report['pairs']} 行, "
+              f"相关文章 {report['related_rows']} 行")
+        for _ in range(args.repeat):
+            add_history(args.increment)
+            report = build(path, verbose=args.verbose)
+            print(f"增量构建 {report['new_rows']} 行新记录: {report['seconds']:.2f} s, "
+                  f"重新排名 {report['articles']} 篇文章")
+        related = lambda: set(conn.execute('SELECT article_id, related_id FROM article_related'))
+        incremental = related()
+        report = build(path, full=True, verbose=args.verbose)
+        rebuilt = related()
+        print(f"对照: 同样的数据全量重建 {report['seconds']:.2f} s, "
+              f"增量结果与全量结果重合 {len(incremental & rebuilt) / max(len(rebuilt), 1):.1%}")
+
+        sample = rng.choice(article_ids, 200).tolist()
+        precomputed = lambda: [related_articles(conn, article_id) for article_id in sample]
+        adhoc = lambda: [conn.execute('''
+            SELECT h2.article_id, COUNT(*) AS together FROM article_view_history h1
+            JOIN article_view_history h2 ON h2.user_id = h1.user_id AND h2.article_id != h1.article_id
+            WHERE h1.article_id = ? GROUP BY h2.article_id ORDER BY together DESC LIMIT 5''',
+                                         (article_id,)).fetchall() for article_id in sample[:5]]
+        print(f'文章页读取相关文章: 预计算 {best_of(precomputed, args.repeat) / len(sample) * 1000:.3f} ms, '
+              f'现场统计 {best_of(adhoc, 1) / 5 * 1000:.1f} ms')
+        conn.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def cmd_templates(args):
+    sys.path.insert(0, BASE_DIR)
+    import simple_blog
+
+    card = '''
+            <div class="card"><h3><a href="/article/1">标题</a></h3><p>摘要</p></div>'''
+    articles = card * args.cards
+    user = {'id': 1, 'username': 'demo', 'email': 'demo@example.com'}
+
+    def legacy():
+        templates = dict(simple_blog.TEMPLATES)
+        content = templates['index'].format(articles=articles, pagination='')
+        html = templates['base'].format(title='首页 - Flask博客', content=content,
+                                        user_menu=simple_blog.get_user_menu(user),
+                                        stylesheet=simple_blog.static_url('simple_blog.css'))
+        return html.encode()
+
+    def compiled():
+        content = simple_blog.render_template('index', articles=articles, pagination='')
+        return simple_blog.render_page('首页 - Flask博客', content, user)
+
+    assert legacy() == compiled(), '两种渲染结果不一致'
+    print(f'index 页面, {args.cards} 张卡片, {len(compiled())} 字节')
+    for name, func in (('str.format', legacy), ('compiled', compiled)):
+        best = min(timeit.repeat(func, number=args.number, repeat=5))
+        print(f'{name:>12}: {best / args.number * 1e6:8.2f} us/page')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='博客性能测试工具')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    load = sub.add_parser('load', help='并发压测 simple_blog，观察吞吐随客户端数的变化')
+    load.add_argument('--workers', type=int, default=8)
+    load.add_argument('--concurrency', default='1,2,4,8,16')
+    load.add_argument('--requests', type=int, default=200, help='每个客户端的请求数')
+    load.add_argument('--path', default='/')
+    load.add_argument('--slow-clients', type=int, default=0, help='占住连接不发完请求的慢客户端数')
+    load.add_argument('--timeout', type=float, default=30.0)
+    load.set_defaults(func=cmd_load)
+
+    templates = sub.add_parser('templates', help='模板渲染微基准')
+    templates.add_argument('--cards', type=int, default=20)
+    templates.add_argument('--number', type=int, default=2000)
+    templates.set_defaults(func=cmd_templates)
+
+    content = sub.add_parser('content', help='文章页正文：查看时渲染与写入时预计算对比，backfill 吞吐')
+    content.add_argument('--articles', type=int, default=20000)
+    content.add_argument('--paragraphs', type=int, default=8)
+    content.add_argument('--words', type=int, default=60, help='每段的词数')
+    content.add_argument('--lookups', type=int, default=2000, help='每轮渲染的文章页数')
+    content.add_argument('--repeat', type=int, default=3)
+    content.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='backfill 计算进程数')
+    content.add_argument('--batch', type=int, default=500)
+    content.set_defaults(func=cmd_content)
+
+    recommendations = sub.add_parser('recommendations', help='相关文章推荐的全量、增量构建耗时和读取延迟')
+    recommendations.add_argument('--history', type=int, default=1000000, help='生成的浏览记录数')
+    recommendations.add_argument('--users', type=int, default=20000)
+    recommendations.add_argument('--articles', type=int, default=20000)
+    recommendations.add_argument('--topics', type=int, default=50, help='用户偏好的主题数')
+    recommendations.add_argument('--increment', type=int, default=10000, help='每次增量构建前新增的浏览记录数')
+    recommendations.add_argument('--repeat', type=int, default=3)
+    recommendations.add_argument('--verbose', action='store_true', help='输出构建进度')
+    recommendations.set_defaults(func=cmd_recommendations)
+
+    ranking = sub.add_parser('trending', help='热门榜：按浏览量排序查询与内存前 K 名对比')
+    ranking.add_argument('--articles', default='10000,100000', help='逗号分隔的文章数')
+    ranking.add_argument('--views', type=int, default=200000, help='模拟的浏览次数')
+    ranking.add_argument('--k', type=int, default=20)
+    ranking.add_argument('--repeat', type=int, default=5)
+    ranking.set_defaults(func=cmd_trending)
+
+    writer = sub.add_parser('writer', help='并发写入：各线程直接提交与单写线程组提交对比')
+    writer.add_argument('--threads', default='1,8,32', help='逗号分隔的写入线程数')
+    writer.add_argument('--duration', type=float, default=5.0, help='每种方式的压测秒数')
+    writer.add_argument('--articles', type=int, default=1000)
+    writer.add_argument('--busy-timeout', type=float, default=0.1,
+                        help='直接提交时等待写锁的秒数，超时记为锁错误')
+    writer.set_defaults(func=cmd_writer)
+
+    pagination = sub.add_parser('pagination', help='首页全量查询与游标分页对比')
+    pagination.add_argument('--articles', type=int, default=100000)
+    pagination.add_argument('--repeat', type=int, default=5)
+    pagination.set_defaults(func=cmd_pagination)
+
+    search = sub.add_parser('search', help='全文搜索延迟')
+    search.add_argument('--articles', type=int, default=1000000)
+    search.add_argument('--words', type=int, default=30, help='每篇文章正文的词数')
+    search.add_argument('--repeat', type=int, default=5)
+    search.set_defaults(func=cmd_search)
+
+    listing = sub.add_parser('listing', help='列表查询：三表连接与读模型对比，并检查查询计划')
+    listing.add_argument('--users', type=int, default=1000)
+    listing.add_argument('--categories', type=int, default=20)
+    listing.add_argument('--articles', type=int, default=200000)
+    listing.add_argument('--history', type=int, default=200000, help='浏览历史记录数')
+    listing.add_argument('--updates', type=int, default=5000, help='测量写入开销的浏览量更新次数')
+    listing.add_argument('--repeat', type=int, default=5)
+    listing.add_argument('--seed', type=int, default=42)
+    listing.set_defaults(func=cmd_listing)
+
+    startup = sub.add_parser('startup', help='冷启动到第一个成功响应的时间')
+    startup.add_argument('--server', choices=['simple', 'flask', 'both'], default='both')
+    startup.add_argument('--articles', type=int, default=10000)
+    startup.add_argument('--workers', type=int, default=8, help='simple_blog 工作线程数')
+    startup.add_argument('--repeat', type=int, default=5)
+    startup.set_defaults(func=cmd_startup)
+
+    prefork = sub.add_parser('prefork', help='simple_blog 多进程模式的吞吐随进程数的扩展')
+    prefork.add_argument('--processes', default='1,2,4', help='逗号分隔的工作进程数')
+    prefork.add_argument('--workers', type=int, default=4, help='每个工作进程的线程数')
+    prefork.add_argument('--clients', type=int, default=8, help='压测客户端进程数')
+    prefork.add_argument('--articles', type=int, default=5000)
+    prefork.add_argument('--warmup', type=float, default=2)
+    prefork.add_argument('--duration', type=float, default=10)
+    prefork.set_defaults(func=cmd_prefork)
+
+    workload = sub.add_parser('workload', help='混合负载压测，输出各路由吞吐和 p50/p95/p99 延迟')
+    workload.add_argument('--server', choices=['simple', 'flask', 'both'], default='both')
+    workload.add_argument('--users', type=int, default=1000)
+    workload.add_argument('--categories', type=int, default=20)
+    workload.add_argument('--articles', type=int, default=10000)
+    workload.add_argument('--history', type=int, default=50000, help='浏览历史记录数')
+    workload.add_argument('--clients', type=int, default=8, help='并发客户端数')
+    workload.add_argument('--duration', type=float, default=10.0, help='压测时长（秒）')
+    workload.add_argument('--warmup', type=float, default=2.0, help='预热时长（秒），不计入统计')
+    workload.add_argument('--workers', type=int, default=8, help='simple_blog 工作线程数')
+    workload.add_argument('--seed', type=int, default=42)
+    workload.add_argument('--output', help='结果 JSON 文件')
+    workload.add_argument('--baseline', help='基线 JSON 文件；不存在时用本次结果创建')
+    workload.add_argument('--update-baseline', action='store_true', help='用本次结果覆盖基线')
+    workload.add_argument('--threshold', type=float, default=0.1, help='吞吐下降或 p95 上升超过该比例视为退化')
+    workload.set_defaults(func=cmd_workload)
+
+    storm = sub.add_parser('login-storm', help='登录风暴期间页面请求的延迟')
+    storm.add_argument('--server', choices=['simple', 'flask'], default='simple')
+    storm.add_argument('--users', type=int, default=200)
+    storm.add_argument('--articles', type=int, default=2000)
+    storm.add_argument('--page-clients', type=int, default=4)
+    storm.add_argument('--login-clients', type=int, default=16)
+    storm.add_argument('--duration', type=float, default=10.0, help='每个阶段的时长（秒）')
+    storm.add_argument('--workers', type=int, default=8, help='simple_blog 工作线程数')
+    storm.add_argument('--hash-workers', type=int, help='密码哈希进程数，0 表示在请求线程中计算')
+    storm.add_argument('--hash-queue', type=int, help='排队中的密码哈希任务上限')
+    storm.add_argument('--seed', type=int, default=42)
+    storm.add_argument('--output', help='结果 JSON 文件')
+    storm.set_defaults(func=cmd_login_storm)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,358 @@
+import argparse
+import concurrent.futures
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+
+from db_pool import apply_pragmas
+from http_cache import MIN_COMPRESS_SIZE, CachedPage, compress
+from pagination import PAGE_SIZE, decode_cursor, encode_cursor
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MANIFEST = 'manifest.json'
+
+# 各渲染方式依赖的源文件，内容变化后所有页面重新生成
+RENDERER_SOURCES = {
+    'simple': ('simple_blog.py', 'listing.py', 'content.py', 'recommendations.py', 'template_engine.py',
+               'static/simple_blog.css'),
+    'flask': ('app.py', 'content.py', 'recommendations.py', 'templates/base.html', 'templates/index.html',
+              'templates/article_cards.html', 'templates/article_detail.html', 'static/blog.css'),
+}
+STATIC_ASSETS = {
+    'simple': ('simple_blog.css',),
+    'flask': ('blog.css',),
+}
+
+
+# 文章集合的签名：数量、最大 id、最近修改时间，任何新增、删除或修改都会改变签名
+SIGNATURE_SQL = 'SELECT COUNT(*), MAX(id), MAX(updated_at) FROM article'
+
+def renderer_version(renderer):
+    digest = hashlib.blake2b(renderer.encode(), digest_size=8)
+    for name in RENDERER_SOURCES[renderer]:
+        with open(os.path.join(BASE_DIR, name), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def article_path(article_id):
+    return f'article/{article_id}.html'
+
+def index_path(cursor):
+    return f'index/{cursor}.html' if cursor else 'index.html'
+
+def connect(path):
+    conn = sqlite3.connect(path)
+    apply_pragmas(conn)
+    return conn
+
+# 先写临时文件再改名，服务器不会读到写了一半的页面；较大的页面同时写入 gzip 版本
+def write_page(out_dir, rel, body):
+    path = os.path.join(out_dir, rel)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    compressed = compress(body, 'gzip') if len(body) >= MIN_COMPRESS_SIZE else None
+    if compressed is not None and len(compressed) < len(body):
+        write_file(path + '.gz', compressed)
+    else:
+        remove_page(path + '.gz')
+    write_file(path, body)
+
+def write_file(path, data):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def remove_page(path):
+    for name in (path, path + '.gz'):
+        try:
+            os.remove(name)
+        except FileNotFoundError:
+            pass
+
+# 工作进程中的渲染器，由 init_worker 创建
+_renderer = None
+
+class SimpleRenderer:
+    def __init__(self, db_path):
+        import simple_blog
+        from db_pool import ConnectionPool
+        simple_blog.db_pool = ConnectionPool(db_path, size=1)
+        self.blog = simple_blog
+
+    def article(self, article_id):
+        article = self.blog.load_article(article_id)
+        if article is None:
+            return None
+        return self.blog.article_page(article, article[4], None)
+
+    def index(self, position):
+        return b''.join(self.blog.index_page(position, None))
+
+class FlaskRenderer:
+    def __init__(self, db_path):
+        # 只用 app 渲染页面，不调用 create_app()：不执行迁移，也不启动后台线程
+        os.environ['BLOG_DATABASE_URI'] = 'sqlite:///' + os.path.abspath(db_path)
+        import app
+        self.app = app
+
+    def article(self, article_id):
+        with self.app.app.test_request_context(f'/article/{article_id}'):
+            try:
+                return self.app.render_article(article_id).encode()
+            except Exception as e:
+                # 列出文章之后被删除
+                if getattr(e, 'code', None) == 404:
+                    return None
+                raise
+
+    def index(self, position):
+        with self.app.app.test_request_context('/'):
+            return self.app.render_index(position).encode()
+
+RENDERERS = {'simple': SimpleRenderer, 'flask': FlaskRenderer}
+
+def init_worker(renderer, db_path):
+    global _renderer
+    if BASE_DIR not in sys.path:
+        sys.path.insert(0, BASE_DIR)
+    _renderer = RENDERERS[renderer](db_path)
+
+# 渲染一批文章，返回成功生成的文章 id
+def render_articles(out_dir, article_ids):
+    done = []
+    for article_id in article_ids:
+        body = _renderer.article(article_id)
+        if body is None:
+            continue
+        write_page(out_dir, article_path(article_id), body)
+        done.append(article_id)
+    return done
+
+def render_index_pages(out_dir, cursors):
+    for cursor in cursors:
+        write_page(out_dir, index_path(cursor), _renderer.index(decode_cursor(cursor)))
+    return len(cursors)
+
+# 前 pages 页首页的游标，第一页为空字符串
+def index_cursors(conn, pages):
+    cursors = ['']
+    for page in range(1, pages):
+        row = conn.execute('SELECT created_at, id FROM article ORDER BY created_at DESC, id DESC LIMIT 1 OFFSET ?',
+                           (page * PAGE_SIZE - 1,)).fetchone()
+        if row is None or conn.execute('''SELECT 1 FROM article WHERE (created_at, id) < (?, ?) LIMIT 1''',
+                                       row).fetchone() is None:
+            break
+        # 与渲染出的“下一页”链接一致：两个服务器的游标都直接使用库中的时间字符串
+        cursors.append(encode_cursor(row[0], row[1]))
+    return cursors
+
+def load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def copy_assets(out_dir, renderer):
+    os.makedirs(os.path.join(out_dir, 'static'), exist_ok=True)
+    for name in STATIC_ASSETS[renderer]:
+        source = os.path.join(BASE_DIR, 'static', name)
+        target = os.path.join(out_dir, 'static', name)
+        if not os.path.exists(target) or os.path.getmtime(target) < os.path.getmtime(source):
+            shutil.copy2(source, target)
+
+# 生成静态站点。只重新渲染 updated_at 与清单记录不同的文章；
+# 文章集合有变化时重新生成前 index_pages 页首页。返回统计信息
+def build(db_path, out_dir, renderer='simple', workers=None, index_pages=10, chunk=100, force=False):
+    start = time.perf_counter()
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = load_manifest(out_dir)
+    version = renderer_version(renderer)
+    full = force or manifest.get('renderer') != renderer or manifest.get('version') != version
+    previous = {} if full else manifest.get('articles', {})
+
+    conn = connect(db_path)
+    try:
+        current = {str(article_id): updated_at for article_id, updated_at in conn.execute('SELECT id, updated_at FROM article')}
+        signature = list(conn.execute(SIGNATURE_SQL).fetchone())
+        changed = [int(article_id) for article_id, updated_at in current.items() if previous.get(article_id) != updated_at]
+        removed = [article_id for article_id in previous if article_id not in current]
+        rebuild_index = full or manifest.get('signature') != signature
+        cursors = index_cursors(conn, index_pages) if rebuild_index else []
+    finally:
+        conn.close()
+
+    articles = {article_id: updated_at for article_id, updated_at in previous.items() if article_id in current}
+    batches = [changed[i:i + chunk] for i in range(0, len(changed), chunk)]
+    if workers == 0:
+        init_worker(renderer, db_path)
+        results = [render_articles(out_dir, batch) for batch in batches]
+        if cursors:
+            render_index_pages(out_dir, cursors)
+        done = [article_id for result in results for article_id in result]
+    else:
+        done = []
+        with concurrent.futures.ProcessPoolExecutor(workers, initializer=init_worker,
+                                                    initargs=(renderer, db_path)) as pool:
+            futures = [pool.submit(render_articles, out_dir, batch) for batch in batches]
+            index_future = pool.submit(render_index_pages, out_dir, cursors) if cursors else None
+            last_report = time.perf_counter()
+            for future in concurrent.futures.as_completed(futures):
+                done.extend(future.result())
+                if time.perf_counter() - last_report >= 2.0:
+                    last_report = time.perf_counter()
+                    print(f'已生成 {len(done)} / {len(changed)} 篇文章', file=sys.stderr)
+            if index_future is not None:
+                index_future.result()
+    for article_id in done:
+        articles[str(article_id)] = current[str(article_id)]
+    rendered = len(done)
+
+    for article_id in removed:
+        remove_page(os.path.join(out_dir, article_path(article_id)))
+    index = dict(manifest.get('index', {})) if not rebuild_index else {cursor: index_path(cursor) for cursor in cursors}
+    if rebuild_index:
+        # 删除已不在前 index_pages 页中的旧首页文件
+        index_dir = os.path.join(out_dir, 'index')
+        keep = {os.path.basename(rel) for rel in index.values()}
+        for name in os.listdir(index_dir) if os.path.isdir(index_dir) else ():
+            if name.endswith('.html') and name not in keep:
+                remove_page(os.path.join(index_dir, name))
+    copy_assets(out_dir, renderer)
+
+    manifest = {
+        'renderer': renderer,
+        'version': version,
+        'built_at': datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+        # 有文章渲染失败（例如期间被删除）时不记录签名，下次构建会重新生成首页
+        'signature': signature if rendered == len(changed) else None,
+        'articles': articles,
+        'index': index,
+    }
+    write_file(os.path.join(out_dir, MANIFEST), json.dumps(manifest, ensure_ascii=False).encode())
+    return {
+        'articles': len(current),
+        'rendered': rendered,
+        'removed': len(removed),
+        'index_pages': len(cursors),
+        'full': full,
+        'seconds': time.perf_counter() - start,
+    }
+
+# 服务器端：匿名访问首页和文章页时，预先生成的页面仍然新鲜就直接发送文件。
+#
+# 每隔 check_interval 秒重新读取清单（文件有变化时）并比较文章集合签名；
+# 签名一致时所有页面都是新鲜的，否则文章页逐篇比较 updated_at，首页回退到动态渲染。
+# 预生成页面中的浏览量是构建时的数值。connection 与 ViewBuffer 相同。
+class StaticSite:
+    def __init__(self, root, connection, check_interval=1.0):
+        self.root = root
+        self.connection = connection
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._manifest = None
+        self._manifest_mtime = None
+        self._fresh = False
+        self._checked_at = None
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def _state(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.check_interval:
+                return self._manifest, self._fresh
+            self._checked_at = now
+        path = os.path.join(self.root, MANIFEST)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        manifest = self._manifest
+        if mtime != self._manifest_mtime:
+            manifest = load_manifest(self.root) if mtime is not None else None
+        fresh = False
+        if manifest:
+            with self.connection() as conn:
+                fresh = list(conn.execute(SIGNATURE_SQL).fetchone()) == manifest.get('signature')
+        with self._lock:
+            self._manifest, self._manifest_mtime, self._fresh = manifest, mtime, fresh
+        return manifest, fresh
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _load(self, rel, last_modified=None):
+        try:
+            page = CachedPage.from_file(os.path.join(self.root, rel), last_modified)
+        except FileNotFoundError:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return page
+
+    def article(self, article_id):
+        manifest, fresh = self._state()
+        updated_at = manifest['articles'].get(str(article_id)) if manifest else None
+        if updated_at is None:
+            self._count('misses')
+            return None
+        if not fresh:
+            with self.connection() as conn:
+                row = conn.execute('SELECT updated_at FROM article WHERE id = ?', (article_id,)).fetchone()
+            if row is None or row[0] != updated_at:
+                self._count('stale')
+                return None
+        return self._load(article_path(article_id), updated_at)
+
+    def index(self, cursor):
+        manifest, fresh = self._state()
+        rel = manifest['index'].get(cursor or '') if manifest else None
+        if rel is None:
+            self._count('misses')
+            return None
+        if not fresh:
+            self._count('stale')
+            return None
+        return self._load(rel)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale': self.stale,
+                'articles': len(self._manifest['articles']) if self._manifest else 0,
+                'fresh': int(self._fresh),
+            }
+
+def cmd_build(args):
+    report = build(args.db, args.output, args.renderer, args.workers, args.index_pages, args.chunk, args.force)
+    rate = report['rendered'] / report['seconds'] if report['seconds'] else 0.0
+    print(f"{'全量' if report['full'] else '增量'}构建: 共 {report['articles']} 篇文章, 生成 {report['rendered']} 篇, "
+          f"删除 {report['removed']} 篇, 首页 {report['index_pages']} 页, "
+          f"耗时 {report['seconds']:.2f} s（{rate:.0f} 篇/秒）")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='把首页和文章页预先生成为静态文件')
+    parser.add_argument('--db', default='blog.db', help='数据库文件')
+    parser.add_argument('--output', default='static_site', help='输出目录')
+    parser.add_argument('--renderer', choices=RENDERERS, default='simple', help='使用哪个服务器的模板渲染')
+    parser.add_argument('--workers', type=int, help='渲染进程数，默认为 CPU 核数，0 表示在当前进程中渲染')
+    parser.add_argument('--index-pages', type=int, default=10, help='预先生成的首页页数')
+    parser.add_argument('--chunk', type=int, default=100, help='每个渲染任务包含的文章数')
+    parser.add_argument('--force', action='store_true', help='忽略清单，全部重新生成')
+    args = parser.parse_args(argv)
+    cmd_build(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,358 @@
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import time
+
+from db_pool import apply_pragmas
+from listing import rebuild_listing
+from search import SEARCH_SCHEMA, SHORT_SEARCH_SCHEMA, rebuild_short_search_index
+
+# 可导入导出的表及其列，列类型用于 CSV 的类型转换。
+# 有外键依赖，导入顺序为 user、category、article、article_view_history
+TABLES = {
+    'user': (('id', int), ('username', str), ('email', str), ('password_hash', str), ('created_at', str)),
+    'category': (('id', int), ('name', str), ('description', str)),
+    'article': (('id', int), ('title', str), ('content', str), ('summary', str), ('author_id', int),
+                ('category_id', int), ('created_at', str), ('updated_at', str), ('views', int)),
+    'article_view_history': (('id', int), ('user_id', int), ('article_id', int), ('viewed_at', str)),
+}
+
+CONFLICT_CLAUSES = {'abort': 'INSERT', 'ignore': 'INSERT OR IGNORE', 'replace': 'INSERT OR REPLACE'}
+
+# 导入进度和暂时删除的索引都记录在目标库中，与数据在同一个事务里提交，
+# 中断后重新执行同一条导入命令即可从上次提交的位置继续
+BULK_SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS bulk_import_checkpoint (
+        source TEXT PRIMARY KEY,
+        table_name TEXT NOT NULL,
+        source_size INTEGER NOT NULL,
+        byte_offset INTEGER NOT NULL,
+        rows INTEGER NOT NULL,
+        finished INTEGER NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''',
+    '''CREATE TABLE IF NOT EXISTS bulk_deferred_index (
+        name TEXT PRIMARY KEY,
+        table_name TEXT NOT NULL,
+        type TEXT NOT NULL,
+        sql TEXT NOT NULL
+    )''',
+)
+
+class BulkIOError(Exception):
+    pass
+
+def connect(path):
+    conn = sqlite3.connect(path)
+    apply_pragmas(conn)
+    for sql in BULK_SCHEMA:
+        conn.execute(sql)
+    conn.commit()
+    return conn
+
+def detect_format(path, fmt):
+    if fmt:
+        return fmt
+    if path.endswith('.jsonl') or path.endswith('.ndjson'):
+        return 'jsonl'
+    if path.endswith('.csv'):
+        return 'csv'
+    raise BulkIOError(f'无法从文件名判断格式，请指定 --format: {path}')
+
+# 按行读取二进制文件，产出 (行内容, 该行结束位置)，用于记录断点
+def read_lines(f, offset):
+    for line in f:
+        offset += len(line)
+        yield line, offset
+
+# 逐条产出 (记录, 记录结束位置)；JSONL 每行一个对象，CSV 第一行为表头
+def read_records(f, fmt, offset, header):
+    if fmt == 'jsonl':
+        for line_number, (line, end) in enumerate(read_lines(f, offset), 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise BulkIOError(f'第 {line_number} 行（从断点算起）不是合法的 JSON: {e}')
+            if not isinstance(record, dict):
+                raise BulkIOError(f'第 {line_number} 行（从断点算起）不是 JSON 对象')
+            yield record, end
+        return
+    position = {'end': offset}
+
+    def text_lines():
+        for line, end in read_lines(f, offset):
+            position['end'] = end
+            yield line.decode('utf-8')
+
+    # csv 模块按需读取行，产出一条记录时 position 正好指向这条记录最后一行的结尾
+    for row in csv.reader(text_lines()):
+        if not row:
+            continue
+        if len(row) != len(header):
+            raise BulkIOError(f'CSV 列数 {len(row)} 与表头 {len(header)} 不一致: {row[:3]}')
+        yield dict(zip(header, row)), position['end']
+
+def read_csv_header(f):
+    line = f.readline()
+    if not line:
+        raise BulkIOError('CSV 文件为空')
+    return next(csv.reader([line.decode('utf-8-sig')])), len(line)
+
+def convert_csv_value(value, kind):
+    # CSV 中空字符串表示 NULL（文本列保留空字符串）
+    if kind is int:
+        return int(value) if value != '' else None
+    return value
+
+# 暂时删除表上的普通索引和触发器（全文索引同步触发器），导入结束后统一重建。
+# UNIQUE 约束自带的索引无法删除，仍然逐行维护
+def defer_indexes(conn, table):
+    rows = conn.execute(
+        "SELECT name, type, sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+        (table,)).fetchall()
+    for name, kind, sql in rows:
+        conn.execute('INSERT OR IGNORE INTO bulk_deferred_index (name, table_name, type, sql) VALUES (?, ?, ?, ?)',
+                     (name, table, kind, sql))
+        conn.execute(f'DROP {kind.upper()} "{name}"')
+    conn.commit()
+    return [name for name, _, _ in rows]
+
+def restore_indexes(conn, table=None):
+    if table:
+        rows = conn.execute('SELECT name, table_name, type, sql FROM bulk_deferred_index WHERE table_name = ?',
+                            (table,)).fetchall()
+    else:
+        rows = conn.execute('SELECT name, table_name, type, sql FROM bulk_deferred_index').fetchall()
+    rebuild_search = False
+    rebuild_listing_table = False
+    for name, table_name, kind, sql in rows:
+        start = time.perf_counter()
+        # 服务器启动时可能已经重新创建了同名索引
+        if not conn.execute('SELECT 1 FROM sqlite_master WHERE name = ?', (name,)).fetchone():
+            conn.execute(sql)
+        conn.execute('DELETE FROM bulk_deferred_index WHERE name = ?', (name,))
+        if kind == 'trigger' and name.startswith('article_fts_'):
+            rebuild_search = True
+        if kind == 'trigger' and name.startswith('article_listing_'):
+            rebuild_listing_table = True
+        print(f'重建 {kind} {name}: {time.perf_counter() - start:.2f} s', file=sys.stderr)
+    if rebuild_search:
+        # 导入期间全文索引没有同步，整体重建一次
+        start = time.perf_counter()
+        for sql in SEARCH_SCHEMA + SHORT_SEARCH_SCHEMA:
+            conn.execute(sql)
+        conn.execute("INSERT INTO article_fts (article_fts) VALUES ('rebuild')")
+        rebuild_short_search_index(conn)
+        print(f'重建全文索引: {time.perf_counter() - start:.2f} s', file=sys.stderr)
+    if rebuild_listing_table:
+        # 读模型同理
+        start = time.perf_counter()
+        rebuild_listing(conn, commit=False)
+        print(f'重建列表读模型: {time.perf_counter() - start:.2f} s', file=sys.stderr)
+    conn.commit()
+    return len(rows)
+
+class Progress:
+    def __init__(self, label, interval=2.0, rows=0):
+        self.label = label
+        self.interval = interval
+        self.rows = rows
+        self.start_rows = rows
+        self.start = time.perf_counter()
+        self.last_report = self.start
+
+    def add(self, count):
+        self.rows += count
+        now = time.perf_counter()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            print(f'{self.label}: {self.rows} 行, {self.rate():.0f} 行/秒', file=sys.stderr)
+
+    def rate(self):
+        elapsed = time.perf_counter() - self.start
+        return (self.rows - self.start_rows) / elapsed if elapsed > 0 else 0.0
+
+    def done(self):
+        elapsed = time.perf_counter() - self.start
+        print(f'{self.label}完成: 本次 {self.rows - self.start_rows} 行, 累计 {self.rows} 行, '
+              f'{elapsed:.2f} s, {self.rate():.0f} 行/秒', file=sys.stderr)
+
+def import_file(conn, table, path, fmt=None, batch_size=5000, on_conflict='abort', defer=True, restart=False):
+    fmt = detect_format(path, fmt)
+    columns = dict(TABLES[table])
+    source = os.path.abspath(path)
+    size = os.path.getsize(path)
+    checkpoint = conn.execute('SELECT table_name, source_size, byte_offset, rows, finished FROM bulk_import_checkpoint '
+                              'WHERE source = ?', (source,)).fetchone()
+    if checkpoint and not restart:
+        if checkpoint[0] != table or checkpoint[1] != size:
+            raise BulkIOError(f'{path} 与上次导入时不一致（表或文件大小不同），使用 --restart 重新导入')
+        if checkpoint[4]:
+            print(f'{path} 已经导入完成（{checkpoint[3]} 行），跳过', file=sys.stderr)
+            return checkpoint[3]
+        offset, rows = checkpoint[2], checkpoint[3]
+        print(f'从断点继续: 已导入 {rows} 行, 字节位置 {offset}', file=sys.stderr)
+    else:
+        offset, rows = 0, 0
+
+    if defer:
+        defer_indexes(conn, table)
+
+    progress = Progress(f'导入 {table}', rows=rows)
+    with open(path, 'rb') as f:
+        header = None
+        if fmt == 'csv':
+            header, header_end = read_csv_header(f)
+            unknown = [name for name in header if name not in columns]
+            if unknown:
+                raise BulkIOError(f'{table} 表没有这些列: {", ".join(unknown)}')
+            offset = max(offset, header_end)
+        f.seek(offset)
+        insert_columns = header
+        sql = None
+        batch = []
+        end = offset
+        for record, end in read_records(f, fmt, offset, header):
+            if insert_columns is None:
+                # JSONL 以第一条记录的字段为准，之后缺少的字段按 NULL 处理
+                insert_columns = [name for name in record if name in columns]
+                unknown = [name for name in record if name not in columns]
+                if unknown:
+                    raise BulkIOError(f'{table} 表没有这些列: {", ".join(unknown)}')
+            if sql is None:
+                sql = (f'{CONFLICT_CLAUSES[on_conflict]} INTO {table} ({", ".join(insert_columns)}) '
+                       f'VALUES ({", ".join("?" * len(insert_columns))})')
+            if fmt == 'csv':
+                batch.append(tuple(convert_csv_value(record[name], columns[name]) for name in insert_columns))
+            else:
+                batch.append(tuple(record.get(name) for name in insert_columns))
+            if len(batch) >= batch_size:
+                rows = write_batch(conn, sql, batch, source, table, size, end, rows)
+                progress.add(len(batch))
+                batch = []
+        if batch:
+            rows = write_batch(conn, sql, batch, source, table, size, end, rows)
+            progress.add(len(batch))
+    save_checkpoint(conn, source, table, size, end, rows, finished=1)
+    conn.commit()
+    progress.done()
+    if defer:
+        restore_indexes(conn, table)
+    return rows
+
+# 一批数据和断点在同一个事务中提交
+def write_batch(conn, sql, batch, source, table, size, offset, rows):
+    try:
+        conn.executemany(sql, batch)
+    except sqlite3.Error as e:
+        conn.rollback()
+        raise BulkIOError(f'写入失败（已回滚本批 {len(batch)} 行，断点停在第 {rows} 行之后）: {e}')
+    rows += len(batch)
+    save_checkpoint(conn, source, table, size, offset, rows)
+    conn.commit()
+    return rows
+
+def save_checkpoint(conn, source, table, size, offset, rows, finished=0):
+    conn.execute('''
+        INSERT INTO bulk_import_checkpoint (source, table_name, source_size, byte_offset, rows, finished)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (source) DO UPDATE SET table_name = excluded.table_name, source_size = excluded.source_size,
+            byte_offset = excluded.byte_offset, rows = excluded.rows, finished = excluded.finished,
+            updated_at = CURRENT_TIMESTAMP
+    ''', (source, table, size, offset, rows, finished))
+
+def export_table(conn, table, output, fmt, batch_size=5000):
+    names = [name for name, _ in TABLES[table]]
+    cursor = conn.execute(f'SELECT {", ".join(names)} FROM {table} ORDER BY id')
+    progress = Progress(f'导出 {table}')
+    writer = csv.writer(output) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(names)
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        for row in rows:
+            if writer:
+                writer.writerow(['' if value is None else value for value in row])
+            else:
+                output.write(json.dumps(dict(zip(names, row)), ensure_ascii=False) + '\n')
+        progress.add(len(rows))
+    progress.done()
+    return progress.rows
+
+def cmd_import(args):
+    conn = connect(args.db)
+    try:
+        import_file(conn, args.table, args.input, args.format, args.batch, args.on_conflict,
+                    defer=not args.keep_indexes, restart=args.restart)
+    finally:
+        conn.close()
+    if args.table == 'article':
+        # 导入的文章没有写入时生成的正文预计算列，查看时临时计算
+        print('执行 python content.py backfill 为导入的文章生成预计算列', file=sys.stderr)
+
+def cmd_export(args):
+    conn = connect(args.db)
+    try:
+        if args.output == '-':
+            fmt = args.format or 'jsonl'
+            try:
+                export_table(conn, args.table, sys.stdout, fmt, args.batch)
+            except BrokenPipeError:
+                # 下游（例如 head）提前关闭了管道
+                os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        else:
+            fmt = detect_format(args.output, args.format)
+            with open(args.output, 'w', encoding='utf-8', newline='') as f:
+                export_table(conn, args.table, f, fmt, args.batch)
+    finally:
+        conn.close()
+
+def cmd_restore_indexes(args):
+    conn = connect(args.db)
+    try:
+        count = restore_indexes(conn)
+        print(f'重建了 {count} 个索引/触发器', file=sys.stderr)
+    finally:
+        conn.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='博客数据批量导入导出（JSONL / CSV）')
+    parser.add_argument('--db', default='blog.db', help='数据库文件')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    imp = sub.add_parser('import', help='导入数据，中断后重复执行同一命令即可续传')
+    imp.add_argument('table', choices=TABLES)
+    imp.add_argument('input')
+    imp.add_argument('--format', choices=['jsonl', 'csv'])
+    imp.add_argument('--batch', type=int, default=5000, help='每个事务写入的行数')
+    imp.add_argument('--on-conflict', choices=CONFLICT_CLAUSES, default='abort', help='主键或唯一约束冲突时的处理方式')
+    imp.add_argument('--keep-indexes', action='store_true', help='导入期间保留索引和全文索引触发器（默认先删除，导入后重建）')
+    imp.add_argument('--restart', action='store_true', help='忽略断点，从头导入')
+    imp.set_defaults(func=cmd_import)
+
+    exp = sub.add_parser('export', help='导出数据')
+    exp.add_argument('table', choices=TABLES)
+    exp.add_argument('output', help='输出文件，- 表示标准输出')
+    exp.add_argument('--format', choices=['jsonl', 'csv'])
+    exp.add_argument('--batch', type=int, default=5000)
+    exp.set_defaults(func=cmd_export)
+
+    restore = sub.add_parser('restore-indexes', help='导入中断后重建被暂时删除的索引和触发器')
+    restore.set_defaults(func=cmd_restore_indexes)
+
+    args = parser.parse_args(argv)
+    try:
+        args.func(args)
+    except BulkIOError as e:
+        print(f'错误: {e}', file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+import os
+import sqlite3
+import threading
+import time
+import traceback
+
+from db_pool import apply_pragmas
+from db_writer import direct_writer
+
+# 多进程部署时的缓存失效通知。每个进程的页面缓存、会话缓存互不共享，
+# 一个进程失效了某些标签，就把这些标签写进 cache_invalidation 表；
+# 其他进程的后台线程用一个独立连接轮询 PRAGMA data_version（只有其他连接提交过才会变化，读取它不访问磁盘），
+# 变化时才读取新的失效记录，在本进程失效同样的标签。单进程运行时不启动，publish 什么都不做
+INVALIDATION_SCHEMA = (
+    # AUTOINCREMENT 保证清理旧记录之后 id 也不会重复使用，轮询只需记住读到的最大 id
+    '''CREATE TABLE IF NOT EXISTS cache_invalidation (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        pid INTEGER NOT NULL,
+        tags TEXT NOT NULL,
+        created_at REAL NOT NULL
+    )''',
+)
+
+def write_invalidation(conn, pid, tags, now, purge_before):
+    conn.execute('INSERT INTO cache_invalidation (pid, tags, created_at) VALUES (?, ?, ?)', (pid, tags, now))
+    if purge_before is not None:
+        conn.execute('DELETE FROM cache_invalidation WHERE created_at < ?', (purge_before,))
+
+# connection 与 write 用于写入失效记录（与 ViewBuffer 相同）；
+# 轮询使用单独打开的 database 连接。on_invalidate(tags) 在轮询线程中调用
+class CacheInvalidations:
+    def __init__(self, database, connection, on_invalidate, interval=0.1, retention=600.0, write=None):
+        self.database = database
+        self.connection = connection
+        self.write = write or direct_writer(connection)
+        self.on_invalidate = on_invalidate
+        self.interval = interval
+        # 失效记录保留的秒数，远大于轮询间隔即可
+        self.retention = retention
+        self.pid = os.getpid()
+        self._conn = None
+        self._version = None
+        self._last_id = 0
+        self._last_purge = time.time()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        # 统计信息
+        self.published = 0
+        self.polls = 0
+        self.changes = 0
+        self.received = 0
+        self.errors = 0
+
+    def publish(self, tags):
+        if self._thread is None or not tags:
+            return
+        now = time.time()
+        with self._lock:
+            purge = now - self._last_purge >= self.retention / 10
+            if purge:
+                self._last_purge = now
+        self.write(write_invalidation, self.pid, '\n'.join(tags), now, now - self.retention if purge else None)
+        with self._lock:
+            self.published += 1
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._conn = sqlite3.connect(self.database, check_same_thread=False)
+            apply_pragmas(self._conn)
+            # 启动时缓存是空的，之前的失效记录不用处理
+            self._version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+            self._last_id = self._conn.execute('SELECT COALESCE(MAX(id), 0) FROM cache_invalidation').fetchone()[0]
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='cache-invalidation', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+            self._conn.close()
+            self._conn = None
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.interval)
+            if self._stopping:
+                break
+            try:
+                self.poll()
+            except Exception:
+                with self._lock:
+                    self.errors += 1
+                traceback.print_exc()
+
+    # 处理其他进程写入的新失效记录，返回失效的标签数
+    def poll(self):
+        version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+        with self._lock:
+            self.polls += 1
+        if version == self._version:
+            return 0
+        self._version = version
+        rows = self._conn.execute('SELECT id, pid, tags FROM cache_invalidation WHERE id > ? ORDER BY id',
+                                  (self._last_id,)).fetchall()
+        tags = []
+        for row_id, pid, text in rows:
+            self._last_id = row_id
+            if pid != self.pid:
+                tags.extend(text.split('\n'))
+        if tags:
+            self.on_invalidate(tags)
+        with self._lock:
+            self.changes += 1
+            self.received += len(tags)
+        return len(tags)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'enabled': int(self._thread is not None),
+                'published': self.published,
+                'polls': self.polls,
+                'changes': self.changes,
+                'received': self.received,
+                'errors': self.errors,
+            }
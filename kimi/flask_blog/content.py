@@ -0,0 +1,196 @@
+import argparse
+import concurrent.futures
+import html
+import math
+import re
+import sqlite3
+import sys
+import time
+
+from db_pool import apply_pragmas
+
+# 文章正文的写入时处理：转义后的 HTML 正文、自动摘要、字数和阅读时间在写入文章时算好存进 article 表，
+# 文章页和列表页只读取这几列。外部脚本直接改 content 时由触发器把这几列置空，
+# 查看时临时计算，backfill 命令补齐
+CONTENT_COLUMNS = (
+    ('content_html', 'TEXT'),
+    ('excerpt', 'TEXT'),
+    ('word_count', 'INTEGER'),
+    ('reading_time', 'INTEGER'),
+)
+
+# 自动摘要的最大长度（字符），与原来列表页截取的长度相同
+EXCERPT_LENGTH = 200
+# 阅读速度：中文按字，其他语言按词
+CJK_PER_MINUTE = 400
+WORDS_PER_MINUTE = 200
+
+CJK_PATTERN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]')
+WORD_PATTERN = re.compile(r"[A-Za-z0-9]+(?:['’-][A-Za-z0-9]+)*")
+PARAGRAPH_PATTERN = re.compile(r'\n\s*\n')
+SENTENCE_ENDS = '。！？；!?;'
+
+CONTENT_STALE_TRIGGER = '''
+    CREATE TRIGGER IF NOT EXISTS article_content_stale AFTER UPDATE OF content ON article
+    WHEN new.content IS NOT old.content AND new.content_html IS old.content_html BEGIN
+        UPDATE article SET content_html = NULL, excerpt = NULL, word_count = NULL, reading_time = NULL
+        WHERE id = new.id;
+    END
+'''
+
+# 正文是纯文本：空行分段，段内换行保留为 <br>，其余内容全部转义
+def render_content(content):
+    paragraphs = PARAGRAPH_PATTERN.split(content.replace('\r\n', '\n').strip())
+    return '\n'.join('<p>' + html.escape(paragraph.strip()).replace('\n', '<br>\n') + '</p>'
+                     for paragraph in paragraphs if paragraph.strip())
+
+# 合并空白后截取前 length 个字符；截断时尽量停在句末，超过一半长度才采用
+def make_excerpt(content, length=EXCERPT_LENGTH):
+    text = ' '.join(content.split())
+    if len(text) <= length:
+        return text
+    cut = text[:length]
+    end = max(cut.rfind(mark) for mark in SENTENCE_ENDS)
+    if end >= length // 2:
+        cut = cut[:end + 1]
+    return cut.rstrip() + '…'
+
+# 返回 (字数, 阅读分钟数)
+def count_words(content):
+    cjk = len(CJK_PATTERN.findall(content))
+    words = len(WORD_PATTERN.findall(content))
+    return cjk + words, max(1, math.ceil(cjk / CJK_PER_MINUTE + words / WORDS_PER_MINUTE))
+
+# 写入文章时调用，返回与 CONTENT_COLUMNS 顺序一致的 (content_html, excerpt, word_count, reading_time)
+def process_content(content):
+    return (render_content(content), make_excerpt(content)) + count_words(content)
+
+# 新建、修改文章都通过以下函数，与正文同时写入预计算列。
+# 服务器中通过 db_writer.run 执行（请求使用的连接都是只读的），不提交事务；写入后使对应的缓存页面失效
+def insert_article(conn, title, content, summary, author_id, category_id):
+    cursor = conn.execute('''INSERT INTO article (title, content, summary, author_id, category_id,
+                                                 content_html, excerpt, word_count, reading_time)
+                             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                          (title, content, summary, author_id, category_id) + process_content(content))
+    return cursor.lastrowid
+
+def update_article(conn, article_id, title, content, summary):
+    conn.execute('''UPDATE article SET title = ?, content = ?, summary = ?, updated_at = CURRENT_TIMESTAMP,
+                                       content_html = ?, excerpt = ?, word_count = ?, reading_time = ?
+                    WHERE id = ?''',
+                 (title, content, summary) + process_content(content) + (article_id,))
+
+def add_content_columns(conn):
+    existing = {row[1] for row in conn.execute('PRAGMA table_info(article)')}
+    for name, kind in CONTENT_COLUMNS:
+        if name not in existing:
+            conn.execute(f'ALTER TABLE article ADD COLUMN {name} {kind}')
+
+# 加列和触发器，不提交事务（供迁移在同一个事务中执行）
+def create_content_columns(conn):
+    add_content_columns(conn)
+    conn.execute(CONTENT_STALE_TRIGGER)
+
+def connect(path):
+    conn = sqlite3.connect(path)
+    apply_pragmas(conn)
+    return conn
+
+UPDATE_SQL = '''
+    UPDATE article SET content_html = ?, excerpt = ?, word_count = ?, reading_time = ?
+    WHERE id = ? AND content = ?
+'''
+
+# 在工作进程中执行：读取一批文章并计算预计算列，返回 UPDATE_SQL 的参数。
+# 带上读到的正文，写回时正文已被修改的文章不会被旧结果覆盖
+def process_batch(db_path, article_ids):
+    conn = connect(db_path)
+    try:
+        placeholders = ', '.join('?' * len(article_ids))
+        rows = conn.execute(f'SELECT id, content FROM article WHERE id IN ({placeholders})', article_ids).fetchall()
+    finally:
+        conn.close()
+    return [process_content(content) + (article_id, content) for article_id, content in rows]
+
+# 为预计算列为空（force 时为全部）的文章补齐预计算列，按 batch 篇分批在多个进程中计算，
+# 主进程按完成顺序逐批写回。返回统计信息
+def backfill(db_path, workers=None, batch=500, force=False):
+    start = time.perf_counter()
+    conn = connect(db_path)
+    try:
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(article)')}
+        if 'content_html' not in columns:
+            raise sqlite3.OperationalError('article 表没有预计算列，请先执行 python migrations.py migrate')
+        where = '' if force else 'WHERE content_html IS NULL'
+        article_ids = [row[0] for row in conn.execute(f'SELECT id FROM article {where} ORDER BY id')]
+        batches = [article_ids[i:i + batch] for i in range(0, len(article_ids), batch)]
+        updated = 0
+
+        def write(rows):
+            cursor = conn.executemany(UPDATE_SQL, rows)
+            conn.commit()
+            return cursor.rowcount
+
+        if workers == 0:
+            for article_batch in batches:
+                updated += write(process_batch(db_path, article_batch))
+        else:
+            with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+                futures = [pool.submit(process_batch, db_path, article_batch) for article_batch in batches]
+                done = 0
+                last_report = time.perf_counter()
+                for future in concurrent.futures.as_completed(futures):
+                    rows = future.result()
+                    updated += write(rows)
+                    done += len(rows)
+                    if time.perf_counter() - last_report >= 2.0:
+                        last_report = time.perf_counter()
+                        print(f'已处理 {done} / {len(article_ids)} 篇文章', file=sys.stderr)
+        remaining = conn.execute('SELECT COUNT(*) FROM article WHERE content_html IS NULL').fetchone()[0]
+    finally:
+        conn.close()
+    return {
+        'articles': len(article_ids),
+        'updated': updated,
+        'remaining': remaining,
+        'seconds': time.perf_counter() - start,
+    }
+
+def cmd_backfill(args):
+    report = backfill(args.db, args.workers, args.batch, args.force)
+    rate = report['updated'] / report['seconds'] if report['seconds'] else 0.0
+    print(f"处理 {report['articles']} 篇文章, 写入 {report['updated']} 篇, 仍缺少预计算列 {report['remaining']} 篇, "
+          f"耗时 {report['seconds']:.2f} s（{rate:.0f} 篇/秒）")
+
+def cmd_status(args):
+    conn = connect(args.db)
+    try:
+        total, missing = conn.execute(
+            'SELECT COUNT(*), COUNT(*) - COUNT(content_html) FROM article').fetchone()
+    finally:
+        conn.close()
+    print(f'共 {total} 篇文章, 缺少预计算列 {missing} 篇')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='文章正文的预计算列（HTML 正文、摘要、字数、阅读时间）')
+    parser.add_argument('--db', default='blog.db', help='数据库文件')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    status = sub.add_parser('status', help='统计缺少预计算列的文章')
+    status.set_defaults(func=cmd_status)
+
+    fill = sub.add_parser('backfill', help='为缺少预计算列的文章计算并写入')
+    fill.add_argument('--workers', type=int, help='计算进程数，默认为 CPU 核数，0 表示在当前进程中计算')
+    fill.add_argument('--batch', type=int, default=500, help='每个任务包含的文章数')
+    fill.add_argument('--force', action='store_true', help='重新计算所有文章')
+    fill.set_defaults(func=cmd_backfill)
+
+    args = parser.parse_args(argv)
+    try:
+        args.func(args)
+    except sqlite3.Error as e:
+        print(f'错误: {e}', file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# 每个新连接都会执行的 PRAGMA
+PRAGMAS = (
+    ('journal_mode', 'WAL'),          # 读写互不阻塞
+    ('synchronous', 'NORMAL'),        # WAL 模式下 NORMAL 已能保证一致性
+    ('cache_size', -32000),           # 约 32MB 页缓存
+    ('mmap_size', 268435456),         # 256MB 内存映射读
+    ('temp_store', 'MEMORY'),
+    ('foreign_keys', 'ON'),
+)
+
+def apply_pragmas(conn):
+    cursor = conn.cursor()
+    for name, value in PRAGMAS:
+        cursor.execute(f'PRAGMA {name} = {value}')
+    cursor.close()
+
+class PoolTimeout(Exception):
+    pass
+
+# SQLite 连接池：连接在请求之间复用，保留每个连接的预编译语句缓存。
+# read_only 时连接设置 query_only，所有写入必须交给写线程（db_writer.DatabaseWriter）
+class ConnectionPool:
+    def __init__(self, database, size=8, timeout=10.0, cached_statements=512, factory=sqlite3.Connection,
+                 read_only=False):
+        self.database = database
+        self.read_only = read_only
+        self.factory = factory
+        self.size = size
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        # 统计信息
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.database, timeout=self.timeout, check_same_thread=False,
+                               cached_statements=self.cached_statements, factory=self.factory)
+        apply_pragmas(conn)
+        if self.read_only:
+            conn.execute('PRAGMA query_only = ON')
+        return conn
+
+    def acquire(self):
+        start = time.perf_counter()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+        if conn is None:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self.timeouts += 1
+                    raise PoolTimeout(f'等待数据库连接超过 {self.timeout} 秒')
+                self._record_wait(time.perf_counter() - start)
+        with self._lock:
+            self.checkouts += 1
+        return conn
+
+    def _record_wait(self, waited):
+        with self._lock:
+            self.waits += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    def release(self, conn):
+        # 归还前回滚未提交的事务，避免把锁带给下一个使用者
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    # 打开全部连接并对每个连接调用 prepare（例如执行一遍常用查询，填充预编译语句缓存）
+    def warm_up(self, prepare=None):
+        connections = []
+        try:
+            while len(connections) < self.size:
+                connections.append(self.acquire())
+                if prepare is not None:
+                    prepare(connections[-1])
+        finally:
+            for conn in connections:
+                self.release(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'open': self._created,
+                'idle': self._idle.qsize(),
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'wait_total_ms': round(self.wait_total * 1000, 3),
+                'wait_avg_ms': round(self.wait_total * 1000 / self.waits, 3) if self.waits else 0.0,
+                'wait_max_ms': round(self.wait_max * 1000, 3),
+                'timeouts': self.timeouts,
+            }
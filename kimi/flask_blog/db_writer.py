@@ -0,0 +1,169 @@
+import concurrent.futures
+import queue
+import threading
+import time
+import traceback
+
+from db_pool import apply_pragmas
+
+# 单写线程：唯一的写连接只在这个线程中使用，其他线程把写操作 fn(conn, *args) 放进队列，拿到 Future。
+# 写线程每次取出队列中已有的全部操作（最多 max_batch 个）放进一个事务（组提交），
+# 每个操作在自己的 SAVEPOINT 中执行，失败只回滚它自己，Future 收到它的异常；
+# 提交成功后各 Future 才返回结果。请求线程之间不再争抢 SQLite 的写锁，也不会因为锁等待超时而失败。
+#
+# 写操作不能自己 commit / rollback，事务由写线程管理。connect 是一个返回新 DB-API 连接的函数，
+# 在 start() 时调用一次，连接之后在写线程中使用（sqlite3 需要 check_same_thread=False）
+class DatabaseWriter:
+    def __init__(self, connect, max_batch=256, max_pending=10000):
+        self.connect = connect
+        self.max_batch = max_batch
+        self._queue = queue.Queue(max_pending)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._thread = None
+        # 统计信息
+        self.submitted = 0
+        self.committed = 0
+        self.failed = 0
+        self.batches = 0
+        self.max_batch_seen = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.commit_total = 0.0
+        self.commit_max = 0.0
+
+    def start(self):
+        if self._thread is None:
+            self._conn = self.connect()
+            # 自动提交模式，事务完全由写线程的 BEGIN / COMMIT 控制
+            self._conn.isolation_level = None
+            apply_pragmas(self._conn)
+            self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+            self._thread.start()
+
+    # 执行完队列中已有的写操作后停止
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+            self._conn.close()
+            self._conn = None
+
+    def submit(self, fn, *args):
+        if self._thread is None:
+            raise RuntimeError('写线程没有启动')
+        future = concurrent.futures.Future()
+        self._queue.put((fn, args, future, time.perf_counter()))
+        with self._lock:
+            self.submitted += 1
+        return future
+
+    # 提交写操作并等待它随所在的事务一起提交，返回 fn 的结果或抛出它的异常
+    def run(self, fn, *args):
+        return self.submit(fn, *args).result()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            batch = []
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.max_batch:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            stopping = item is None
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception:
+                    traceback.print_exc()
+
+    def _write_batch(self, batch):
+        started = time.perf_counter()
+        conn = self._conn
+        results = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for fn, args, future, _ in batch:
+                if not future.set_running_or_notify_cancel():
+                    results.append(None)
+                    continue
+                conn.execute('SAVEPOINT write')
+                try:
+                    results.append((True, fn(conn, *args)))
+                except Exception as e:
+                    # 回滚失败说明整个事务已不可用，由外层放弃整批
+                    conn.execute('ROLLBACK TO write')
+                    results.append((False, e))
+                conn.execute('RELEASE write')
+            commit_started = time.perf_counter()
+            conn.execute('COMMIT')
+            committed = time.perf_counter() - commit_started
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            for fn, args, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            with self._lock:
+                self.failed += len(batch)
+                self.batches += 1
+            raise
+        succeeded = failed = 0
+        for (_, _, future, _), result in zip(batch, results):
+            if result is None:
+                continue
+            ok, value = result
+            if ok:
+                future.set_result(value)
+                succeeded += 1
+            else:
+                future.set_exception(value)
+                failed += 1
+        with self._lock:
+            self.batches += 1
+            self.committed += succeeded
+            self.failed += failed
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            for _, _, _, queued_at in batch:
+                waited = started - queued_at
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+            self.commit_total += committed
+            self.commit_max = max(self.commit_max, committed)
+
+    def metrics(self):
+        with self._lock:
+            done = self.committed + self.failed
+            return {
+                'pending': self._queue.qsize(),
+                'submitted': self.submitted,
+                'committed': self.committed,
+                'failed': self.failed,
+                'batches': self.batches,
+                'batch_avg': round(done / self.batches, 3) if self.batches else 0.0,
+                'batch_max': self.max_batch_seen,
+                'queue_wait_avg_ms': round(self.wait_total * 1000 / done, 3) if done else 0.0,
+                'queue_wait_max_ms': round(self.wait_max * 1000, 3),
+                'commit_avg_ms': round(self.commit_total * 1000 / self.batches, 3) if self.batches else 0.0,
+                'commit_max_ms': round(self.commit_max * 1000, 3),
+            }
+
+# 没有写线程时的写操作执行方式：从 connection 借一个连接，执行 fn(conn, *args) 后提交。
+# 与 DatabaseWriter.run 的调用方式相同，组件据此在两种方式之间切换
+def direct_writer(connection):
+    def run(fn, *args):
+        with connection() as conn:
+            try:
+                result = fn(conn, *args)
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            return result
+    return run
@@ -0,0 +1,147 @@
+import datetime
+import email.utils
+import functools
+import gzip
+import hashlib
+import zlib
+
+# brotli 为可选依赖，未安装时只提供 gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 小于该长度的响应压缩收益很小
+MIN_COMPRESS_SIZE = 1024
+# 静态资源 URL 带内容版本号，可以长期缓存
+STATIC_MAX_AGE = 365 * 24 * 3600
+COMPRESSIBLE_TYPES = frozenset(['text/html', 'text/css', 'text/plain', 'application/json', 'application/javascript'])
+
+def available_encodings():
+    return ('br', 'gzip') if brotli else ('gzip',)
+
+# 同一内容的各个压缩版本语义相同，使用弱 ETag 共享同一个校验值
+def make_etag(body):
+    return 'W/"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest()
+
+def to_utc(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        # SQLite CURRENT_TIMESTAMP 格式，UTC 时间
+        try:
+            value = datetime.datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.astimezone(datetime.timezone.utc).replace(microsecond=0)
+
+def http_date(value):
+    return email.utils.format_datetime(to_utc(value), usegmt=True)
+
+def parse_http_date(value):
+    if not value:
+        return None
+    try:
+        return to_utc(email.utils.parsedate_to_datetime(value))
+    except (TypeError, ValueError):
+        return None
+
+# 解析 Accept-Encoding，返回 q > 0 的编码
+def accepted_encodings(header):
+    accepted = set()
+    for item in (header or '').split(','):
+        name, _, params = item.partition(';')
+        name = name.strip().lower()
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name and quality > 0:
+            accepted.add(name)
+    return accepted
+
+def choose_encoding(header, available):
+    accepted = accepted_encodings(header)
+    for encoding in ('br', 'gzip'):
+        if encoding in available and (encoding in accepted or '*' in accepted):
+            return encoding
+    return None
+
+def compress(body, encoding, level=None):
+    if encoding == 'br':
+        return brotli.compress(body, quality=11 if level is None else level)
+    return gzip.compress(body, compresslevel=9 if level is None else level, mtime=0)
+
+# 动态生成、不进缓存的响应只做较快的 gzip 压缩，返回 (编码, 内容)
+def compress_body(body, accept_encoding):
+    if len(body) < MIN_COMPRESS_SIZE or not choose_encoding(accept_encoding, ('gzip',)):
+        return None, body
+    return 'gzip', compress(body, 'gzip', level=6)
+
+# 流式响应使用的 gzip 压缩器
+def gzip_compressor():
+    return zlib.compressobj(6, zlib.DEFLATED, 31)
+
+def etag_matches(if_none_match, etag):
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag.removeprefix('W/')
+    return any(tag.strip().removeprefix('W/') == opaque for tag in if_none_match.split(','))
+
+# 条件请求：有 If-None-Match 时只比较 ETag，否则比较 If-Modified-Since
+def is_not_modified(headers, etag, last_modified=None):
+    if_none_match = headers.get('If-None-Match')
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    since = parse_http_date(headers.get('If-Modified-Since'))
+    return since is not None and last_modified is not None and last_modified <= since
+
+# 缓存的响应：原始内容、预先压缩好的各编码版本和校验信息
+class CachedPage:
+    def __init__(self, body, last_modified=None, content_type='text/html; charset=utf-8'):
+        self.body = body
+        self.content_type = content_type
+        self.etag = make_etag(body)
+        self.last_modified = to_utc(last_modified)
+        self.encodings = {}
+        if len(body) >= MIN_COMPRESS_SIZE:
+            for encoding in available_encodings():
+                compressed = compress(body, encoding)
+                if len(compressed) < len(body):
+                    self.encodings[encoding] = compressed
+        self.size = len(body) + sum(len(value) for value in self.encodings.values())
+
+    # 从预先生成的文件加载，同目录下的 .gz 文件作为 gzip 版本，不再重新压缩
+    @classmethod
+    def from_file(cls, path, last_modified=None, content_type='text/html; charset=utf-8'):
+        page = cls.__new__(cls)
+        with open(path, 'rb') as f:
+            page.body = f.read()
+        page.content_type = content_type
+        page.etag = make_etag(page.body)
+        page.last_modified = to_utc(last_modified)
+        page.encodings = {}
+        try:
+            with open(path + '.gz', 'rb') as f:
+                page.encodings['gzip'] = f.read()
+        except FileNotFoundError:
+            pass
+        page.size = len(page.body) + sum(len(value) for value in page.encodings.values())
+        return page
+
+    # 按 Accept-Encoding 选择版本，返回 (编码, 内容)
+    def select(self, accept_encoding):
+        encoding = choose_encoding(accept_encoding, self.encodings)
+        return encoding, self.encodings[encoding] if encoding else self.body
+
+# 静态文件的内容版本号，用于生成带版本的 URL
+@functools.lru_cache(maxsize=None)
+def file_version(path):
+    with open(path, 'rb') as f:
+        return hashlib.blake2b(f.read(), digest_size=6).hexdigest()
@@ -0,0 +1,326 @@
+import cProfile
+import datetime
+import os
+import pstats
+import random
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# 请求耗时直方图的桶（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_local = threading.local()
+
+def current():
+    return getattr(_local, 'timer', None)
+
+# 单个请求的计时：各阶段（db / render / hash / write）只统计自身耗时，
+# 嵌套阶段（例如渲染过程中查询数据库）的时间从外层阶段中扣除
+class RequestTimer:
+    def __init__(self, method, route):
+        self.method = method
+        self.route = route
+        self.status = None
+        self.statements = 0
+        self.phases = {}
+        self.start = time.perf_counter()
+        self.duration = None
+        self.profiler = None
+        self._stack = []
+
+    def begin(self, name):
+        self._stack.append([name, time.perf_counter(), 0.0])
+
+    def end(self, name):
+        if not any(entry[0] == name for entry in self._stack):
+            return
+        # 出现异常时内层阶段可能没有正常结束，一并结束
+        while self._stack:
+            entry = self._stack.pop()
+            elapsed = time.perf_counter() - entry[1]
+            self.phases[entry[0]] = self.phases.get(entry[0], 0.0) + elapsed - entry[2]
+            if self._stack:
+                self._stack[-1][2] += elapsed
+            if entry[0] == name:
+                return
+
+    def finish(self):
+        while self._stack:
+            self.end(self._stack[-1][0])
+        self.duration = time.perf_counter() - self.start
+        # 未归入任何阶段的时间（路由、业务逻辑等）
+        self.phases['other'] = max(0.0, self.duration - sum(self.phases.values()))
+
+    def summary(self):
+        parts = [f'{name}={seconds * 1000:.1f}ms' for name, seconds in sorted(self.phases.items())]
+        return f'{self.method} {self.route} {self.status} {self.duration * 1000:.1f}ms ' \
+               f'{" ".join(parts)} sql={self.statements}'
+
+@contextmanager
+def phase(name):
+    timer = current()
+    if timer is None:
+        yield
+        return
+    timer.begin(name)
+    try:
+        yield
+    finally:
+        timer.end(name)
+
+def count_statement(statement):
+    timer = current()
+    # 触发器内部语句以 "--" 开头，不单独计数
+    if timer is not None and not statement.startswith('--'):
+        timer.statements += 1
+
+def _timed_db(method):
+    def wrapper(self, *args, **kwargs):
+        timer = current()
+        if timer is None:
+            return method(self, *args, **kwargs)
+        timer.begin('db')
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            timer.end('db')
+    return wrapper
+
+class InstrumentedCursor(sqlite3.Cursor):
+    execute = _timed_db(sqlite3.Cursor.execute)
+    executemany = _timed_db(sqlite3.Cursor.executemany)
+    fetchone = _timed_db(sqlite3.Cursor.fetchone)
+    fetchmany = _timed_db(sqlite3.Cursor.fetchmany)
+    fetchall = _timed_db(sqlite3.Cursor.fetchall)
+    __next__ = _timed_db(sqlite3.Cursor.__next__)
+
+# 记录 DB 耗时和语句数的 SQLite 连接，作为 sqlite3.connect 的 factory 使用
+class InstrumentedConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_trace_callback(count_statement)
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, parameters):
+        return self.cursor().executemany(sql, parameters)
+
+    commit = _timed_db(sqlite3.Connection.commit)
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(labels):
+    return ','.join(f'{name}="{escape_label(value)}"' for name, value in labels)
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{format_labels(labels + [("le", repr(bound))])}}} {cumulative}'
+        yield f'{name}_bucket{{{format_labels(labels + [("le", "+Inf")])}}} {self.count}'
+        yield f'{name}_sum{{{format_labels(labels)}}} {self.sum}'
+        yield f'{name}_count{{{format_labels(labels)}}} {self.count}'
+
+# 按路由汇总的指标，输出 Prometheus 文本格式
+class Metrics:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.durations = {}
+        self.phases = {}
+        self.requests = {}
+        self.statements = {}
+        self.slow_requests = 0
+        self.profiles = 0
+
+    def observe(self, timer):
+        with self._lock:
+            key = (timer.method, timer.route)
+            histogram = self.durations.get(key)
+            if histogram is None:
+                histogram = self.durations[key] = Histogram(self.buckets)
+            histogram.observe(timer.duration)
+            for name, seconds in timer.phases.items():
+                histogram = self.phases.get((timer.route, name))
+                if histogram is None:
+                    histogram = self.phases[(timer.route, name)] = Histogram(self.buckets)
+                histogram.observe(seconds)
+            key = (timer.method, timer.route, timer.status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.statements[timer.route] = self.statements.get(timer.route, 0) + timer.statements
+
+    def render(self):
+        lines = []
+        with self._lock:
+            lines.append('# HELP blog_requests_total 请求数')
+            lines.append('# TYPE blog_requests_total counter')
+            for (method, route, status), count in sorted(self.requests.items(), key=str):
+                lines.append(f'blog_requests_total{{{format_labels([("method", method), ("route", route), ("status", status)])}}} {count}')
+            lines.append('# HELP blog_request_duration_seconds 请求耗时')
+            lines.append('# TYPE blog_request_duration_seconds histogram')
+            for (method, route), histogram in sorted(self.durations.items()):
+                lines.extend(histogram.lines('blog_request_duration_seconds', [('method', method), ('route', route)]))
+            lines.append('# HELP blog_request_phase_seconds 请求各阶段耗时（db / render / hash / write / other）')
+            lines.append('# TYPE blog_request_phase_seconds histogram')
+            for (route, name), histogram in sorted(self.phases.items()):
+                lines.extend(histogram.lines('blog_request_phase_seconds', [('route', route), ('phase', name)]))
+            lines.append('# HELP blog_db_statements_total 执行的 SQL 语句数')
+            lines.append('# TYPE blog_db_statements_total counter')
+            for route, count in sorted(self.statements.items()):
+                lines.append(f'blog_db_statements_total{{{format_labels([("route", route)])}}} {count}')
+            lines.append('# HELP blog_slow_requests_total 超过慢请求阈值的请求数')
+            lines.append('# TYPE blog_slow_requests_total counter')
+            lines.append(f'blog_slow_requests_total {self.slow_requests}')
+            lines.append('# HELP blog_profiles_total 保存的 cProfile 采样数')
+            lines.append('# TYPE blog_profiles_total counter')
+            lines.append(f'blog_profiles_total {self.profiles}')
+        return '\n'.join(lines) + '\n'
+
+# 把各组件的统计字典输出为 gauge，例如 db_pool.metrics()
+def gauge_lines(prefix, stats):
+    lines = []
+    for name, value in stats.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            lines.append(f'# TYPE {prefix}_{name} gauge')
+            lines.append(f'{prefix}_{name} {value}')
+    return '\n'.join(lines) + '\n' if lines else ''
+
+# 请求埋点：汇总指标，记录慢请求；profile_rate > 0 时按比例对请求开启 cProfile，
+# 其中超过 slow_ms 的请求把 pstats 结果保存到 profile_dir
+class Instrumentation:
+    def __init__(self, slow_ms=500, profile_rate=0.0, profile_dir='profiles', keep_profiles=50):
+        self.slow_ms = slow_ms
+        self.profile_rate = profile_rate
+        self.profile_dir = profile_dir
+        self.keep_profiles = keep_profiles
+        self.metrics = Metrics()
+        # 同一时间只对一个请求做 profile
+        self._profile_lock = threading.Lock()
+
+    def start(self, method, route):
+        timer = RequestTimer(method, route)
+        if self.profile_rate and random.random() < self.profile_rate and self._profile_lock.acquire(blocking=False):
+            timer.profiler = cProfile.Profile()
+            timer.profiler.enable()
+        _local.timer = timer
+        return timer
+
+    def finish(self, timer):
+        if timer.profiler is not None:
+            timer.profiler.disable()
+            self._profile_lock.release()
+        _local.timer = None
+        timer.finish()
+        self.metrics.observe(timer)
+        if timer.duration * 1000 >= self.slow_ms:
+            with self.metrics._lock:
+                self.metrics.slow_requests += 1
+            path = self.save_profile(timer) if timer.profiler is not None else None
+            print(f'慢请求: {timer.summary()}' + (f' profile={path}' if path else ''), file=sys.stderr)
+
+    @contextmanager
+    def request(self, method, route):
+        timer = self.start(method, route)
+        try:
+            yield timer
+        finally:
+            self.finish(timer)
+
+    def save_profile(self, timer):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        route = ''.join(c if c.isalnum() else '_' for c in timer.route).strip('_') or 'root'
+        path = os.path.join(self.profile_dir, f'{stamp}-{timer.method}-{route}-{timer.duration * 1000:.0f}ms.prof')
+        stats = pstats.Stats(timer.profiler)
+        stats.dump_stats(path)
+        with open(path[:-len('.prof')] + '.txt', 'w') as f:
+            f.write(timer.summary() + '\n\n')
+            pstats.Stats(path, stream=f).sort_stats('cumulative').print_stats(30)
+        with self.metrics._lock:
+            self.metrics.profiles += 1
+        self._prune_profiles()
+        return path
+
+    # 只保留最近 keep_profiles 份结果
+    def _prune_profiles(self):
+        names = sorted(name for name in os.listdir(self.profile_dir) if name.endswith('.prof'))
+        for name in names[:-self.keep_profiles]:
+            for suffix in ('.prof', '.txt'):
+                try:
+                    os.remove(os.path.join(self.profile_dir, name[:-len('.prof')] + suffix))
+                except FileNotFoundError:
+                    pass
+
+    # WSGI 中间件：服务器在两次取响应体之间写出数据，这段时间计入 write；
+    # 响应体迭代结束（close）时才记录请求
+    def wsgi_middleware(self, wsgi_app):
+        def middleware(environ, start_response):
+            timer = self.start(environ.get('REQUEST_METHOD', 'GET'), 'unmatched')
+
+            def instrumented_start_response(status, headers, exc_info=None):
+                timer.status = int(status.split(' ', 1)[0])
+                return start_response(status, headers, exc_info)
+
+            try:
+                body = wsgi_app(environ, instrumented_start_response)
+            except BaseException:
+                timer.status = 500
+                self.finish(timer)
+                raise
+            return self._timed_body(body, timer)
+        return middleware
+
+    def _timed_body(self, body, timer):
+        try:
+            for chunk in body:
+                timer.begin('write')
+                yield chunk
+                timer.end('write')
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+            self.finish(timer)
+
+# 给 socket 的文件对象计时，写出的时间计入 write 阶段
+class TimedWriter:
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, data):
+        timer = current()
+        if timer is None:
+            return self.wfile.write(data)
+        timer.begin('write')
+        try:
+            return self.wfile.write(data)
+        finally:
+            timer.end('write')
+
+    def flush(self):
+        return self.wfile.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.wfile, name)
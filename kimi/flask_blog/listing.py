@@ -0,0 +1,354 @@
+import argparse
+import sqlite3
+import sys
+import time
+
+from content import add_content_columns
+from db_pool import apply_pragmas
+from pagination import PAGE_SIZE
+
+# 文章列表的读模型：列表页需要的字段（作者名、分类名、无摘要时的自动摘要）预先连接好，
+# 首页和浏览历史只需按索引扫描这一张表，不再连接 user 和 category。
+# 由 article、user、category 上的触发器维护，与业务写入在同一个事务中更新。
+LISTING_COLUMNS = ('id, title, summary, excerpt, author_id, author_name, category_id, category_name, '
+                   'created_at, views')
+
+# 读模型每一行的来源；触发器和一致性检查共用
+LISTING_SOURCE = '''
+    SELECT a.id, a.title, a.summary,
+           CASE WHEN a.summary IS NULL OR a.summary = ''
+                THEN COALESCE(a.excerpt, substr(a.content, 1, 200) || '…') END,
+           a.author_id, u.username, a.category_id, c.name, a.created_at, a.views
+    FROM article a
+    JOIN user u ON a.author_id = u.id
+    JOIN category c ON a.category_id = c.id
+'''
+
+# 列的类型与 app.py 中的 ArticleListing 模型一致，两个服务器可以共用同一个库
+LISTING_TABLE = '''
+    CREATE TABLE IF NOT EXISTS article_listing (
+        id INTEGER PRIMARY KEY,
+        title VARCHAR(200) NOT NULL,
+        summary VARCHAR(500),
+        excerpt TEXT,
+        author_id INTEGER NOT NULL,
+        author_name VARCHAR(80) NOT NULL,
+        category_id INTEGER NOT NULL,
+        category_name VARCHAR(50) NOT NULL,
+        created_at DATETIME,
+        views INTEGER
+    )
+'''
+
+# 首页、分类页、作者页都按 (created_at, id) 倒序分页；
+# 分类、作者索引同时供改名触发器按分类、作者查找
+LISTING_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS idx_listing_created ON article_listing (created_at, id)',
+    'CREATE INDEX IF NOT EXISTS idx_listing_category ON article_listing (category_id, created_at, id)',
+    'CREATE INDEX IF NOT EXISTS idx_listing_author ON article_listing (author_id, created_at, id)',
+)
+
+# 每个分类、作者的文章数，随读模型的增删增量维护，列表页不再执行 COUNT(*)
+COUNT_TABLES = (
+    '''CREATE TABLE IF NOT EXISTS category_stats (
+        category_id INTEGER PRIMARY KEY,
+        article_count INTEGER NOT NULL DEFAULT 0
+    )''',
+    '''CREATE TABLE IF NOT EXISTS author_stats (
+        author_id INTEGER PRIMARY KEY,
+        article_count INTEGER NOT NULL DEFAULT 0
+    )''',
+)
+
+# 浏览量更新只改 views 一列；标题、摘要等变化时整行删除后重新生成。
+# 不用 INSERT OR REPLACE：REPLACE 删除旧行时不触发 DELETE 触发器，文章数会多算
+LISTING_TRIGGERS = (
+    f'''CREATE TRIGGER IF NOT EXISTS article_listing_insert AFTER INSERT ON article BEGIN
+        DELETE FROM article_listing WHERE id = new.id;
+        INSERT INTO article_listing ({LISTING_COLUMNS}) {LISTING_SOURCE} WHERE a.id = new.id;
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS article_listing_update
+        AFTER UPDATE OF id, title, content, summary, excerpt, author_id, category_id, created_at ON article BEGIN
+        DELETE FROM article_listing WHERE id = old.id;
+        INSERT INTO article_listing ({LISTING_COLUMNS}) {LISTING_SOURCE} WHERE a.id = new.id;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS article_listing_views AFTER UPDATE OF views ON article BEGIN
+        UPDATE article_listing SET views = new.views WHERE id = new.id;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS article_listing_delete AFTER DELETE ON article BEGIN
+        DELETE FROM article_listing WHERE id = old.id;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS article_listing_author AFTER UPDATE OF username ON user BEGIN
+        UPDATE article_listing SET author_name = new.username WHERE author_id = new.id;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS article_listing_author_delete AFTER DELETE ON user BEGIN
+        DELETE FROM article_listing WHERE author_id = old.id;
+        DELETE FROM author_stats WHERE author_id = old.id;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS article_listing_category AFTER UPDATE OF name ON category BEGIN
+        UPDATE article_listing SET category_name = new.name WHERE category_id = new.id;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS article_listing_category_delete AFTER DELETE ON category BEGIN
+        DELETE FROM article_listing WHERE category_id = old.id;
+        DELETE FROM category_stats WHERE category_id = old.id;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS article_listing_count_insert AFTER INSERT ON article_listing BEGIN
+        INSERT INTO category_stats (category_id, article_count) VALUES (new.category_id, 1)
+            ON CONFLICT (category_id) DO UPDATE SET article_count = article_count + 1;
+        INSERT INTO author_stats (author_id, article_count) VALUES (new.author_id, 1)
+            ON CONFLICT (author_id) DO UPDATE SET article_count = article_count + 1;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS article_listing_count_delete AFTER DELETE ON article_listing BEGIN
+        UPDATE category_stats SET article_count = article_count - 1 WHERE category_id = old.category_id;
+        UPDATE author_stats SET article_count = article_count - 1 WHERE author_id = old.author_id;
+    END''',
+)
+
+# 由读模型重新统计文章数
+RECOUNT_SQL = (
+    'DELETE FROM category_stats',
+    'INSERT INTO category_stats (category_id, article_count) '
+    'SELECT category_id, COUNT(*) FROM article_listing GROUP BY category_id',
+    'DELETE FROM author_stats',
+    'INSERT INTO author_stats (author_id, article_count) '
+    'SELECT author_id, COUNT(*) FROM article_listing GROUP BY author_id',
+)
+
+# 与 RECOUNT_SQL 的统计结果不一致的计数，返回 (计数表, id)
+COUNT_CHECK_SQL = '''
+    SELECT 'category', category_id FROM (
+        SELECT category_id, COUNT(*) FROM article_listing GROUP BY category_id
+        EXCEPT SELECT category_id, article_count FROM category_stats WHERE article_count != 0)
+    UNION ALL
+    SELECT 'category', category_id FROM (
+        SELECT category_id, article_count FROM category_stats WHERE article_count != 0
+        EXCEPT SELECT category_id, COUNT(*) FROM article_listing GROUP BY category_id)
+    UNION ALL
+    SELECT 'author', author_id FROM (
+        SELECT author_id, COUNT(*) FROM article_listing GROUP BY author_id
+        EXCEPT SELECT author_id, article_count FROM author_stats WHERE article_count != 0)
+    UNION ALL
+    SELECT 'author', author_id FROM (
+        SELECT author_id, article_count FROM author_stats WHERE article_count != 0
+        EXCEPT SELECT author_id, COUNT(*) FROM article_listing GROUP BY author_id)
+'''
+
+# 分类页、作者页可以按这两列过滤，值为 (过滤列, 名称和文章数的查询)
+LISTING_FILTERS = {
+    'category': ('category_id', '''
+        SELECT c.name, COALESCE(s.article_count, 0) FROM category c
+        LEFT JOIN category_stats s ON s.category_id = c.id WHERE c.id = ?
+    '''),
+    'author': ('author_id', '''
+        SELECT u.username, COALESCE(s.article_count, 0) FROM user u
+        LEFT JOIN author_stats s ON s.author_id = u.id WHERE u.id = ?
+    '''),
+}
+
+# 列表页卡片需要的列
+CARD_COLUMNS = 'id, title, summary, created_at, views, author_name, category_name, author_id, category_id, excerpt'
+
+def listing_query(position=None, kind=None, owner_id=None, limit=PAGE_SIZE + 1):
+    conditions, params = [], []
+    if kind is not None:
+        conditions.append(f'{LISTING_FILTERS[kind][0]} = ?')
+        params.append(owner_id)
+    if position:
+        conditions.append('(created_at, id) < (?, ?)')
+        params.extend(position)
+    where = 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+    return f'''
+        SELECT {CARD_COLUMNS}
+        FROM article_listing {where}
+        ORDER BY created_at DESC, id DESC
+        LIMIT ?
+    ''', params + [limit]
+
+# 分类页、作者页的标题
+LISTING_LABELS = {'category': '分类', 'author': '作者'}
+
+# 一页文章列表，每页多取一行判断是否有下一页。返回
+# (id, title, summary, created_at, views, author_name, category_name, author_id, category_id, excerpt)
+def list_articles(conn, position=None, kind=None, owner_id=None, limit=PAGE_SIZE + 1):
+    return conn.execute(*listing_query(position, kind, owner_id, limit)).fetchall()
+
+# 按给定顺序取出一组文章（列与 list_articles 相同），已删除的文章跳过。按主键查找，与文章总数无关
+def articles_by_id(conn, article_ids):
+    if not article_ids:
+        return []
+    placeholders = ', '.join('?' * len(article_ids))
+    rows = {row[0]: row for row in conn.execute(
+        f'SELECT {CARD_COLUMNS} FROM article_listing WHERE id IN ({placeholders})', article_ids)}
+    return [rows[article_id] for article_id in article_ids if article_id in rows]
+
+# 分类或作者的名称和文章数，不存在时返回 None
+def listing_owner(conn, kind, owner_id):
+    return conn.execute(LISTING_FILTERS[kind][1], (owner_id,)).fetchone()
+
+# 各列表查询应使用的索引；EXPLAIN QUERY PLAN 中没有用到该索引或需要临时排序时视为退化
+QUERY_PLANS = (
+    ('首页', None, 'idx_listing_created'),
+    ('分类页', 'category', 'idx_listing_category'),
+    ('作者页', 'author', 'idx_listing_author'),
+)
+
+def explain_listing(conn, kind=None, position=None):
+    sql, params = listing_query(position, kind, 1)
+    return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+
+# 检查首页、分类页、作者页（第一页和翻页）的查询计划，返回 [(名称, 是否符合预期, 计划)]
+def check_query_plans(conn):
+    results = []
+    for name, kind, index in QUERY_PLANS:
+        for suffix, position in (('', None), ('翻页', ('9999-12-31 00:00:00', 0))):
+            plan = explain_listing(conn, kind, position)
+            ok = any(index in line for line in plan) and not any('TEMP B-TREE' in line for line in plan)
+            results.append((name + suffix, ok, plan))
+    return results
+
+def listing_triggers_missing(conn):
+    names = {row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'article_listing_%'")}
+    return len(names) < len(LISTING_TRIGGERS)
+
+def ensure_listing(conn):
+    create_listing(conn)
+    conn.commit()
+
+# 建表、索引和触发器；触发器不全（新库、旧库升级或批量导入中断）时重新生成整张表。
+# 摘要来自 article 的预计算列，旧库一次升级多个版本时这一步在加列的迁移之前执行，先补齐列。
+# 不提交事务（供迁移在同一个事务中执行）
+def create_listing(conn):
+    add_content_columns(conn)
+    cursor = conn.cursor()
+    missing = listing_triggers_missing(conn)
+    cursor.execute(LISTING_TABLE)
+    for sql in COUNT_TABLES + LISTING_INDEXES + LISTING_TRIGGERS:
+        cursor.execute(sql)
+    if missing:
+        rebuild_listing(conn, commit=False)
+
+def rebuild_listing(conn, commit=True):
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM article_listing')
+    cursor.execute(f'INSERT INTO article_listing ({LISTING_COLUMNS}) {LISTING_SOURCE}')
+    count = cursor.rowcount
+    for sql in RECOUNT_SQL:
+        cursor.execute(sql)
+    if commit:
+        conn.commit()
+    return count
+
+# 比较读模型与连接查询的结果，返回各类不一致的文章 id（最多 limit 个）。
+# 两次查询在同一个读事务中执行，看到的是同一个快照
+def check_listing(conn, limit=20):
+    started = not conn.in_transaction
+    if started:
+        conn.execute('BEGIN')
+    try:
+        expected = {row[0] for row in conn.execute(
+            f'SELECT id FROM ({LISTING_SOURCE} EXCEPT SELECT {LISTING_COLUMNS} FROM article_listing)')}
+        actual = {row[0] for row in conn.execute(
+            f'SELECT id FROM (SELECT {LISTING_COLUMNS} FROM article_listing EXCEPT {LISTING_SOURCE})')}
+        rows = conn.execute('SELECT COUNT(*) FROM article_listing').fetchone()[0]
+        counts = conn.execute(COUNT_CHECK_SQL).fetchall()
+    finally:
+        if started:
+            conn.rollback()
+    mismatched = sorted(expected & actual)
+    return {
+        'rows': rows,
+        'missing': sorted(expected - actual)[:limit],
+        'missing_count': len(expected - actual),
+        'mismatched': mismatched[:limit],
+        'mismatched_count': len(mismatched),
+        'extra': sorted(actual - expected)[:limit],
+        'extra_count': len(actual - expected),
+        'counts': sorted(set(counts))[:limit],
+        'counts_count': len(set(counts)),
+    }
+
+def is_consistent(report):
+    return not (report['missing_count'] or report['mismatched_count'] or report['extra_count']
+                or report['counts_count'])
+
+def format_check(report):
+    if is_consistent(report):
+        return f"读模型一致: {report['rows']} 行"
+    lines = [f"读模型不一致: {report['rows']} 行"]
+    for key, label in (('missing', '缺少'), ('mismatched', '内容不同'), ('extra', '多余')):
+        if report[f'{key}_count']:
+            lines.append(f"  {label} {report[f'{key}_count']} 篇: {report[key]}")
+    if report['counts_count']:
+        lines.append(f"  文章数不对 {report['counts_count']} 个: {report['counts']}")
+    return '\n'.join(lines)
+
+def connect(path):
+    conn = sqlite3.connect(path)
+    apply_pragmas(conn)
+    return conn
+
+def cmd_check(args):
+    conn = connect(args.db)
+    try:
+        start = time.perf_counter()
+        report = check_listing(conn, args.limit)
+        print(format_check(report))
+        print(f'检查耗时 {time.perf_counter() - start:.2f} s')
+        if not is_consistent(report):
+            if args.repair:
+                print(f'重建读模型: {rebuild_listing(conn)} 行')
+            else:
+                sys.exit(1)
+    finally:
+        conn.close()
+
+def cmd_rebuild(args):
+    conn = connect(args.db)
+    try:
+        start = time.perf_counter()
+        ensure_listing(conn)
+        count = rebuild_listing(conn)
+        print(f'重建读模型: {count} 行, {time.perf_counter() - start:.2f} s')
+    finally:
+        conn.close()
+
+def cmd_plans(args):
+    conn = connect(args.db)
+    try:
+        ensure_listing(conn)
+        results = check_query_plans(conn)
+    finally:
+        conn.close()
+    for name, ok, plan in results:
+        print(f"{name}: {'使用索引' if ok else '未使用预期索引'}")
+        for line in plan:
+            print(f'    {line}')
+    if not all(ok for _, ok, _ in results):
+        sys.exit(1)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='文章列表读模型的检查、重建与查询计划检查')
+    parser.add_argument('--db', default='blog.db', help='数据库文件')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    check = sub.add_parser('check', help='与连接查询的结果逐行比较，不一致时退出码为 1')
+    check.add_argument('--limit', type=int, default=20, help='每类最多列出的文章 id 数')
+    check.add_argument('--repair', action='store_true', help='不一致时重建读模型')
+    check.set_defaults(func=cmd_check)
+
+    rebuild = sub.add_parser('rebuild', help='由 article、user、category 重新生成读模型')
+    rebuild.set_defaults(func=cmd_rebuild)
+
+    plans = sub.add_parser('plans', help='检查列表查询的 EXPLAIN QUERY PLAN，未使用预期索引时退出码为 1')
+    plans.set_defaults(func=cmd_plans)
+
+    args = parser.parse_args(argv)
+    try:
+        args.func(args)
+    except sqlite3.Error as e:
+        print(f'错误: {e}', file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+import argparse
+import sqlite3
+import sys
+import time
+
+from cache_invalidation import INVALIDATION_SCHEMA
+from content import create_content_columns, insert_article
+from db_pool import apply_pragmas
+from listing import create_listing
+from passwords import hash_password
+from recommendations import RECOMMENDATION_SCHEMA
+from retention import HISTORY_INDEXES
+from search import create_search_index, create_short_search_index
+from session_store import SESSION_SCHEMA
+from trending import TRENDING_SCHEMA, add_worker_column
+
+# 数据库结构的版本记录在 PRAGMA user_version 中。启动时只读取这一个值，
+# 已是最新版本时不执行任何 DDL；否则在一个写事务中依次执行未完成的迁移并更新版本号。
+# 每个迁移都可以在已有部分结构的旧库上重复执行（IF NOT EXISTS），
+# 没有版本号的旧库从第 1 步开始补齐
+
+def create_core_tables(conn):
+    cursor = conn.cursor()
+
+    # 用户表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 分类表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS category (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            description TEXT
+        )
+    ''')
+
+    # 文章表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS article (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            content TEXT NOT NULL,
+            summary TEXT,
+            author_id INTEGER NOT NULL,
+            category_id INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            views INTEGER DEFAULT 0,
+            FOREIGN KEY (author_id) REFERENCES user (id),
+            FOREIGN KEY (category_id) REFERENCES category (id)
+        )
+    ''')
+
+    # 首页按 (created_at, id) 倒序分页
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_article_created ON article (created_at, id)')
+
+    # 浏览历史表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS article_view_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            article_id INTEGER NOT NULL,
+            viewed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(user_id, article_id),
+            FOREIGN KEY (user_id) REFERENCES user (id),
+            FOREIGN KEY (article_id) REFERENCES article (id)
+        )
+    ''')
+
+def create_history_indexes(conn):
+    for sql in HISTORY_INDEXES:
+        conn.execute(sql)
+
+def create_session_tables(conn):
+    for sql in SESSION_SCHEMA:
+        conn.execute(sql)
+
+# 正文预计算列；读模型的摘要改取预计算的 excerpt，删掉旧的插入、更新触发器后重新生成触发器和整张表。
+# 已有文章的预计算列为空，由 python content.py backfill 补齐
+def create_content_tables(conn):
+    create_content_columns(conn)
+    conn.execute('DROP TRIGGER IF EXISTS article_listing_insert')
+    conn.execute('DROP TRIGGER IF EXISTS article_listing_update')
+    create_listing(conn)
+
+def create_trending_tables(conn):
+    for sql in TRENDING_SCHEMA:
+        conn.execute(sql)
+
+def create_recommendation_tables(conn):
+    for sql in RECOMMENDATION_SCHEMA:
+        conn.execute(sql)
+
+def create_invalidation_tables(conn):
+    for sql in INVALIDATION_SCHEMA:
+        conn.execute(sql)
+
+# (版本号, 说明, 迁移函数)；迁移函数不提交事务。只能在末尾追加，不能修改已发布的步骤
+MIGRATIONS = (
+    (1, '用户、分类、文章和浏览历史表', create_core_tables),
+    (2, '浏览历史的覆盖索引和清理索引', create_history_indexes),
+    (3, '全文搜索索引', create_search_index),
+    (4, '登录会话表', create_session_tables),
+    (5, '文章列表读模型和分类、作者文章数', create_listing),
+    (6, '文章正文的预计算列（HTML、摘要、字数、阅读时间）', create_content_tables),
+    (7, '热门文章榜快照', create_trending_tables),
+    (8, '相关文章推荐的共现计数和结果表', create_recommendation_tables),
+    (9, '多进程部署的缓存失效记录', create_invalidation_tables),
+    (10, '热门文章榜快照按工作进程分开保存', add_worker_column),
+    (11, '一两个字的短词搜索索引', create_short_search_index),
+)
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def pending_migrations(version, target=LATEST_VERSION):
+    return [migration for migration in MIGRATIONS if version < migration[0] <= target]
+
+# 执行未完成的迁移，返回执行了的 [(版本号, 说明)]。
+# BEGIN IMMEDIATE 先拿到写锁再确认版本号，多个进程同时启动时只有一个执行迁移
+def migrate(conn, target=LATEST_VERSION):
+    if schema_version(conn) >= target:
+        return []
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        pending = pending_migrations(schema_version(conn), target)
+        for version, description, step in pending:
+            step(conn)
+        if pending:
+            conn.execute(f'PRAGMA user_version = {pending[-1][0]}')
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return [(version, description) for version, description, _ in pending]
+
+# 演示数据，由 seed 命令显式写入；库中已有用户时不写入
+DEMO_USER = ('demo', 'demo@example.com', 'demo123')
+DEMO_CATEGORIES = (
+    ('技术', '技术相关文章'),
+    ('生活', '生活感悟'),
+    ('学习', '学习笔记'),
+)
+DEMO_ARTICLES = (
+    ('Flask入门指南', 'Flask是一个轻量级的Python Web框架，非常适合快速开发Web应用。本文将介绍Flask的基础知识，包括路由、模板、表单处理等核心概念。通过学习本文，你将能够使用Flask构建简单的Web应用。', '本文介绍了Flask框架的基础知识和使用方法', 1, 1),
+    ('Python装饰器详解', '装饰器是Python中一个非常强大的功能，它可以让你在不修改原函数代码的情况下，为函数添加新的功能。本文将深入讲解装饰器的工作原理，并通过实际例子演示如何使用装饰器。', '深入理解Python装饰器的原理和应用', 1, 1),
+    ('我的编程学习之路', '从开始接触编程到现在，已经有好几年的时间了。在这个过程中，我遇到了很多挑战，也收获了很多宝贵的经验。希望通过分享我的学习经历，能够帮助到正在学习编程的朋友们。', '分享我的编程学习经验和心得体会', 1, 3),
+)
+
+def seed_demo(conn):
+    cursor = conn.cursor()
+    if cursor.execute('SELECT 1 FROM user LIMIT 1').fetchone():
+        return False
+    username, email, password = DEMO_USER
+    cursor.execute('INSERT INTO user (username, email, password_hash) VALUES (?, ?, ?)',
+                   (username, email, hash_password(password)))
+    cursor.executemany('INSERT INTO category (name, description) VALUES (?, ?)', DEMO_CATEGORIES)
+    for article in DEMO_ARTICLES:
+        insert_article(conn, *article)
+    conn.commit()
+    return True
+
+def connect(path):
+    conn = sqlite3.connect(path)
+    apply_pragmas(conn)
+    return conn
+
+def cmd_status(args):
+    conn = connect(args.db)
+    try:
+        version = schema_version(conn)
+    finally:
+        conn.close()
+    print(f'当前版本: {version}，最新版本: {LATEST_VERSION}')
+    for number, description, _ in pending_migrations(version):
+        print(f'  待执行 {number}: {description}')
+
+def cmd_migrate(args):
+    conn = connect(args.db)
+    try:
+        start = time.perf_counter()
+        applied = migrate(conn)
+    finally:
+        conn.close()
+    for number, description in applied:
+        print(f'已执行 {number}: {description}')
+    print(f'数据库版本 {LATEST_VERSION}，耗时 {time.perf_counter() - start:.3f} s')
+
+def cmd_seed(args):
+    conn = connect(args.db)
+    try:
+        migrate(conn)
+        if seed_demo(conn):
+            print(f'已写入演示数据，账号 {DEMO_USER[0]}/{DEMO_USER[2]}')
+        else:
+            print('库中已有用户，未写入演示数据')
+    finally:
+        conn.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='数据库迁移与演示数据')
+    parser.add_argument('--db', default='blog.db', help='数据库文件')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    status = sub.add_parser('status', help='显示当前版本和待执行的迁移')
+    status.set_defaults(func=cmd_status)
+
+    upgrade = sub.add_parser('migrate', help='执行待执行的迁移')
+    upgrade.set_defaults(func=cmd_migrate)
+
+    seed = sub.add_parser('seed', help='迁移到最新版本并写入演示用户、分类和文章')
+    seed.set_defaults(func=cmd_seed)
+
+    args = parser.parse_args(argv)
+    try:
+        args.func(args)
+    except sqlite3.Error as e:
+        print(f'错误: {e}', file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
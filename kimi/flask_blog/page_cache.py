@@ -0,0 +1,99 @@
+import threading
+from collections import OrderedDict
+
+# 页面缓存：保存渲染好的页面，按 LRU 淘汰并限制总字节数。
+# 每个条目带若干标签（如 index、article:1），数据变化时按标签失效。
+class PageCache:
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._size = 0
+        self._epoch = 0
+        self._tag_generations = {}
+        self._lock = threading.Lock()
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    # 渲染前取得令牌，写入时若这些标签期间被失效过则放弃写入，避免缓存旧数据
+    def token(self, tags):
+        with self._lock:
+            return self._token(tags)
+
+    def _token(self, tags):
+        return (self._epoch,) + tuple(self._tag_generations.get(tag, 0) for tag in tags)
+
+    def set(self, key, value, tags=(), token=None, size=None):
+        size = len(value) if size is None else size
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            if token is not None and token != self._token(tags):
+                return False
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, frozenset(tags), size)
+            self._size += size
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while self._size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+        return True
+
+    def _remove(self, key):
+        value, tags, size = self._entries.pop(key)
+        self._size -= size
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def invalidate(self, *tags):
+        with self._lock:
+            removed = 0
+            for tag in tags:
+                self._tag_generations[tag] = self._tag_generations.get(tag, 0) + 1
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+                    removed += 1
+            self.invalidations += removed
+            return removed
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._tags.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+def article_tags(article_ids):
+    return [f'article:{article_id}' for article_id in article_ids]
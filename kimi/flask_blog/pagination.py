@@ -0,0 +1,27 @@
+import base64
+import binascii
+
+PAGE_SIZE = 20
+
+# 游标分页：游标记录上一页最后一篇文章的 (created_at, id)，
+# 下一页查询 (created_at, id) < 游标，配合 (created_at, id) 复合索引无需 OFFSET
+def encode_cursor(created_at, article_id):
+    raw = f'{created_at}|{article_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, article_id = raw.rsplit('|', 1)
+        return created_at, int(article_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError(f'无效的分页游标: {cursor}')
+
+# rows 多取一行用于判断是否还有下一页，返回 (当前页, 下一页游标)
+def split_page(rows, page_size, key):
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    return rows, encode_cursor(*key(rows[-1]))
@@ -0,0 +1,162 @@
+import concurrent.futures
+import hashlib
+import hmac
+import multiprocessing
+import os
+import secrets
+import string
+import threading
+import time
+
+# 与 werkzeug.security.generate_password_hash 相同的格式：pbkdf2:sha256:<迭代次数>$<盐>$<十六进制哈希>，
+# 两个服务器写入的哈希可以互相校验
+PBKDF2_ITERATIONS = 600000
+SALT_LENGTH = 16
+SALT_CHARS = string.ascii_letters + string.digits
+
+class HasherBusy(Exception):
+    pass
+
+def hash_password(password, iterations=PBKDF2_ITERATIONS):
+    salt = ''.join(secrets.choice(SALT_CHARS) for _ in range(SALT_LENGTH))
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), iterations).hex()
+    return f'pbkdf2:sha256:{iterations}${salt}${digest}'
+
+# 早期 simple_blog 使用的无盐 sha256（64 位十六进制）
+def is_legacy_hash(stored):
+    return len(stored) == 64 and all(c in string.hexdigits for c in stored)
+
+def verify_password(stored, password):
+    if is_legacy_hash(stored):
+        return hmac.compare_digest(stored.lower(), hashlib.sha256(password.encode()).hexdigest())
+    try:
+        method, salt, digest = stored.split('$', 2)
+        name, *params = method.split(':')
+        if name == 'pbkdf2':
+            hash_name, iterations = params
+            actual = hashlib.pbkdf2_hmac(hash_name, password.encode(), salt.encode(), int(iterations)).hex()
+        elif name == 'scrypt':
+            n, r, p = map(int, params)
+            actual = hashlib.scrypt(password.encode(), salt=salt.encode(), n=n, r=r, p=p,
+                                    maxmem=132 * n * r * p).hex()
+        else:
+            return False
+    except ValueError:
+        return False
+    return hmac.compare_digest(actual, digest)
+
+# 旧格式或迭代次数低于当前设置的哈希在下次登录成功时重新计算
+def needs_rehash(stored, iterations=PBKDF2_ITERATIONS):
+    if is_legacy_hash(stored):
+        return True
+    method = stored.split('$', 1)[0].split(':')
+    return method[0] == 'pbkdf2' and (len(method) != 3 or method[1] != 'sha256' or int(method[2]) < iterations)
+
+# 在工作进程中执行：校验密码，需要升级时顺带算出新哈希，返回 (是否正确, 新哈希或 None)
+def verify_and_rehash(stored, password, iterations=PBKDF2_ITERATIONS):
+    if not verify_password(stored, password):
+        return False, None
+    if needs_rehash(stored, iterations):
+        return True, hash_password(password, iterations)
+    return True, None
+
+# 密码哈希进程池：哈希计算刻意设计得很慢，放到独立进程中执行，不占用请求线程所在进程的 CPU 和 GIL。
+# 排队中的任务数达到 max_pending 时直接抛出 HasherBusy，由调用方返回 503；
+# workers 为 0 时在调用线程中直接计算（仍受 max_pending 限制）。
+class PasswordHasher:
+    def __init__(self, workers=None, max_pending=None, timeout=10.0, iterations=PBKDF2_ITERATIONS):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.max_pending = max_pending or max(2, self.workers * 2)
+        self.timeout = timeout
+        self.iterations = iterations
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        # 统计信息
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.rehashed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # forkserver 从干净的进程派生工作进程，不继承请求线程和数据库连接
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                self._executor = concurrent.futures.ProcessPoolExecutor(self.workers, mp_context=context)
+            return self._executor
+
+    def _run(self, func, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise HasherBusy(f'密码哈希队列已满（{self.max_pending}）')
+            self._pending += 1
+        start = time.perf_counter()
+        if not self.workers:
+            try:
+                return func(*args)
+            finally:
+                self._done(start)
+        try:
+            future = self._get_executor().submit(func, *args)
+        except BaseException:
+            self._done(start)
+            raise
+        # 超时返回后任务仍在进程池中执行，执行完才释放名额
+        future.add_done_callback(lambda future: self._done(start))
+        try:
+            return future.result(self.timeout)
+        except concurrent.futures.TimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            raise HasherBusy(f'密码哈希超过 {self.timeout} 秒')
+
+    def _done(self, start):
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._pending -= 1
+            self.completed += 1
+            self.wait_total += elapsed
+            self.wait_max = max(self.wait_max, elapsed)
+
+    # 提前启动工作进程，第一个登录请求不必等待进程池启动
+    def warm_up(self):
+        if self.workers:
+            executor = self._get_executor()
+            for future in [executor.submit(os.getpid) for _ in range(self.workers)]:
+                future.result()
+
+    def hash(self, password):
+        return self._run(hash_password, password, self.iterations)
+
+    # 返回 (是否正确, 新哈希或 None)；旧哈希校验通过时同时返回升级后的哈希
+    def verify(self, stored, password):
+        ok, new_hash = self._run(verify_and_rehash, stored, password, self.iterations)
+        if new_hash:
+            with self._lock:
+                self.rehashed += 1
+        return ok, new_hash
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'pending': self._pending,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+                'rehashed': self.rehashed,
+                'wait_avg_ms': round(self.wait_total * 1000 / self.completed, 3) if self.completed else 0.0,
+                'wait_max_ms': round(self.wait_max * 1000, 3),
+            }
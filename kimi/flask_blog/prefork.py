@@ -0,0 +1,154 @@
+import os
+import select
+import signal
+import subprocess
+import threading
+import time
+
+# 多进程（prefork）部署：监督进程启动 processes 个工作进程，每个工作进程是一个完整的服务器
+# （自己的线程池、连接池和各种缓存，互不共享），各自用 SO_REUSEPORT 监听同一端口，由内核分配连接，
+# 渲染不再受一个进程的 GIL 限制。
+#
+# 工作进程用 subprocess 启动新的解释器而不是 fork 当前进程：滚动重启时加载的是新代码，
+# 也不用担心 fork 时其他线程持有的锁。工作进程开始监听后向 ready_fd 写入一个字节，监督进程据此判断就绪。
+#
+# 信号：SIGTERM / SIGINT 优雅停止所有工作进程；SIGHUP 滚动重启，逐个先启动新进程、就绪后再停止旧进程，
+# 端口始终有进程在监听。工作进程意外退出时自动重启，连续快速退出时重启间隔指数增长
+class Supervisor:
+    def __init__(self, command, processes, ready_timeout=30.0, stop_timeout=30.0, max_backoff=30.0):
+        # command(index, ready_fd) 返回第 index 个工作进程的命令行
+        self.command = command
+        self.processes = processes
+        self.ready_timeout = ready_timeout
+        self.stop_timeout = stop_timeout
+        self.max_backoff = max_backoff
+        self.workers = {}
+        self._failures = {}
+        self._restart_at = {}
+        self._stopping = False
+        self._reload_requested = False
+        # 统计信息
+        self.restarts = 0
+        self.reloads = 0
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        signal.signal(signal.SIGHUP, self._request_reload)
+        try:
+            started = [(index, self._spawn(index)) for index in range(self.processes)]
+            for index, (proc, ready) in started:
+                self.workers[index] = (proc, time.monotonic())
+                if self._wait_ready(proc, ready):
+                    log(f'工作进程 {index} (pid {proc.pid}) 就绪')
+            while not self._stopping:
+                if self._reload_requested:
+                    self._reload_requested = False
+                    self._reload()
+                self._reap()
+                time.sleep(0.2)
+        finally:
+            self._stop_all()
+
+    def _request_stop(self, signum, frame):
+        self._stopping = True
+
+    def _request_reload(self, signum, frame):
+        self._reload_requested = True
+
+    def _spawn(self, index):
+        ready, ready_fd = os.pipe()
+        try:
+            proc = subprocess.Popen(self.command(index, ready_fd), pass_fds=(ready_fd,))
+        finally:
+            os.close(ready_fd)
+        return proc, ready
+
+    # 等待工作进程写入就绪字节；进程退出（管道关闭）或超时返回 False
+    def _wait_ready(self, proc, ready):
+        try:
+            deadline = time.monotonic() + self.ready_timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    log(f'工作进程 pid {proc.pid} 在 {self.ready_timeout:.0f} 秒内没有就绪')
+                    return False
+                if select.select([ready], [], [], remaining)[0]:
+                    return os.read(ready, 1) == b'1'
+        finally:
+            os.close(ready)
+
+    # 回收退出的工作进程并按退避间隔重启。运行不到 10 秒就退出算作一次连续失败
+    def _reap(self):
+        now = time.monotonic()
+        for index, (proc, started_at) in list(self.workers.items()):
+            if proc is not None and proc.poll() is not None:
+                failures = self._failures.get(index, 0) + 1 if now - started_at < 10 else 1
+                self._failures[index] = failures
+                delay = min(self.max_backoff, 0.5 * 2 ** (failures - 1))
+                log(f'工作进程 {index} (pid {proc.pid}) 退出，退出码 {proc.returncode}，{delay:.1f} 秒后重启')
+                self.workers[index] = (None, now)
+                self._restart_at[index] = now + delay
+        for index, restart_at in list(self._restart_at.items()):
+            if now >= restart_at and not self._stopping:
+                del self._restart_at[index]
+                proc, ready = self._spawn(index)
+                self.workers[index] = (proc, time.monotonic())
+                self.restarts += 1
+                if self._wait_ready(proc, ready):
+                    log(f'工作进程 {index} (pid {proc.pid}) 已重启')
+
+    def _reload(self):
+        self.reloads += 1
+        log('滚动重启工作进程')
+        for index in range(self.processes):
+            if self._stopping:
+                return
+            proc, ready = self._spawn(index)
+            if not self._wait_ready(proc, ready):
+                # 新代码无法启动时保留旧进程，放弃本次重启
+                self._terminate([proc])
+                log(f'工作进程 {index} 的新进程没有就绪，停止滚动重启')
+                return
+            old, _ = self.workers[index]
+            self.workers[index] = (proc, time.monotonic())
+            self._restart_at.pop(index, None)
+            if old is not None:
+                self._terminate([old])
+            log(f'工作进程 {index} 已替换为 pid {proc.pid}')
+
+    # SIGTERM 让工作进程处理完手上的请求后退出，超时仍未退出的强制结束
+    def _terminate(self, processes):
+        for proc in processes:
+            if proc.poll() is None:
+                proc.terminate()
+        deadline = time.monotonic() + self.stop_timeout
+        for proc in processes:
+            try:
+                proc.wait(max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+
+    def _stop_all(self):
+        self._terminate([proc for proc, _ in self.workers.values() if proc is not None])
+        log('所有工作进程已停止')
+
+def log(message):
+    print(f'[prefork {os.getpid()}] {message}', flush=True)
+
+# 工作进程开始监听后调用
+def notify_ready(ready_fd):
+    os.write(ready_fd, b'1')
+    os.close(ready_fd)
+
+# 监督进程意外退出（例如被 SIGKILL）时工作进程也退出，不留下无人管理的进程
+def watch_parent(interval=1.0):
+    parent = os.getppid()
+
+    def run():
+        while os.getppid() == parent:
+            time.sleep(interval)
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    threading.Thread(target=run, name='watch-parent', daemon=True).start()
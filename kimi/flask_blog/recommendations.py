@@ -0,0 +1,327 @@
+import argparse
+import sqlite3
+import sys
+import time
+
+from db_pool import apply_pragmas
+
+# “读过这篇的人也在看”：由 article_view_history 统计文章两两共同的读者数（共现矩阵），
+# 按余弦相似度 共同读者数 / sqrt(读者数A * 读者数B) 为每篇文章取前 N 篇存进 article_related，
+# 文章页只按主键读这张表。
+#
+# 共现计数和各文章读者数持久保存，并记录已处理到的浏览历史 id（水位）。增量构建只读取有新记录的用户的历史，
+# 只统计至少一端是新记录的文章对，再只为计数有变化的文章重新排名。浏览历史会按保留期清理，
+# 已经计入的共现不受影响。计算用 numpy 向量化完成，只有离线构建需要安装 numpy
+RECOMMENDATION_SCHEMA = (
+    # 每对文章只存一行，article_id < other_id
+    '''CREATE TABLE IF NOT EXISTS article_cooccurrence (
+        article_id INTEGER NOT NULL,
+        other_id INTEGER NOT NULL,
+        users INTEGER NOT NULL,
+        PRIMARY KEY (article_id, other_id)
+    ) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS article_viewers (
+        article_id INTEGER PRIMARY KEY,
+        users INTEGER NOT NULL
+    )''',
+    '''CREATE TABLE IF NOT EXISTS article_related (
+        article_id INTEGER NOT NULL,
+        rank INTEGER NOT NULL,
+        related_id INTEGER NOT NULL,
+        score REAL NOT NULL,
+        PRIMARY KEY (article_id, rank)
+    ) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS recommendation_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        history_watermark INTEGER NOT NULL,
+        built_at TIMESTAMP
+    )''',
+)
+
+# 每篇文章保存的相关文章数
+RELATED_LIMIT = 10
+# 文章页显示的相关文章数
+RELATED_SHOWN = 5
+# 每个用户只统计最近浏览的这么多篇，文章对的数量最多为 用户数 * MAX_PER_USER^2
+MAX_PER_USER = 50
+# 共同读者少于该值的文章对不推荐
+MIN_USERS = 2
+
+# 已删除的文章通过连接读模型过滤掉
+RELATED_SQL = '''
+    SELECT l.id, l.title FROM article_related r
+    JOIN article_listing l ON l.id = r.related_id
+    WHERE r.article_id = ?
+    ORDER BY r.rank
+    LIMIT ?
+'''
+
+class RecommendationError(Exception):
+    pass
+
+# 文章页使用，返回 [(id, title)]
+def related_articles(conn, article_id, limit=RELATED_SHOWN):
+    return conn.execute(RELATED_SQL, (article_id, limit)).fetchall()
+
+def import_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RecommendationError('计算推荐需要 numpy: pip install -r requirements-build.txt')
+    return numpy
+
+def connect(path):
+    conn = sqlite3.connect(path)
+    apply_pragmas(conn)
+    return conn
+
+# 进度输出到 stderr；periodic 的进度约每 2 秒输出一次
+class Progress:
+    def __init__(self, enabled=True, interval=2.0):
+        self.enabled = enabled
+        self.interval = interval
+        self.start = self.last_report = time.perf_counter()
+
+    def __call__(self, message, periodic=False):
+        now = time.perf_counter()
+        if not self.enabled or periodic and now - self.last_report < self.interval:
+            return
+        self.last_report = now
+        print(f'[{now - self.start:7.2f} s] {message}', file=sys.stderr)
+
+def watermark(conn):
+    row = conn.execute('SELECT history_watermark FROM recommendation_state WHERE id = 1').fetchone()
+    return row[0] if row else 0
+
+# 读取 (user_id, article_id, id) 为 int64 数组，同一用户的记录相邻、按浏览时间倒序。
+# 增量构建时只读取在 (low, high] 之间有新记录的用户
+def load_history(conn, np, low, high, progress, chunk=200000):
+    if low == 0:
+        cursor = conn.execute('''SELECT user_id, article_id, id FROM article_view_history WHERE id <= ?
+                                 ORDER BY user_id DESC, viewed_at DESC''', (high,))
+    else:
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS recommendation_users (user_id INTEGER PRIMARY KEY)')
+        conn.execute('DELETE FROM temp.recommendation_users')
+        conn.execute('''INSERT INTO temp.recommendation_users
+                        SELECT DISTINCT user_id FROM article_view_history WHERE id > ? AND id <= ?''', (low, high))
+        cursor = conn.execute('''SELECT h.user_id, h.article_id, h.id FROM temp.recommendation_users u
+                                 JOIN article_view_history h ON h.user_id = u.user_id
+                                 WHERE h.id <= ? ORDER BY h.user_id DESC, h.viewed_at DESC''', (high,))
+    parts = []
+    rows = 0
+    while True:
+        batch = cursor.fetchmany(chunk)
+        if not batch:
+            break
+        parts.append(np.array(batch, dtype=np.int64))
+        rows += len(batch)
+        progress(f'读取浏览历史: {rows} 行', periodic=True)
+    if not parts:
+        return np.empty((0, 3), dtype=np.int64)
+    return np.concatenate(parts)
+
+# 同一用户浏览过的文章两两配对，只保留至少一端是新记录（id > low）的文章对。
+# 按间隔 distance 错位比较整列，每轮是一次向量运算，轮数不超过 max_per_user。
+# 返回 (article_id, other_id, 共同读者增量)，article_id < other_id，以及 (读者数的 article_id, 增量)
+def count_pairs(np, history, low, max_per_user, progress):
+    users, articles, ids = history[:, 0], history[:, 1], history[:, 2]
+    count = len(users)
+    starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]]) if count else np.empty(0, dtype=np.int64)
+    position = np.arange(count) - np.repeat(starts, np.diff(np.r_[starts, count]))
+    keep = position < max_per_user
+    users, articles, new = users[keep], articles[keep], ids[keep] > low
+
+    sources, targets = [], []
+    for distance in range(1, max_per_user):
+        same = users[distance:] == users[:-distance]
+        if not same.any():
+            break
+        fresh = same & (new[distance:] | new[:-distance])
+        left, right = articles[:-distance][fresh], articles[distance:][fresh]
+        sources.append(np.minimum(left, right))
+        targets.append(np.maximum(left, right))
+    progress(f'生成文章对: {sum(len(part) for part in sources)} 对')
+
+    viewer_ids, viewer_counts = np.unique(articles[new], return_counts=True)
+    if not sources:
+        empty = np.empty(0, dtype=np.int64)
+        return (empty, empty, empty), (viewer_ids, viewer_counts)
+    stride = int(articles.max()) + 1
+    keys, counts = np.unique(np.concatenate(sources) * stride + np.concatenate(targets), return_counts=True)
+    progress(f'合并文章对: {len(keys)} 对不同的文章')
+    return (keys // stride, keys % stride, counts), (viewer_ids, viewer_counts)
+
+# 每篇文章按得分取前 limit 篇，返回 (article_id, rank, related_id, score)。
+# (source, target) 只含一个方向时传 mirror=True，两个方向各排一次
+def rank_related(np, source, target, together, viewers, limit, min_users, mirror=False):
+    keep = together >= min_users
+    source, target, together = source[keep], target[keep], together[keep]
+    if mirror:
+        source, target = np.concatenate([source, target]), np.concatenate([target, source])
+        together = np.concatenate([together, together])
+    score = together / np.sqrt(viewers[source].astype(np.float64) * viewers[target])
+    order = np.lexsort((target, -score, source))
+    source, target, score = source[order], target[order], score[order]
+    count = len(source)
+    starts = np.flatnonzero(np.r_[True, source[1:] != source[:-1]]) if count else np.empty(0, dtype=np.int64)
+    rank = np.arange(count) - np.repeat(starts, np.diff(np.r_[starts, count]))
+    keep = rank < limit
+    return source[keep], rank[keep], target[keep], score[keep]
+
+# 增量排名的候选：有变化的文章对（两个方向），加上这些文章原来的相关文章，返回它们当前的共现计数
+def load_candidates(conn, np, source, target):
+    conn.execute('''CREATE TEMP TABLE IF NOT EXISTS recommendation_candidates (
+        article_id INTEGER NOT NULL,
+        other_id INTEGER NOT NULL,
+        PRIMARY KEY (article_id, other_id)
+    ) WITHOUT ROWID''')
+    conn.execute('DELETE FROM temp.recommendation_candidates')
+    conn.executemany('INSERT INTO temp.recommendation_candidates (article_id, other_id) VALUES (?, ?)',
+                     zip(np.concatenate([source, target]).tolist(), np.concatenate([target, source]).tolist()))
+    conn.execute('''INSERT OR IGNORE INTO temp.recommendation_candidates (article_id, other_id)
+                    SELECT r.article_id, r.related_id FROM article_related r
+                    WHERE r.article_id IN (SELECT DISTINCT article_id FROM temp.recommendation_candidates)''')
+    rows = conn.execute('''SELECT t.article_id, t.other_id, c.users FROM temp.recommendation_candidates t
+                           JOIN article_cooccurrence c ON c.article_id = min(t.article_id, t.other_id)
+                                AND c.other_id = max(t.article_id, t.other_id)''')
+    candidates = np.array(rows.fetchall(), dtype=np.int64).reshape(-1, 3)
+    return candidates[:, 0], candidates[:, 1], candidates[:, 2]
+
+def write_rows(conn, sql, columns, progress, label, chunk=200000):
+    total = len(columns[0])
+    for offset in range(0, total, chunk):
+        conn.executemany(sql, zip(*(column[offset:offset + chunk].tolist() for column in columns)))
+        progress(f'{label}: {min(offset + chunk, total)} / {total}', periodic=True)
+
+# 构建或增量更新推荐。先在读事务中完成计算，再在一个写事务中写入计数、相关文章和新水位，
+# 中途失败不会重复计入同一批浏览记录。返回统计信息
+def build(db_path, full=False, max_per_user=MAX_PER_USER, limit=RELATED_LIMIT, min_users=MIN_USERS, verbose=True):
+    np = import_numpy()
+    progress = Progress(verbose)
+    start = time.perf_counter()
+    conn = connect(db_path)
+    try:
+        conn.execute('BEGIN')
+        low = 0 if full else watermark(conn)
+        full = low == 0
+        high = conn.execute('SELECT COALESCE(MAX(id), 0) FROM article_view_history').fetchone()[0]
+        if high <= low:
+            conn.rollback()
+            progress('没有新的浏览记录')
+            return {'full': full, 'history_rows': 0, 'new_rows': 0, 'pairs': 0, 'articles': 0, 'related_rows': 0,
+                    'watermark': low, 'seconds': time.perf_counter() - start}
+        history = load_history(conn, np, low, high, progress)
+        progress(f'读取浏览历史 {len(history)} 行')
+        (source, target, counts), (viewer_ids, viewer_counts) = count_pairs(np, history, low, max_per_user, progress)
+        pairs = len(source)
+        conn.rollback()
+
+        conn.execute('BEGIN IMMEDIATE')
+        if full:
+            for table in ('article_cooccurrence', 'article_viewers', 'article_related'):
+                conn.execute(f'DELETE FROM {table}')
+        upsert = '' if full else ' ON CONFLICT (article_id, other_id) DO UPDATE SET users = users + excluded.users'
+        write_rows(conn, 'INSERT INTO article_cooccurrence (article_id, other_id, users) VALUES (?, ?, ?)' + upsert,
+                   (source, target, counts), progress, '写入共现计数')
+        write_rows(conn, '''INSERT INTO article_viewers (article_id, users) VALUES (?, ?)
+                            ON CONFLICT (article_id) DO UPDATE SET users = users + excluded.users''',
+                   (viewer_ids, viewer_counts), progress, '写入读者数')
+        progress(f'写入共现计数 {len(source)} 行、读者数 {len(viewer_ids)} 行')
+
+        # 只为共现有变化的文章重新排名。全量构建时表原本为空，刚算出的就是全部计数；
+        # 增量时候选只取原来的前 N 篇和这次有变化的文章对，不读取整行共现计数。
+        # 其他文章的读者数增加会让它的得分下降，候选之外的文章因此可能排进前 N，定期全量构建纠正
+        touched = np.unique(np.concatenate([source, target]))
+        mirror = True
+        if not full and len(touched):
+            mirror = False
+            source, target, counts = load_candidates(conn, np, source, target)
+            conn.execute('''DELETE FROM article_related
+                            WHERE article_id IN (SELECT DISTINCT article_id FROM temp.recommendation_candidates)''')
+        viewer_rows = conn.execute('SELECT article_id, users FROM article_viewers').fetchall()
+        viewers = np.zeros(max([row[0] for row in viewer_rows], default=0) + 1, dtype=np.int64)
+        if viewer_rows:
+            table = np.array(viewer_rows, dtype=np.int64)
+            viewers[table[:, 0]] = table[:, 1]
+        related = rank_related(np, source, target, counts, viewers, limit, min_users, mirror)
+        write_rows(conn, 'INSERT INTO article_related (article_id, rank, related_id, score) VALUES (?, ?, ?, ?)',
+                   related, progress, '写入相关文章')
+        conn.execute('''INSERT INTO recommendation_state (id, history_watermark, built_at)
+                        VALUES (1, ?, CURRENT_TIMESTAMP)
+                        ON CONFLICT (id) DO UPDATE SET history_watermark = excluded.history_watermark,
+                            built_at = excluded.built_at''', (high,))
+        conn.commit()
+        progress(f'为 {len(touched)} 篇文章写入 {len(related[0])} 条相关文章')
+        return {
+            'full': full,
+            'history_rows': len(history),
+            'new_rows': int((history[:, 2] > low).sum()),
+            'pairs': pairs,
+            'articles': len(touched),
+            'related_rows': len(related[0]),
+            'watermark': high,
+            'seconds': time.perf_counter() - start,
+        }
+    finally:
+        conn.close()
+
+def cmd_build(args):
+    report = build(args.db, args.full, args.max_per_user, args.limit, args.min_users, verbose=not args.quiet)
+    print(f"{'全量' if report['full'] else '增量'}构建: 读取 {report['history_rows']} 行浏览历史"
+          f"（新记录 {report['new_rows']} 行）, 共现计数更新 {report['pairs']} 行, 更新 {report['articles']} 篇文章的 {report['related_rows']} 条相关文章, "
+          f"水位 {report['watermark']}, 耗时 {report['seconds']:.2f} s")
+
+def cmd_status(args):
+    conn = connect(args.db)
+    try:
+        state = conn.execute('SELECT history_watermark, built_at FROM recommendation_state WHERE id = 1').fetchone()
+        low = state[0] if state else 0
+        pending = conn.execute('SELECT COUNT(*) FROM article_view_history WHERE id > ?', (low,)).fetchone()[0]
+        articles = conn.execute('SELECT COUNT(DISTINCT article_id) FROM article_related').fetchone()[0]
+    finally:
+        conn.close()
+    print(f"上次构建: {state[1] if state else '从未构建'}, 水位 {low}, 待处理浏览记录 {pending} 行, "
+          f"有相关文章的文章 {articles} 篇")
+
+def cmd_show(args):
+    conn = connect(args.db)
+    try:
+        rows = conn.execute('''SELECT r.rank, r.related_id, r.score, l.title FROM article_related r
+                               LEFT JOIN article_listing l ON l.id = r.related_id
+                               WHERE r.article_id = ? ORDER BY r.rank''', (args.article_id,)).fetchall()
+    finally:
+        conn.close()
+    if not rows:
+        print('没有相关文章')
+    for rank, related_id, score, title in rows:
+        print(f'{rank + 1:>3}. [{related_id}] {title or "（已删除）"}  {score:.3f}')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='根据浏览历史计算“读过这篇的人也在看”')
+    parser.add_argument('--db', default='blog.db', help='数据库文件')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = sub.add_parser('build', help='处理上次构建之后的新浏览记录（首次为全量）')
+    build_parser.add_argument('--full', action='store_true', help='丢弃已有计数，从全部浏览历史重新计算')
+    build_parser.add_argument('--max-per-user', type=int, default=MAX_PER_USER, help='每个用户统计最近浏览的文章数')
+    build_parser.add_argument('--limit', type=int, default=RELATED_LIMIT, help='每篇文章保存的相关文章数')
+    build_parser.add_argument('--min-users', type=int, default=MIN_USERS, help='推荐所需的最少共同读者数')
+    build_parser.add_argument('--quiet', action='store_true', help='不输出进度')
+    build_parser.set_defaults(func=cmd_build)
+
+    status = sub.add_parser('status', help='显示上次构建时间和待处理的浏览记录数')
+    status.set_defaults(func=cmd_status)
+
+    show = sub.add_parser('show', help='显示一篇文章的相关文章')
+    show.add_argument('article_id', type=int)
+    show.set_defaults(func=cmd_show)
+
+    args = parser.parse_args(argv)
+    try:
+        args.func(args)
+    except (sqlite3.Error, RecommendationError) as e:
+        print(f'错误: {e}', file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
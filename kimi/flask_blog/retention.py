@@ -0,0 +1,327 @@
+import argparse
+import datetime
+import re
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+from db_pool import apply_pragmas
+
+# 浏览历史页只显示最近 HISTORY_DAYS 天的记录，默认也只保留这么久
+HISTORY_DAYS = 30
+
+# 浏览历史的索引：
+#   (user_id, viewed_at, article_id) 覆盖“某用户最近 N 天的浏览记录，按时间倒序”查询，不用回表；
+#   (viewed_at) 供清理任务按时间顺序找出过期记录
+HISTORY_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS idx_history_user_viewed ON article_view_history (user_id, viewed_at, article_id)',
+    'CREATE INDEX IF NOT EXISTS idx_history_viewed ON article_view_history (viewed_at)',
+)
+
+ARCHIVE_SCHEMA = 'archive'
+ARCHIVE_PREFIX = 'article_view_history_'
+
+# 每批删除的过期记录，在同一个写事务中先归档再删除
+EXPIRED_BATCH_SQL = '''
+    SELECT id FROM article_view_history
+    WHERE viewed_at < ?
+    ORDER BY viewed_at, id
+    LIMIT ?
+'''
+
+def ensure_history_indexes(conn):
+    cursor = conn.cursor()
+    for sql in HISTORY_INDEXES:
+        cursor.execute(sql)
+    conn.commit()
+
+def cutoff_timestamp(days, now=None):
+    now = now or datetime.datetime.utcnow()
+    return (now - datetime.timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+
+# 归档库按月分表，例如 article_view_history_202409
+def partition_name(month):
+    if not re.fullmatch(r'\d{4}-\d{2}', month or ''):
+        month = '0000-00'
+    return ARCHIVE_PREFIX + month.replace('-', '')
+
+def ensure_partition(cursor, name):
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {ARCHIVE_SCHEMA}.{name} (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            article_id INTEGER NOT NULL,
+            viewed_at TIMESTAMP
+        )
+    ''')
+
+@contextmanager
+def attached_archive(conn, path):
+    if not path:
+        yield False
+        return
+    conn.execute(f'ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}', (path,))
+    try:
+        yield True
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        conn.execute(f'DETACH DATABASE {ARCHIVE_SCHEMA}')
+
+# 在当前写事务中删除一批过期记录（archive 时先归档），返回 (删除行数, 归档行数)。不提交事务
+def delete_expired(conn, cutoff, batch_size, archive=False):
+    cursor = conn.cursor()
+    ids = [row[0] for row in cursor.execute(EXPIRED_BATCH_SQL, (cutoff, batch_size))]
+    if not ids:
+        return 0, 0
+    placeholders = ','.join('?' * len(ids))
+    archived = 0
+    if archive:
+        months = cursor.execute(f'''
+            SELECT DISTINCT substr(viewed_at, 1, 7) FROM article_view_history
+            WHERE id IN ({placeholders})
+        ''', ids).fetchall()
+        for (month,) in months:
+            name = partition_name(month)
+            ensure_partition(cursor, name)
+            cursor.execute(f'''
+                INSERT OR REPLACE INTO {ARCHIVE_SCHEMA}.{name} (id, user_id, article_id, viewed_at)
+                SELECT id, user_id, article_id, viewed_at FROM article_view_history
+                WHERE id IN ({placeholders}) AND substr(viewed_at, 1, 7) IS ?
+            ''', ids + [month])
+            archived += cursor.rowcount
+    cursor.execute(f'DELETE FROM article_view_history WHERE id IN ({placeholders})', ids)
+    return cursor.rowcount, archived
+
+# 清理一批过期记录，返回 (删除行数, 归档行数, 写锁持有时间)。
+# BEGIN IMMEDIATE 一开始就拿到写锁，选出的记录在提交前不会被浏览写缓冲更新。
+# 指定 write 时（见 db_writer）这一批交给写线程执行，不再自己持有写锁，耗时包括在写线程排队的时间
+def prune_batch(conn, cutoff, batch_size, archive=False, write=None):
+    start = time.perf_counter()
+    if write is not None:
+        deleted, archived = write(delete_expired, cutoff, batch_size, archive)
+        return deleted, archived, time.perf_counter() - start
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        deleted, archived = delete_expired(conn, cutoff, batch_size, archive)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return deleted, archived, time.perf_counter() - start
+
+# 删除 cutoff 之前的浏览记录。每批是一个短事务，批与批之间暂停 pause 秒让出写锁，
+# 不会长时间阻塞浏览记录落库。归档需要在 conn 上 ATTACH 归档库（事务中不能 ATTACH），
+# 所以指定 archive_path 时不使用 write。返回清理报告
+def prune_history(conn, cutoff, batch_size=500, pause=0.01, archive_path=None, max_batches=None, write=None):
+    report = {'cutoff': cutoff, 'pruned': 0, 'archived': 0, 'batches': 0,
+              'seconds': 0.0, 'lock_seconds': 0.0, 'max_lock_ms': 0.0}
+    start = time.perf_counter()
+    with attached_archive(conn, archive_path) as archive:
+        while max_batches is None or report['batches'] < max_batches:
+            deleted, archived, held = prune_batch(conn, cutoff, batch_size, archive,
+                                                 None if archive else write)
+            report['lock_seconds'] += held
+            report['max_lock_ms'] = max(report['max_lock_ms'], held * 1000)
+            if not deleted:
+                break
+            report['pruned'] += deleted
+            report['archived'] += archived
+            report['batches'] += 1
+            if deleted < batch_size:
+                break
+            if pause:
+                time.sleep(pause)
+    if report['pruned']:
+        # 删除产生的 WAL 及时回写主库；PASSIVE 不等待读者，不影响正在进行的请求
+        conn.execute('PRAGMA wal_checkpoint(PASSIVE)')
+    report['seconds'] = time.perf_counter() - start
+    return report
+
+def format_report(report):
+    return (f"清理浏览历史: 删除 {report['pruned']} 行（归档 {report['archived']} 行）, "
+            f"{report['batches']} 批, 耗时 {report['seconds']:.2f} s, "
+            f"持有写锁 {report['lock_seconds']:.2f} s（单批最长 {report['max_lock_ms']:.1f} ms）, "
+            f"截止时间 {report['cutoff']}")
+
+# 浏览历史的定期清理：后台线程每隔 interval 秒删除超过 days 天的记录，
+# 指定 archive_path 时先把这些记录按月归档到该数据库文件。
+#
+# connection 与 ViewBuffer 相同，是一个返回上下文管理器的函数，上下文产出 DB-API 连接。
+# 指定 write 时（见 db_writer）不归档的清理交给写线程执行，connection 只用于回写 WAL；归档仍在 connection 上进行
+class HistoryPruner:
+    def __init__(self, connection, days=HISTORY_DAYS, interval=3600.0, batch_size=500, pause=0.01, archive_path=None,
+                 write=None):
+        self.connection = connection
+        self.write = write
+        self.days = days
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.archive_path = archive_path
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        # 统计信息
+        self.runs = 0
+        self.errors = 0
+        self.pruned = 0
+        self.archived = 0
+        self.seconds = 0.0
+        self.last_report = None
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='history-pruner', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.interval)
+            if self._stopping:
+                break
+            self._wakeup.clear()
+            try:
+                report = self.run_once()
+                if report['pruned']:
+                    print(format_report(report))
+            except Exception:
+                with self._lock:
+                    self.errors += 1
+                traceback.print_exc()
+
+    def run_once(self, now=None):
+        with self._run_lock, self.connection() as conn:
+            report = prune_history(conn, cutoff_timestamp(self.days, now), self.batch_size, self.pause,
+                                   self.archive_path, write=self.write)
+        with self._lock:
+            self.runs += 1
+            self.pruned += report['pruned']
+            self.archived += report['archived']
+            self.seconds += report['seconds']
+            self.last_report = report
+        return report
+
+    def metrics(self):
+        with self._lock:
+            last = self.last_report or {}
+            return {
+                'retention_days': self.days,
+                'runs': self.runs,
+                'errors': self.errors,
+                'pruned': self.pruned,
+                'archived': self.archived,
+                'seconds_total': round(self.seconds, 3),
+                'last_pruned': last.get('pruned', 0),
+                'last_seconds': round(last.get('seconds', 0.0), 3),
+                'last_max_lock_ms': round(last.get('max_lock_ms', 0.0), 3),
+            }
+
+# 各月份的记录数：主库按 viewed_at 统计，归档库按分表统计
+def history_stats(conn, archive_path=None):
+    live = conn.execute('''
+        SELECT substr(viewed_at, 1, 7), COUNT(*) FROM article_view_history
+        GROUP BY 1 ORDER BY 1
+    ''').fetchall()
+    archived = []
+    with attached_archive(conn, archive_path) as archive:
+        if archive:
+            names = conn.execute(f'''
+                SELECT name FROM {ARCHIVE_SCHEMA}.sqlite_master
+                WHERE type = 'table' AND name LIKE '{ARCHIVE_PREFIX}%' ORDER BY name
+            ''').fetchall()
+            for (name,) in names:
+                count = conn.execute(f'SELECT COUNT(*) FROM {ARCHIVE_SCHEMA}.{name}').fetchone()[0]
+                archived.append((name, count))
+    return live, archived
+
+def connect(path):
+    conn = sqlite3.connect(path)
+    apply_pragmas(conn)
+    return conn
+
+# 清理任务使用独立连接，不占用处理请求的连接池
+@contextmanager
+def dedicated_connection(path):
+    conn = connect(path)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+def cmd_prune(args):
+    conn = connect(args.db)
+    try:
+        ensure_history_indexes(conn)
+        cutoff = cutoff_timestamp(args.days)
+        if args.dry_run:
+            count = conn.execute('SELECT COUNT(*) FROM article_view_history WHERE viewed_at < ?',
+                                 (cutoff,)).fetchone()[0]
+            print(f'将删除 {count} 行（截止时间 {cutoff}）')
+            return
+        report = prune_history(conn, cutoff, args.batch, args.pause, args.archive)
+        print(format_report(report))
+        if args.vacuum and report['pruned']:
+            # VACUUM 重写整个库并持有写锁，只适合在维护窗口手动执行
+            start = time.perf_counter()
+            conn.execute('VACUUM')
+            print(f'VACUUM: {time.perf_counter() - start:.2f} s')
+    finally:
+        conn.close()
+
+def cmd_stats(args):
+    conn = connect(args.db)
+    try:
+        live, archived = history_stats(conn, args.archive)
+        print('主库:')
+        for month, count in live:
+            print(f'  {month}: {count}')
+        if args.archive:
+            print(f'归档库 {args.archive}:')
+            for name, count in archived:
+                print(f'  {name}: {count}')
+        free, total = (conn.execute(f'PRAGMA {name}').fetchone()[0] for name in ('freelist_count', 'page_count'))
+        print(f'空闲页: {free} / {total}')
+    finally:
+        conn.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='浏览历史的清理与归档')
+    parser.add_argument('--db', default='blog.db', help='数据库文件')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    prune = sub.add_parser('prune', help='删除超过保留期的浏览记录')
+    prune.add_argument('--days', type=int, default=HISTORY_DAYS, help='保留天数')
+    prune.add_argument('--batch', type=int, default=500, help='每个事务删除的行数')
+    prune.add_argument('--pause', type=float, default=0.01, help='批与批之间的暂停（秒）')
+    prune.add_argument('--archive', help='归档数据库文件，删除前按月写入该库')
+    prune.add_argument('--dry-run', action='store_true', help='只统计将删除的行数')
+    prune.add_argument('--vacuum', action='store_true', help='清理后执行 VACUUM 回收磁盘空间')
+    prune.set_defaults(func=cmd_prune)
+
+    stats = sub.add_parser('stats', help='按月统计浏览记录')
+    stats.add_argument('--archive', help='同时统计该归档数据库')
+    stats.set_defaults(func=cmd_stats)
+
+    args = parser.parse_args(argv)
+    try:
+        args.func(args)
+    except sqlite3.Error as e:
+        print(f'错误: {e}', file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
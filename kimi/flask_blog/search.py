@@ -0,0 +1,277 @@
+import html
+import re
+import threading
+import traceback
+
+from content import CJK_PATTERN
+from db_writer import direct_writer
+
+SEARCH_PAGE_SIZE = 10
+# 排名靠后的结果意义不大，限制翻页深度避免过大的 OFFSET
+MAX_SEARCH_PAGE = 50
+
+# 全文索引：trigram 分词按三个字符切分，中文无需分词也能做子串匹配。
+# 外部内容表指向 article，由触发器保持同步；浏览量更新不涉及索引列，不会触发重建。
+SEARCH_SCHEMA = (
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS article_fts USING fts5(
+        title, content, summary,
+        content='article', content_rowid='id', tokenize='trigram'
+    )''',
+    '''CREATE TRIGGER IF NOT EXISTS article_fts_insert AFTER INSERT ON article BEGIN
+        INSERT INTO article_fts (rowid, title, content, summary)
+        VALUES (new.id, new.title, new.content, new.summary);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS article_fts_delete AFTER DELETE ON article BEGIN
+        INSERT INTO article_fts (article_fts, rowid, title, content, summary)
+        VALUES ('delete', old.id, old.title, old.content, old.summary);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS article_fts_update AFTER UPDATE OF title, content, summary ON article BEGIN
+        INSERT INTO article_fts (article_fts, rowid, title, content, summary)
+        VALUES ('delete', old.id, old.title, old.content, old.summary);
+        INSERT INTO article_fts (rowid, title, content, summary)
+        VALUES (new.id, new.title, new.content, new.summary);
+    END''',
+)
+
+# trigram 索引只能匹配至少三个字符的词
+MIN_MATCH_LENGTH = 3
+
+# 短词索引：一两个字的词（常见的中文双字词）trigram 无法匹配。连续的汉字切成相互重叠的双字词，
+# 末尾再加上最后一个字（“看到鲸鱼” -> “看到 到鲸 鲸鱼 鱼”），用空格隔开后由 unicode61 分词：
+# 查询双字词只查一个词，单字按前缀查询（每个字都是某个词的第一个字）；拉丁字母仍按整词（查询时按前缀）匹配。
+# 切分在 Python 中完成，触发器做不到：文章写入时触发器只把 id 放进待索引队列，
+# 由 index_pending 分批补进索引；还在队列中的文章搜索时用 LIKE 单独检查
+SHORT_SEARCH_SCHEMA = (
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS article_fts_short USING fts5(
+        title, content, summary, tokenize='unicode61'
+    )''',
+    'CREATE TABLE IF NOT EXISTS article_fts_pending (article_id INTEGER PRIMARY KEY)',
+    '''CREATE TRIGGER IF NOT EXISTS article_fts_short_insert AFTER INSERT ON article BEGIN
+        INSERT OR IGNORE INTO article_fts_pending (article_id) VALUES (new.id);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS article_fts_short_delete AFTER DELETE ON article BEGIN
+        DELETE FROM article_fts_short WHERE rowid = old.id;
+        DELETE FROM article_fts_pending WHERE article_id = old.id;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS article_fts_short_update AFTER UPDATE OF title, content, summary ON article BEGIN
+        DELETE FROM article_fts_short WHERE rowid = old.id;
+        INSERT OR IGNORE INTO article_fts_pending (article_id) VALUES (new.id);
+    END''',
+)
+
+# 高亮标记先用控制字符占位，转义 HTML 后再替换成 <mark>
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+def ensure_search_index(conn):
+    create_search_index(conn)
+    conn.commit()
+
+# 建立全文索引和同步触发器，不提交事务（供迁移在同一个事务中执行）
+def create_search_index(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'article_fts'")
+    exists = cursor.fetchone()
+    for sql in SEARCH_SCHEMA:
+        cursor.execute(sql)
+    if not exists:
+        # 首次建立索引时导入已有文章
+        cursor.execute("INSERT INTO article_fts (article_fts) VALUES ('rebuild')")
+
+# 建立短词索引，已有文章全部放进队列并建好索引。不提交事务（供迁移在同一个事务中执行）
+def create_short_search_index(conn):
+    for sql in SHORT_SEARCH_SCHEMA:
+        conn.execute(sql)
+    rebuild_short_search_index(conn)
+
+def rebuild_short_search_index(conn):
+    conn.execute('DELETE FROM article_fts_short')
+    conn.execute('INSERT OR IGNORE INTO article_fts_pending (article_id) SELECT id FROM article')
+    while index_pending(conn, 5000):
+        pass
+
+CJK_RUN_PATTERN = re.compile(CJK_PATTERN.pattern + '+')
+
+# 连续的汉字切成双字词，tail 时末尾加上最后一个字；查询时不加，双字词本身就是完整的词
+def segment(text, tail=True):
+    def split(match):
+        run = match.group()
+        words = [run[i:i + 2] for i in range(len(run) - 1)]
+        if tail or len(run) == 1:
+            words.append(run[-1])
+        return ' ' + ' '.join(words) + ' '
+    return CJK_RUN_PATTERN.sub(split, text or '')
+
+# 为队列中的前 batch_size 篇文章建立短词索引，返回处理的篇数。不提交事务（通过 write 执行）
+def index_pending(conn, batch_size=500):
+    ids = [row[0] for row in conn.execute(
+        'SELECT article_id FROM article_fts_pending ORDER BY article_id LIMIT ?', (batch_size,))]
+    if not ids:
+        return 0
+    placeholders = ','.join('?' * len(ids))
+    rows = conn.execute(f'SELECT id, title, content, summary FROM article WHERE id IN ({placeholders})', ids).fetchall()
+    cursor = conn.cursor()
+    cursor.execute(f'DELETE FROM article_fts_short WHERE rowid IN ({placeholders})', ids)
+    cursor.executemany('INSERT INTO article_fts_short (rowid, title, content, summary) VALUES (?, ?, ?, ?)',
+                       [(article_id, segment(title), segment(content), segment(summary))
+                        for article_id, title, content, summary in rows])
+    cursor.execute(f'DELETE FROM article_fts_pending WHERE article_id IN ({placeholders})', ids)
+    return len(ids)
+
+def parse_query(q):
+    terms = [term for term in (q or '').split() if term]
+    long_terms = [term for term in terms if len(term) >= MIN_MATCH_LENGTH]
+    short_terms = [term for term in terms if len(term) < MIN_MATCH_LENGTH]
+    return long_terms, short_terms
+
+def match_expression(terms):
+    # 每个词作为短语，词与词之间为 AND
+    return ' '.join('"' + term.replace('"', '""') + '"' for term in terms)
+
+# 短词切分后作为短语匹配，末尾加 * 按前缀匹配：单字匹配以它开头的双字词，拉丁字母匹配以它开头的单词。
+# 只有标点的词切不出任何词，不参与匹配
+def short_match_expression(terms):
+    return ' '.join('"' + segment(term, tail=False).replace('"', '""') + '" *' for term in terms)
+
+def like_pattern(term):
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+def render_marked(text):
+    return html.escape(text or '').replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+
+# 没有可用于 MATCH 的词时，在正文中找到第一个命中位置截取片段
+def make_snippet(text, terms, width=40):
+    text = text or ''
+    position = min((text.find(term) for term in terms if term in text), default=-1)
+    if position < 0:
+        return html.escape(text[:width * 2])
+    start = max(0, position - width // 2)
+    snippet = text[start:start + width * 2]
+    for term in terms:
+        snippet = snippet.replace(term, MARK_START + term + MARK_END)
+    return ('…' if start else '') + render_marked(snippet) + ('…' if start + width * 2 < len(text) else '')
+
+# 页码限制在 1 到 MAX_SEARCH_PAGE 之间；页面的翻页链接也要用限制后的页码
+def search_page(page):
+    return min(max(page, 1), MAX_SEARCH_PAGE)
+
+# 搜索文章，返回 (结果列表, 是否还有下一页)；结果为 (id, 标题 HTML, 摘要片段 HTML, 发布时间)。
+# 最后一页（MAX_SEARCH_PAGE）之后没有下一页
+def search_articles(conn, q, page=1, page_size=SEARCH_PAGE_SIZE):
+    long_terms, short_terms = parse_query(q)
+    short_terms = [term for term in short_terms if any(ch.isalnum() for ch in term)]
+    if not long_terms and not short_terms:
+        return [], False
+    page = search_page(page)
+    offset = (page - 1) * page_size
+    like_sql = ''
+    like_params = []
+    for term in short_terms:
+        like_sql += " AND (a.title LIKE ? ESCAPE '\\' OR a.content LIKE ? ESCAPE '\\')"
+        like_params += [like_pattern(term), like_pattern(term)]
+    cursor = conn.cursor()
+    if long_terms:
+        short_sql = ''
+        short_params = []
+        if short_terms:
+            # 短词用短词索引过滤，还在待索引队列中的文章用 LIKE 检查
+            short_sql = f'''
+                AND (a.id IN (SELECT rowid FROM article_fts_short WHERE article_fts_short MATCH ?)
+                     OR (a.id IN (SELECT article_id FROM article_fts_pending){like_sql}))'''
+            short_params = [short_match_expression(short_terms)] + like_params
+        # bm25 排序，标题权重最高
+        cursor.execute(f'''
+            SELECT a.id, highlight(article_fts, 0, ?, ?), snippet(article_fts, 1, ?, ?, '…', 24), a.created_at
+            FROM article_fts
+            JOIN article a ON a.id = article_fts.rowid
+            WHERE article_fts MATCH ?{short_sql}
+            ORDER BY bm25(article_fts, 10.0, 1.0, 5.0)
+            LIMIT ? OFFSET ?
+        ''', [MARK_START, MARK_END, MARK_START, MARK_END, match_expression(long_terms)]
+              + short_params + [page_size + 1, offset])
+        rows = [(article_id, render_marked(title), render_marked(snippet), created_at)
+                for article_id, title, snippet, created_at in cursor.fetchall()]
+    else:
+        # 只有短词时在短词索引中按 bm25 排序；待索引队列中的文章（通常只有刚写入的几篇）用 LIKE 检查，排在最后
+        # （CROSS JOIN 固定从队列出发）。索引中是切分后的文本，片段从原文截取
+        cursor.execute(f'''
+            SELECT a.id, a.title, a.content, a.created_at
+            FROM (
+                SELECT rowid AS id, bm25(article_fts_short, 10.0, 1.0, 5.0) AS rank
+                FROM article_fts_short WHERE article_fts_short MATCH ?
+                UNION ALL
+                SELECT a.id, 0.0 FROM article_fts_pending p CROSS JOIN article a ON a.id = p.article_id
+                WHERE 1{like_sql}
+            ) matched
+            JOIN article a ON a.id = matched.id
+            ORDER BY matched.rank, a.created_at DESC
+            LIMIT ? OFFSET ?
+        ''', [short_match_expression(short_terms)] + like_params + [page_size + 1, offset])
+        rows = [(article_id, make_snippet(title, short_terms, 20), make_snippet(content, short_terms), created_at)
+                for article_id, title, content, created_at in cursor.fetchall()]
+    return rows[:page_size], len(rows) > page_size and page < MAX_SEARCH_PAGE
+
+# 后台补建短词索引：每隔 interval 秒检查待索引队列，有文章时按 batch_size 篇一批交给 write 执行，直到队列清空。
+# connection、write 与 ViewBuffer 相同
+class SearchIndexer:
+    def __init__(self, connection, interval=5.0, batch_size=200, write=None):
+        self.connection = connection
+        self.write = write or direct_writer(connection)
+        self.interval = interval
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        # 统计信息
+        self.runs = 0
+        self.errors = 0
+        self.indexed = 0
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='search-indexer', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping:
+            try:
+                self.run_once()
+            except Exception:
+                with self._lock:
+                    self.errors += 1
+                traceback.print_exc()
+            self._wakeup.wait(self.interval)
+
+    # 返回本次补建的篇数；队列为空时不占用写线程
+    def run_once(self):
+        indexed = 0
+        with self._run_lock:
+            with self.connection() as conn:
+                waiting = conn.execute('SELECT 1 FROM article_fts_pending LIMIT 1').fetchone()
+            while waiting and not self._stopping:
+                count = self.write(index_pending, self.batch_size)
+                indexed += count
+                waiting = count == self.batch_size
+        with self._lock:
+            self.runs += 1
+            self.indexed += indexed
+        return indexed
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'runs': self.runs,
+                'errors': self.errors,
+                'indexed': self.indexed,
+            }
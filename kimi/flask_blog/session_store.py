@@ -0,0 +1,216 @@
+import base64
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from db_writer import direct_writer
+
+# 会话表：登录时把列表页、导航栏需要的用户字段一并写入，
+# 解析会话时不再查询 user 表。库中只保存会话 id 的哈希，数据库泄露不会暴露可用的会话
+SESSION_SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS user_session (
+        id_hash TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        username TEXT NOT NULL,
+        email TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_user_session_expires ON user_session (expires_at)',
+    # 未指定密钥时生成一个并保存，重启后已签发的 cookie 仍然有效
+    '''CREATE TABLE IF NOT EXISTS session_secret (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        secret TEXT NOT NULL
+    )''',
+)
+
+def hash_session_id(session_id):
+    return hashlib.blake2b(session_id.encode(), digest_size=16).hexdigest()
+
+# 以下写操作通过 SessionStore.write 执行，提交由调用方负责
+def setup_tables(conn, read_secret):
+    cursor = conn.cursor()
+    for sql in SESSION_SCHEMA:
+        cursor.execute(sql)
+    secret = None
+    if read_secret:
+        cursor.execute('INSERT OR IGNORE INTO session_secret (id, secret) VALUES (1, ?)', (secrets.token_hex(32),))
+        cursor.execute('SELECT secret FROM session_secret WHERE id = 1')
+        secret = cursor.fetchone()[0]
+    cursor.execute('DELETE FROM user_session WHERE expires_at <= ?', (time.time(),))
+    return secret
+
+def insert_session(conn, id_hash, user, expires_at):
+    conn.execute('''
+        INSERT INTO user_session (id_hash, user_id, username, email, expires_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (id_hash, user['id'], user['username'], user['email'], expires_at))
+
+def delete_session(conn, id_hash):
+    conn.execute('DELETE FROM user_session WHERE id_hash = ?', (id_hash,))
+
+def purge_sessions(conn, now):
+    conn.execute('DELETE FROM user_session WHERE expires_at <= ?', (now,))
+
+# 会话存储：内存中按会话 id 缓存用户信息（带过期时间，超过 max_entries 按 LRU 淘汰），
+# 已登录请求命中缓存时不访问数据库。
+#
+# connection 为 None 时只保存在内存中；否则是一个返回上下文管理器的函数（与 ViewBuffer 相同），
+# 会话同时写入 user_session 表，缓存未命中（例如重启后）时从该表加载；写入通过 write 执行（与 ViewBuffer 相同）。
+# cookie 中的会话 id 带 HMAC 签名，伪造或篡改的值直接拒绝，不会查库。
+class SessionStore:
+    def __init__(self, connection=None, secret=None, ttl=7 * 24 * 3600, max_entries=10000, purge_interval=3600.0,
+                 write=None):
+        self.connection = connection
+        self.write = write or (direct_writer(connection) if connection is not None else None)
+        self.secret = secret.encode() if isinstance(secret, str) else secret
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.purge_interval = purge_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._setup_lock = threading.Lock()
+        self._ready = False
+        self._last_purge = time.time()
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.rejected = 0
+        self.expired = 0
+        self.evictions = 0
+        self.created = 0
+        self.deleted = 0
+
+    # 首次使用时建表、读取或生成签名密钥，并清理已过期的会话
+    def setup(self):
+        if self._ready:
+            return
+        with self._setup_lock:
+            if self._ready:
+                return
+            if self.connection is None:
+                if self.secret is None:
+                    self.secret = secrets.token_bytes(32)
+            else:
+                secret = self.write(setup_tables, self.secret is None)
+                if self.secret is None:
+                    self.secret = secret.encode()
+            self._ready = True
+
+    def _signature(self, session_id):
+        digest = hmac.new(self.secret, session_id.encode(), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest[:18]).decode()
+
+    # 写入 cookie 的值：会话 id 加签名
+    def cookie_value(self, session_id):
+        self.setup()
+        return f'{session_id}.{self._signature(session_id)}'
+
+    # 校验 cookie 签名，返回会话 id；签名不对时返回 None
+    def session_id_from_cookie(self, value):
+        self.setup()
+        session_id, _, signature = (value or '').rpartition('.')
+        if session_id and hmac.compare_digest(signature, self._signature(session_id)):
+            return session_id
+        with self._lock:
+            self.rejected += 1
+        return None
+
+    def create(self, user):
+        self.setup()
+        session_id = secrets.token_urlsafe(32)
+        user = {'id': user['id'], 'username': user['username'], 'email': user['email']}
+        expires_at = time.time() + self.ttl
+        if self.connection is not None:
+            self.write(insert_session, hash_session_id(session_id), user, expires_at)
+        with self._lock:
+            self.created += 1
+            self._put(session_id, user, expires_at)
+        self._maybe_purge()
+        return session_id
+
+    def _put(self, session_id, user, expires_at):
+        self._entries[session_id] = (user, expires_at)
+        self._entries.move_to_end(session_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    # 返回会话对应的用户信息 {'id', 'username', 'email'}，会话不存在或已过期时返回 None
+    def get(self, session_id):
+        if not session_id:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(session_id)
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[session_id]
+                self.expired += 1
+            self.misses += 1
+        if self.connection is None:
+            return None
+        self.setup()
+        with self.connection() as conn:
+            row = conn.execute('''
+                SELECT user_id, username, email, expires_at FROM user_session
+                WHERE id_hash = ? AND expires_at > ?
+            ''', (hash_session_id(session_id), now)).fetchone()
+        if row is None:
+            return None
+        user = {'id': row[0], 'username': row[1], 'email': row[2]}
+        with self._lock:
+            self.loads += 1
+            self._put(session_id, user, row[3])
+        return user
+
+    def delete(self, session_id):
+        if not session_id:
+            return
+        with self._lock:
+            if self._entries.pop(session_id, None) is not None:
+                self.deleted += 1
+        if self.connection is not None:
+            self.setup()
+            self.write(delete_session, hash_session_id(session_id))
+
+    # 其他进程注销了这些会话（参数为会话 id 的哈希），从本进程的缓存中移除。注销很少发生，逐个比较即可
+    def forget(self, id_hashes):
+        id_hashes = set(id_hashes)
+        with self._lock:
+            for session_id in [key for key in self._entries if hash_session_id(key) in id_hashes]:
+                del self._entries[session_id]
+                self.deleted += 1
+
+    # 删除表中已过期的会话，创建会话时顺带执行，间隔不少于 purge_interval 秒
+    def _maybe_purge(self):
+        now = time.time()
+        with self._lock:
+            if now - self._last_purge < self.purge_interval:
+                return
+            self._last_purge = now
+        if self.connection is not None:
+            self.write(purge_sessions, now)
+
+    def metrics(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'loads': self.loads,
+                'rejected': self.rejected,
+                'expired': self.expired,
+                'evictions': self.evictions,
+                'created': self.created,
+                'deleted': self.deleted,
+            }
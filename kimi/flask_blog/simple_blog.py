@@ -1,155 +1,123 @@
 import sqlite3
 import datetime
-import hashlib
 from http.server import HTTPServer, SimpleHTTPRequestHandler
+from http.cookies import SimpleCookie
+from concurrent.futures import ThreadPoolExecutor
 import urllib.parse
+import html
+import argparse
+import signal
+import threading
+import itertools
 import json
 import os
+import select
+import socket
+import sys
 
-# 数据库初始化
+from build_static import StaticSite
+from cache_invalidation import CacheInvalidations
+from content import process_content
+from db_pool import ConnectionPool
+from db_writer import DatabaseWriter
+from instrumentation import Instrumentation, InstrumentedConnection, TimedWriter, current, gauge_lines, phase
+from http_cache import (STATIC_MAX_AGE, CachedPage, compress_body, choose_encoding, file_version,
+                        gzip_compressor, http_date, is_not_modified)
+from listing import LISTING_LABELS, articles_by_id, list_articles, listing_owner
+from migrations import migrate
+from page_cache import PageCache, article_tags
+from pagination import PAGE_SIZE, decode_cursor, split_page
+from passwords import HasherBusy, PasswordHasher
+from prefork import Supervisor, notify_ready, watch_parent
+from recommendations import related_articles
+from retention import HISTORY_DAYS, HistoryPruner, dedicated_connection
+from search import SearchIndexer, search_articles, search_page
+from session_store import SessionStore, hash_session_id
+from streaming import FLUSH, ChunkedWriter
+from template_engine import compile_templates
+from trending import BOARD_LABELS, Trending
+from view_buffer import ViewBuffer
+
+DATABASE = 'blog.db'
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+STATIC_TYPES = {
+    '.css': 'text/css; charset=utf-8',
+    '.js': 'application/javascript; charset=utf-8',
+}
+db_pool = ConnectionPool(DATABASE, factory=InstrumentedConnection)
+# 所有写入交给唯一的写线程，组提交，请求线程之间不再争抢写锁；run_server 中连接池只用于读取。
+# 多进程时每个进程一个写线程，进程之间仍由 SQLite 的忙等待超时协调
+db_writer = DatabaseWriter(lambda: sqlite3.connect(DATABASE, timeout=30.0, check_same_thread=False))
+# 请求埋点：各路由耗时直方图、DB / 渲染 / 写出耗时，慢请求记录和可选的 cProfile 采样
+instrumentation = Instrumentation()
+
+# 数据库初始化：执行未完成的迁移，结构已是最新时只读取 user_version。演示数据由 migrations.py seed 写入。
+# 在启动写线程之前用独立连接执行（连接池是只读的）
 def init_db():
-    conn = sqlite3.connect('blog.db')
-    cursor = conn.cursor()
-    
-    # 用户表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # 分类表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS category (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE NOT NULL,
-            description TEXT
-        )
-    ''')
-    
-    # 文章表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS article (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            content TEXT NOT NULL,
-            summary TEXT,
-            author_id INTEGER NOT NULL,
-            category_id INTEGER NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            views INTEGER DEFAULT 0,
-            FOREIGN KEY (author_id) REFERENCES user (id),
-            FOREIGN KEY (category_id) REFERENCES category (id)
-        )
-    ''')
-    
-    # 浏览历史表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS article_view_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            article_id INTEGER NOT NULL,
-            viewed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(user_id, article_id),
-            FOREIGN KEY (user_id) REFERENCES user (id),
-            FOREIGN KEY (article_id) REFERENCES article (id)
-        )
-    ''')
-    
-    # 创建示例数据
-    cursor.execute('SELECT COUNT(*) FROM user')
-    if cursor.fetchone()[0] == 0:
-        # 创建示例用户
-        password_hash = hashlib.sha256('demo123'.encode()).hexdigest()
-        cursor.execute('INSERT INTO user (username, email, password_hash) VALUES (?, ?, ?)', 
-                      ('demo', 'demo@example.com', password_hash))
-        
-        # 创建示例分类
-        categories = [
-            ('技术', '技术相关文章'),
-            ('生活', '生活感悟'),
-            ('学习', '学习笔记')
-        ]
-        for name, desc in categories:
-            cursor.execute('INSERT INTO category (name, description) VALUES (?, ?)', (name, desc))
-        
-        # 创建示例文章
-        demo_articles = [
-            ('Flask入门指南', 'Flask是一个轻量级的Python Web框架，非常适合快速开发Web应用。本文将介绍Flask的基础知识，包括路由、模板、表单处理等核心概念。通过学习本文，你将能够使用Flask构建简单的Web应用。', '本文介绍了Flask框架的基础知识和使用方法', 1, 1),
-            ('Python装饰器详解', '装饰器是Python中一个非常强大的功能，它可以让你在不修改原函数代码的情况下，为函数添加新的功能。本文将深入讲解装饰器的工作原理，并通过实际例子演示如何使用装饰器。', '深入理解Python装饰器的原理和应用', 1, 1),
-            ('我的编程学习之路', '从开始接触编程到现在，已经有好几年的时间了。在这个过程中，我遇到了很多挑战，也收获了很多宝贵的经验。希望通过分享我的学习经历，能够帮助到正在学习编程的朋友们。', '分享我的编程学习经验和心得体会', 1, 3)
-        ]
-        
-        for title, content, summary, author_id, category_id in demo_articles:
-            cursor.execute('INSERT INTO article (title, content, summary, author_id, category_id) VALUES (?, ?, ?, ?, ?)', 
-                          (title, content, summary, author_id, category_id))
-    
-    conn.commit()
-    conn.close()
+    with dedicated_connection(DATABASE) as conn:
+        for version, description in migrate(conn):
+            print(f'数据库迁移 {version}: {description}')
 
-# 获取数据库连接
+# 获取数据库连接：从连接池借出，with 块结束后归还
 def get_db():
-    return sqlite3.connect('blog.db', check_same_thread=False)
+    return db_pool.connection()
 
-# HTML模板
-def render_template(template_name, **kwargs):
-    templates = {
-        'base': '''<!DOCTYPE html>
+# 渲染好的页面缓存，数据变化时按标签失效
+page_cache = PageCache()
+# 静态文件首次请求时读入内存并预先压缩
+static_files = {}
+
+# 文章新增、修改或浏览量落库后调用，使首页和对应文章页失效（多进程时也通知其他工作进程）
+def invalidate_article_pages(article_ids):
+    tags = ['index', *article_tags(article_ids)]
+    page_cache.invalidate(*tags)
+    invalidations.publish(tags)
+
+# 收到其他工作进程的失效通知：session:<会话 id 哈希> 为注销的会话，其余为页面缓存标签
+def apply_invalidations(tags):
+    sessions = [tag[len('session:'):] for tag in tags if tag.startswith('session:')]
+    if sessions:
+        session_store.forget(sessions)
+    pages = [tag for tag in tags if not tag.startswith('session:')]
+    if pages:
+        page_cache.invalidate(*pages)
+
+invalidations = CacheInvalidations(DATABASE, get_db, apply_invalidations, write=db_writer.run)
+
+# 浏览次数和浏览历史先写入内存，由后台线程批量落库
+view_buffer = ViewBuffer(get_db, on_flush=invalidate_article_pages, write=db_writer.run)
+
+# 记录一次浏览；该用户自己的缓存页面立即失效，保证能看到自己的浏览计数。
+# 多进程时只通知其他进程失效该用户的页面，不为单次浏览落库：其他进程看不到本进程缓冲中的浏览，
+# 本进程下一次批量落库后发布 index 失效（该用户的缓存页面都带 index 标签），最迟 flush_interval 后一致
+def record_view(user, article_id):
+    view_buffer.record(user['id'], article_id)
+    tag = f'user:{user["id"]}'
+    page_cache.invalidate(tag)
+    if process_index is not None:
+        invalidations.publish([tag])
+
+# 热门文章榜：每次文章页访问（包括命中缓存的匿名访问）计入内存中的衰减计数，定期快照到数据库。
+# 多进程时每个工作进程只统计分到自己的访问，内核随机分配连接，相当于按比例抽样，排名近似一致；
+# 各进程分别保存自己的快照，重启后每个进程恢复全部快照合计的一份（按进程数平分）
+trending = Trending(get_db, write=db_writer.run)
+
+# 定期删除超过保留期的浏览历史，可选归档到单独的数据库文件。
+# 删除交给写线程；归档要 ATTACH 归档库，只能在单独的可写连接上进行
+history_pruner = HistoryPruner(lambda: dedicated_connection(DATABASE), write=db_writer.run)
+
+# 新写入或修改的文章在后台补进短词搜索索引
+search_indexer = SearchIndexer(get_db, write=db_writer.run)
+
+# HTML模板，启动时编译一次
+TEMPLATES = {
+    'base': '''<!DOCTYPE html>
 <html lang="zh-CN">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>{title}</title>
-    <style>
-        * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-        body {{ font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; line-height: 1.6; color: #333; background-color: #f8f9fa; }}
-        .container {{ max-width: 1200px; margin: 0 auto; padding: 0 20px; }}
-        header {{ background-color: #fff; box-shadow: 0 2px 4px rgba(0,0,0,0.1); padding: 1rem 0; margin-bottom: 2rem; }}
-        nav {{ display: flex; justify-content: space-between; align-items: center; }}
-        .logo {{ font-size: 1.5rem; font-weight: bold; color: #007bff; text-decoration: none; }}
-        .nav-menu {{ display: flex; list-style: none; gap: 2rem; align-items: center; }}
-        .nav-menu a {{ text-decoration: none; color: #333; font-weight: 500; transition: color 0.3s; }}
-        .nav-menu a:hover {{ color: #007bff; }}
-        .user-menu {{ position: relative; }}
-        .dropdown {{ position: absolute; top: 100%; right: 0; background-color: #fff; box-shadow: 0 4px 6px rgba(0,0,0,0.1); border-radius: 4px; padding: 0.5rem 0; min-width: 150px; display: none; z-index: 1000; }}
-        .dropdown.show {{ display: block; }}
-        .dropdown a {{ display: block; padding: 0.5rem 1rem; color: #333; text-decoration: none; transition: background-color 0.3s; }}
-        .dropdown a:hover {{ background-color: #f8f9fa; color: #007bff; }}
-        .btn {{ display: inline-block; padding: 0.5rem 1rem; background-color: #007bff; color: white; text-decoration: none; border-radius: 4px; border: none; cursor: pointer; transition: background-color 0.3s; }}
-        .btn:hover {{ background-color: #0056b3; }}
-        .btn-outline {{ background-color: transparent; color: #007bff; border: 1px solid #007bff; }}
-        .btn-outline:hover {{ background-color: #007bff; color: white; }}
-        main {{ min-height: calc(100vh - 200px); }}
-        footer {{ background-color: #343a40; color: white; text-align: center; padding: 2rem 0; margin-top: 3rem; }}
-        .flash {{ padding: 1rem; margin-bottom: 1rem; border-radius: 4px; }}
-        .flash-success {{ background-color: #d4edda; color: #155724; border: 1px solid #c3e6cb; }}
-        .flash-error {{ background-color: #f8d7da; color: #721c24; border: 1px solid #f5c6cb; }}
-        .card {{ background-color: white; border-radius: 8px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); padding: 1.5rem; margin-bottom: 1.5rem; }}
-        .card h2 {{ margin-bottom: 1rem; color: #333; }}
-        .card-meta {{ color: #666; font-size: 0.9rem; margin-bottom: 1rem; }}
-        .form-group {{ margin-bottom: 1rem; }}
-        .form-group label {{ display: block; margin-bottom: 0.5rem; font-weight: 500; }}
-        .form-group input, .form-group textarea {{ width: 100%; padding: 0.75rem; border: 1px solid #ddd; border-radius: 4px; font-size: 1rem; }}
-        .hero {{ text-align: center; padding: 3rem 0; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; border-radius: 8px; margin-bottom: 2rem; }}
-        .hero h1 {{ font-size: 2.5rem; margin-bottom: 1rem; }}
-        .hero p {{ font-size: 1.2rem; opacity: 0.9; }}
-        .articles h2 {{ margin-bottom: 2rem; color: #333; }}
-        .history-item {{ background-color: white; border-radius: 8px; padding: 1.5rem; box-shadow: 0 2px 4px rgba(0,0,0,0.1); display: flex; justify-content: space-between; align-items: center; margin-bottom: 1rem; }}
-        .history-content {{ flex: 1; }}
-        .history-content h3 {{ margin-bottom: 0.5rem; }}
-        .history-content h3 a {{ text-decoration: none; color: #333; }}
-        .history-content h3 a:hover {{ color: #007bff; }}
-        .history-meta {{ color: #666; font-size: 0.9rem; display: flex; gap: 1rem; }}
-        .auth-container {{ display: flex; justify-content: center; align-items: center; min-height: 60vh; }}
-        .auth-card {{ background-color: white; padding: 2rem; border-radius: 8px; box-shadow: 0 4px 6px rgba(0,0,0,0.1); width: 100%; max-width: 400px; }}
-        .auth-card h2 {{ margin-bottom: 1.5rem; text-align: center; color: #333; }}
-        .empty-state {{ text-align: center; padding: 3rem; background-color: white; border-radius: 8px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }}
-    </style>
+    <link rel="stylesheet" href="{stylesheet}">
 </head>
 <body>
     <header>
@@ -158,6 +126,8 @@ def render_template(template_name, **kwargs):
                 <a href="/" class="logo">Flask博客</a>
                 <ul class="nav-menu">
                     <li><a href="/">首页</a></li>
+                    <li><a href="/trending">热门</a></li>
+                    <li><a href="/search">搜索</a></li>
                     {user_menu}
                 </ul>
             </nav>
@@ -191,8 +161,8 @@ def render_template(template_name, **kwargs):
     </script>
 </body>
 </html>''',
-        
-        'index': '''<div class="hero">
+    
+    'index': '''<div class="hero">
     <h1>欢迎来到Flask博客</h1>
     <p>分享技术，记录生活</p>
 </div>
@@ -200,9 +170,23 @@ def render_template(template_name, **kwargs):
 <div class="articles">
     <h2>最新文章</h2>
     {articles}
+    {pagination}
 </div>''',
-        
-        'article_detail': '''<div class="article-detail">
+    
+    'listing': '''<div class="articles">
+    <h2>{heading}</h2>
+    <p class="listing-count">共 {count} 篇文章</p>
+    {articles}
+    {pagination}
+</div>''',
+    
+    'ranking': '''<div class="articles">
+    <h2>{heading}</h2>
+    <p class="listing-count">{description}</p>
+    {articles}
+</div>''',
+    
+    'article_detail': '''<div class="article-detail">
     <article class="card">
         <header class="article-header">
             <h1>{title}</h1>
@@ -211,6 +195,7 @@ def render_template(template_name, **kwargs):
                 <span>分类: {category}</span>
                 <span>发布时间: {created_at}</span>
                 <span>浏览: {views}次</span>
+                <span>{word_count} 字，约 {reading_time} 分钟读完</span>
             </div>
         </header>
         
@@ -222,9 +207,10 @@ def render_template(template_name, **kwargs):
             <p>最后更新时间: {updated_at}</p>
         </footer>
     </article>
+    {related}
 </div>''',
-        
-        'login': '''<div class="auth-container">
+    
+    'login': '''<div class="auth-container">
     <div class="auth-card">
         <h2>用户登录</h2>
         <form method="POST">
@@ -246,8 +232,8 @@ def render_template(template_name, **kwargs):
         </p>
     </div>
 </div>''',
-        
-        'register': '''<div class="auth-container">
+    
+    'register': '''<div class="auth-container">
     <div class="auth-card">
         <h2>用户注册</h2>
         <form method="POST">
@@ -274,22 +260,217 @@ def render_template(template_name, **kwargs):
         </p>
     </div>
 </div>''',
-        
-        'browsing_history': '''<div class="history-container">
+    
+    'search': '''<div class="search-container">
+    <form method="GET" action="/search" class="search-form">
+        <input type="text" name="q" value="{q}" placeholder="搜索文章标题或内容">
+        <button type="submit" class="btn">搜索</button>
+    </form>
+    
+    {results}
+    {pagination}
+</div>''',
+    
+    'browsing_history': '''<div class="history-container">
     <h2>我的浏览历史</h2>
     
     {history_content}
 </div>'''
-    }
+}
+
+COMPILED_TEMPLATES = compile_templates(TEMPLATES)
+
+def render_template(template_name, **kwargs):
+    template = COMPILED_TEMPLATES.get(template_name)
+    with phase('render'):
+        return template.render(**kwargs) if template else ''
+
+# 带内容版本号的静态文件 URL，文件内容变化后 URL 随之变化
+def static_url(name):
+    return f'/static/{name}?v={file_version(os.path.join(STATIC_DIR, name))}'
+
+# 渲染完整页面，直接输出 UTF-8 字节
+def render_page(title, content, current_user):
+    with phase('render'):
+        return COMPILED_TEMPLATES['base'].render_bytes(title=title, content=content, user_menu=get_user_menu(current_user),
+                                                       stylesheet=static_url('simple_blog.css'))
+
+# 流式渲染：返回逐段产出 bytes 的生成器，参数可以是生成器
+def stream_template(template_name, **kwargs):
+    return COMPILED_TEMPLATES[template_name].iter_bytes(**kwargs)
+
+def stream_page(title, content, current_user):
+    return stream_template('base', title=title, content=content, user_menu=get_user_menu(current_user),
+                           stylesheet=static_url('simple_blog.css'))
+
+# 一张文章卡片，article 为 list_articles 返回的一行
+def article_card(article, views):
+    return f'''
+            <div class="card">
+                <h3><a href="/article/{article[0]}" style="text-decoration: none; color: #333;">{article[1]}</a></h3>
+                <div class="card-meta">
+                    <span>作者: <a href="/author/{article[7]}">{article[5]}</a></span> | 
+                    <span>分类: <a href="/category/{article[8]}">{article[6]}</a></span> | 
+                    <span>发布时间: {article[3]}</span> | 
+                    <span>浏览: {views}次</span>
+                </div>
+                <p>{html.escape(article[2] or article[9])}</p>
+                <a href="/article/{article[0]}" class="btn">阅读全文</a>
+            </div>'''
+
+# 首页：只查询列表需要的列，每页多取一行判断是否有下一页。返回流式输出的页面
+def index_page(position, current_user):
+    return listing_page(position, current_user)
+
+# 文章列表页：首页，或 kind 为 'category' / 'author' 时某个分类、作者的文章。
+# owner 为 (id, 名称, 文章数)，文章数由 category_stats / author_stats 增量维护
+def listing_page(position, current_user, kind=None, owner=None):
+    def load_articles():
+        # 读模型中作者名、分类名已经连接好，按 (created_at, id) 或 (分类/作者, created_at, id) 索引扫描单表
+        with get_db() as conn:
+            return list_articles(conn, position, kind, owner[0] if owner else None)
     
-    return templates.get(template_name, '').format(**kwargs)
+    page = {}
+    
+    def article_cards():
+        # 页面框架先发给浏览器，再查询数据库
+        yield FLUSH
+        rows, pending = view_buffer.consistent_read(load_articles)
+        articles, page['next_cursor'] = split_page(rows, PAGE_SIZE, lambda article: (article[3], article[0]))
+        for article in articles:
+            yield article_card(article, article[4] + pending.get(article[0], 0))
+        if not articles:
+            yield '<div class="card"><p>暂无文章</p></div>'
+    
+    # 在文章列表之后生成，此时已经知道下一页游标
+    def pagination():
+        if page['next_cursor']:
+            base = f'/{kind}/{owner[0]}' if kind else '/'
+            yield f'<div class="pagination"><a href="{base}?cursor={page["next_cursor"]}" class="btn btn-outline">下一页</a></div>'
+    
+    if kind is None:
+        content = stream_template('index', articles=article_cards(), pagination=pagination())
+        return stream_page('首页 - Flask博客', content, current_user)
+    label = LISTING_LABELS[kind]
+    content = stream_template('listing', heading=f'{label}: {owner[1]}', count=owner[2],
+                              articles=article_cards(), pagination=pagination())
+    return stream_page(f'{label} {owner[1]} - Flask博客', content, current_user)
+
+# 热门榜页：前 K 篇的 id 来自内存中的榜单，再按主键取出卡片字段，耗时只与 K 有关
+def ranking_page(name, current_user):
+    article_ids = [article_id for article_id, _ in trending.top(name)]
+    
+    def load_articles():
+        with get_db() as conn:
+            return articles_by_id(conn, article_ids)
+    
+    rows, pending = view_buffer.consistent_read(load_articles)
+    cards = ''.join(article_card(article, article[4] + pending.get(article[0], 0)) for article in rows)
+    label, description = BOARD_LABELS[name]
+    content = render_template('ranking', heading=label, description=description,
+                              articles=cards or '<div class="card"><p>暂无文章</p></div>')
+    return render_page(f'{label} - Flask博客', content, current_user)
+
+ARTICLE_SQL = '''
+    SELECT a.title, a.content_html, a.created_at, a.updated_at, a.views, u.username, c.name,
+           a.word_count, a.reading_time, CASE WHEN a.content_html IS NULL THEN a.content END
+    FROM article a 
+    JOIN user u ON a.author_id = u.id 
+    JOIN category c ON a.category_id = c.id 
+    WHERE a.id = ?
+'''
+
+# 文章行末尾追加相关文章 [(id, title)]
+def load_article(article_id):
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(ARTICLE_SQL, (article_id,))
+        article = cursor.fetchone()
+        return article + (related_articles(conn, article_id),) if article else None
 
-# 会话管理
-sessions = {}
-current_user = None
+# 启动预热，在开始监听之前执行：打开连接池中的所有连接并预编译常用查询，
+# 匿名首页渲染进页面缓存，第一批请求不再承担这些开销
+def prepare_statements(conn):
+    list_articles(conn)
+    list_articles(conn, ('', 0))
+    for kind in LISTING_LABELS:
+        list_articles(conn, None, kind, 0)
+        list_articles(conn, ('', 0), kind, 0)
+        listing_owner(conn, kind, 0)
+    conn.execute(ARTICLE_SQL, (0,)).fetchone()
+    related_articles(conn, 0)
 
-def get_user_menu():
-    global current_user
+def warm_up():
+    db_pool.warm_up(prepare_statements)
+    tags = ('index',)
+    token = page_cache.token(tags)
+    page = CachedPage(b''.join(index_page(None, None)))
+    page_cache.set(('/', None, None), page, tags, token, size=page.size)
+
+# 文章页，article 为 load_article 的结果。
+# 正文使用写入时生成的 content_html；预计算列还没补齐时才取原文临时计算
+def article_page(article, views, current_user):
+    if article[1] is None:
+        content_html, _, word_count, reading_time = process_content(article[9])
+    else:
+        content_html, word_count, reading_time = article[1], article[7], article[8]
+    related = ''
+    if article[10]:
+        links = ''.join(f'<li><a href="/article/{related_id}">{title}</a></li>' for related_id, title in article[10])
+        related = f'<section class="card related"><h3>读过这篇的人也在看</h3><ul>{links}</ul></section>'
+    content = render_template('article_detail',
+                             title=article[0],
+                             content=content_html,
+                             created_at=article[2],
+                             updated_at=article[3],
+                             views=views,
+                             author=article[5],
+                             category=article[6],
+                             word_count=word_count,
+                             reading_time=reading_time,
+                             related=related)
+    return render_page(f'{article[0]} - Flask博客', content, current_user)
+
+# 指标中使用的路由名，不把文章 id 等参数带进标签
+ROUTES = frozenset(['/', '/trending', '/popular', '/login', '/register', '/logout', '/browsing-history', '/search',
+                    '/_stats', '/_metrics'])
+
+def route_name(path):
+    if path.startswith('/article/'):
+        return '/article/<id>'
+    for kind in LISTING_LABELS:
+        if path.startswith(f'/{kind}/'):
+            return f'/{kind}/<id>'
+    if path.startswith('/static/'):
+        return '/static/<file>'
+    return path if path in ROUTES else 'unmatched'
+
+# 密码哈希在独立的进程池中计算，排队过多时返回 503
+password_hasher = PasswordHasher()
+
+# 会话管理：cookie 中保存带签名的会话 id，服务端按会话 id 缓存用户信息并写入 user_session 表，
+# 重启后会话仍然有效；已登录请求命中缓存时不查询数据库
+SESSION_COOKIE = 'sid'
+SESSION_TTL = 7 * 24 * 3600
+session_store = SessionStore(get_db, secret=os.environ.get('BLOG_SECRET_KEY'), ttl=SESSION_TTL, write=db_writer.run)
+
+# 预先生成的静态页面（build_static.py），通过 --static-site 启用
+static_site = None
+# 多进程时本进程的编号，单进程为 None
+process_index = None
+
+# 以下写操作在写线程中执行，由写线程提交
+def upgrade_password_hash(conn, user_id, old_hash, new_hash):
+    conn.execute('UPDATE user SET password_hash = ? WHERE id = ? AND password_hash = ?', (new_hash, user_id, old_hash))
+
+def insert_user(conn, username, email, password_hash):
+    conn.execute('INSERT INTO user (username, email, password_hash) VALUES (?, ?, ?)', (username, email, password_hash))
+
+def session_cookie(session_id):
+    return (f'{SESSION_COOKIE}={session_store.cookie_value(session_id)}; Path=/; '
+            f'Max-Age={session_store.ttl}; HttpOnly; SameSite=Lax')
+
+def get_user_menu(current_user):
     if current_user:
         return f'''<li class="user-menu">
             <a href="#" onclick="toggleDropdown()">{current_user['username']}</a>
@@ -304,220 +485,393 @@ def get_user_menu():
 
 # 路由处理
 class BlogHandler(SimpleHTTPRequestHandler):
+    # HTTP/1.1 长连接：每个响应都必须带 Content-Length 或使用分块传输
+    protocol_version = 'HTTP/1.1'
+    # 读请求超时，防止慢客户端长期占用线程池
+    timeout = 30
+    # 长连接等待下一个请求的空闲超时，空闲连接同样占用一个工作线程
+    keep_alive_timeout = 5
+    # 响应头和正文分多次写出，长连接上不关闭 Nagle 会和客户端的延迟确认叠加出约 40ms 的等待
+    disable_nagle_algorithm = True
+    
+    def setup(self):
+        super().setup()
+        self.requests_handled = 0
+        self.wfile = TimedWriter(self.wfile)
+    
+    def handle_one_request(self):
+        if self.requests_handled:
+            self.connection.settimeout(self.keep_alive_timeout)
+        super().handle_one_request()
+        self.requests_handled += 1
+    
+    def send_response(self, code, message=None):
+        timer = current()
+        if timer is not None:
+            timer.status = code
+        super().send_response(code, message)
+    
+    # 每个请求独立解析当前用户，避免线程之间共享登录状态
+    def load_session(self):
+        cookie = SimpleCookie(self.headers.get('Cookie', ''))
+        morsel = cookie.get(SESSION_COOKIE)
+        self.session_id = session_store.session_id_from_cookie(morsel.value) if morsel else None
+        self.current_user = session_store.get(self.session_id)
+    
+    # 动态页面：按 Accept-Encoding 压缩后整体发送
+    def send_html(self, html):
+        encoding, body = compress_body(html, self.headers.get('Accept-Encoding'))
+        self.send_response(200)
+        self.send_header('Content-type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Vary', 'Accept-Encoding, Cookie')
+        self.end_headers()
+        self.wfile.write(body)
+    
+    # 发送缓存的响应：条件请求命中时返回 304，不需要重新渲染；否则按 Accept-Encoding 选择预压缩版本
+    def send_page(self, page, cache_control=None, vary='Accept-Encoding, Cookie'):
+        if cache_control is None:
+            cache_control = 'private, no-cache' if self.current_user else 'no-cache'
+        if is_not_modified(self.headers, page.etag, page.last_modified):
+            self.send_response(304)
+            self.send_validators(page, cache_control, vary)
+            self.end_headers()
+            return
+        encoding, body = page.select(self.headers.get('Accept-Encoding'))
+        self.send_response(200)
+        self.send_header('Content-type', page.content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_validators(page, cache_control, vary)
+        self.end_headers()
+        self.wfile.write(body)
+    
+    # 密码哈希队列已满，让客户端稍后重试
+    def send_busy(self):
+        body = '服务器繁忙，请稍后再试'.encode()
+        self.send_response(503)
+        self.send_header('Content-type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Retry-After', '1')
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def send_validators(self, page, cache_control, vary):
+        self.send_header('ETag', page.etag)
+        if page.last_modified:
+            self.send_header('Last-Modified', http_date(page.last_modified))
+        self.send_header('Cache-Control', cache_control)
+        self.send_header('Vary', vary)
+    
+    # 流式发送页面：响应头和页面框架先发出，其余内容边生成边分块写出。
+    # HTTP/1.0 客户端不支持分块传输，直接写出并在结束后关闭连接。
+    # parts 不为 None 时同时收集发送的内容，用于写入缓存
+    def send_stream(self, chunks, parts=None):
+        chunked = self.request_version != 'HTTP/1.0'
+        compressed = choose_encoding(self.headers.get('Accept-Encoding'), ('gzip',))
+        self.send_response(200)
+        self.send_header('Content-type', 'text/html; charset=utf-8')
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.close_connection = True
+        if compressed:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Vary', 'Accept-Encoding, Cookie')
+        self.end_headers()
+        writer = ChunkedWriter(self.wfile, chunked=chunked, compressor=gzip_compressor() if compressed else None)
+        try:
+            while True:
+                # 生成器按需渲染，取下一段的时间计入渲染（其中的查询计入 DB）
+                with phase('render'):
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                writer.write(chunk)
+                if parts is not None:
+                    parts.append(chunk)
+            writer.close()
+        except BaseException:
+            # 响应头已经发出，无法再返回错误页，只能断开连接
+            self.close_connection = True
+            raise
+        finally:
+            chunks.close()
+    
+    # 先查页面缓存，未命中时渲染并写入缓存；render 可以返回 bytes 或流式生成器，
+    # 可以设置 self.last_modified 作为页面的 Last-Modified。
+    # 缓存中保存 CachedPage，条件请求和压缩都直接使用缓存的结果
+    # 返回是否发送了页面（render 返回 None 时由它自己发送了错误响应）
+    def send_cached(self, key, tags, render):
+        page = page_cache.get(key)
+        if page is not None:
+            self.send_page(page)
+            return True
+        token = page_cache.token(tags)
+        self.last_modified = None
+        html = render()
+        if html is None:
+            return False
+        if isinstance(html, bytes):
+            page = CachedPage(html, self.last_modified)
+            self.send_page(page)
+        else:
+            # 流式发送时响应头已先发出，ETag 从下一次请求（命中缓存）开始提供
+            parts = []
+            self.send_stream(html, parts)
+            page = CachedPage(b''.join(parts), self.last_modified)
+        page_cache.set(key, page, tags, token, size=page.size)
+        return True
+    
+    def redirect(self, location, cookie=None):
+        self.send_response(302)
+        self.send_header('Location', location)
+        if cookie:
+            self.send_header('Set-Cookie', cookie)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+    
     def do_GET(self):
-        global current_user
+        with instrumentation.request('GET', route_name(urllib.parse.urlsplit(self.path).path)):
+            self.route_get()
+    
+    def do_POST(self):
+        with instrumentation.request('POST', route_name(urllib.parse.urlsplit(self.path).path)):
+            self.route_post()
+    
+    def route_get(self):
+        self.load_session()
+        url = urllib.parse.urlsplit(self.path)
+        path = url.path
+        query = urllib.parse.parse_qs(url.query)
         
-        if self.path == '/':
-            self.show_index()
-        elif self.path.startswith('/article/'):
-            article_id = int(self.path.split('/')[-1])
+        if path == '/':
+            self.show_index(query.get('cursor', [None])[0])
+        elif path.startswith('/article/'):
+            try:
+                article_id = int(path.split('/')[-1])
+            except ValueError:
+                self.send_error(404)
+                return
             self.show_article(article_id)
-        elif self.path == '/login':
+        elif path.startswith('/category/') or path.startswith('/author/'):
+            _, kind, owner_id = path.split('/', 2)
+            try:
+                owner_id = int(owner_id)
+            except ValueError:
+                self.send_error(404)
+                return
+            self.show_listing(kind, owner_id, query.get('cursor', [None])[0])
+        elif path in ('/trending', '/popular'):
+            self.send_html(ranking_page(path[1:], self.current_user))
+        elif path == '/login':
             self.show_login()
-        elif self.path == '/register':
+        elif path == '/register':
             self.show_register()
-        elif self.path == '/logout':
-            current_user = None
-            self.send_response(302)
-            self.send_header('Location', '/')
-            self.end_headers()
-        elif self.path == '/browsing-history':
+        elif path == '/logout':
+            session_store.delete(self.session_id)
+            if self.session_id:
+                invalidations.publish([f'session:{hash_session_id(self.session_id)}'])
+            self.redirect('/', f'{SESSION_COOKIE}=; Path=/; Max-Age=0')
+        elif path == '/browsing-history':
             self.show_browsing_history()
+        elif path == '/search':
+            try:
+                page = int(query.get('page', ['1'])[0])
+            except ValueError:
+                page = 1
+            self.show_search(query.get('q', [''])[0].strip(), page)
+        elif path.startswith('/static/'):
+            self.show_static(path[len('/static/'):], query.get('v', [None])[0])
+        elif path == '/_stats':
+            self.show_stats()
+        elif path == '/_metrics':
+            self.show_metrics()
         else:
             self.send_error(404)
     
-    def do_POST(self):
-        global current_user
+    def route_post(self):
+        self.load_session()
         
-        content_length = int(self.headers['Content-Length'])
+        content_length = int(self.headers.get('Content-Length', 0))
         post_data = urllib.parse.parse_qs(self.rfile.read(content_length).decode())
         
         if self.path == '/login':
             username = post_data.get('username', [''])[0]
             password = post_data.get('password', [''])[0]
             
-            conn = get_db()
-            cursor = conn.cursor()
-            password_hash = hashlib.sha256(password.encode()).hexdigest()
-            cursor.execute('SELECT id, username, email FROM user WHERE username = ? AND password_hash = ?', 
-                          (username, password_hash))
-            user = cursor.fetchone()
-            conn.close()
+            with get_db() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT id, username, email, password_hash FROM user WHERE username = ?', (username,))
+                user = cursor.fetchone()
             
+            valid = False
             if user:
-                current_user = {'id': user[0], 'username': user[1], 'email': user[2]}
-                self.send_response(302)
-                self.send_header('Location', '/')
-                self.end_headers()
+                try:
+                    with phase('hash'):
+                        valid, new_hash = password_hasher.verify(user[3], password)
+                except HasherBusy:
+                    self.send_busy()
+                    return
+                if new_hash:
+                    # 旧的 sha256 哈希升级为 PBKDF2
+                    db_writer.run(upgrade_password_hash, user[0], user[3], new_hash)
+            
+            if valid:
+                session_id = session_store.create({'id': user[0], 'username': user[1], 'email': user[2]})
+                self.redirect('/', session_cookie(session_id))
             else:
-                self.send_response(302)
-                self.send_header('Location', '/login')
-                self.end_headers()
+                self.redirect('/login')
         
         elif self.path == '/register':
             username = post_data.get('username', [''])[0]
             email = post_data.get('email', [''])[0]
             password = post_data.get('password', [''])[0]
             
-            conn = get_db()
-            cursor = conn.cursor()
-            
             # 检查用户名是否已存在
-            cursor.execute('SELECT id FROM user WHERE username = ?', (username,))
-            if cursor.fetchone():
-                conn.close()
-                self.send_response(302)
-                self.send_header('Location', '/register')
-                self.end_headers()
+            with get_db() as conn:
+                exists = conn.execute('SELECT id FROM user WHERE username = ?', (username,)).fetchone()
+            if exists:
+                self.redirect('/register')
                 return
             
-            password_hash = hashlib.sha256(password.encode()).hexdigest()
-            cursor.execute('INSERT INTO user (username, email, password_hash) VALUES (?, ?, ?)', 
-                          (username, email, password_hash))
-            conn.commit()
-            conn.close()
+            try:
+                with phase('hash'):
+                    password_hash = password_hasher.hash(password)
+            except HasherBusy:
+                self.send_busy()
+                return
+            try:
+                db_writer.run(insert_user, username, email, password_hash)
+            except sqlite3.IntegrityError:
+                # 计算哈希期间同名用户已注册
+                self.redirect('/register')
+                return
             
-            self.send_response(302)
-            self.send_header('Location', '/login')
-            self.end_headers()
-    
-    def show_index(self):
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT a.id, a.title, a.summary, a.created_at, a.views, u.username, c.name 
-            FROM article a 
-            JOIN user u ON a.author_id = u.id 
-            JOIN category c ON a.category_id = c.id 
-            ORDER BY a.created_at DESC
-        ''')
-        articles = cursor.fetchall()
-        conn.close()
-        
-        articles_html = ''
-        for article in articles:
-            articles_html += f'''
-            <div class="card">
-                <h3><a href="/article/{article[0]}" style="text-decoration: none; color: #333;">{article[1]}</a></h3>
-                <div class="card-meta">
-                    <span>作者: {article[5]}</span> | 
-                    <span>分类: {article[6]}</span> | 
-                    <span>发布时间: {article[3]}</span> | 
-                    <span>浏览: {article[4]}次</span>
-                </div>
-                <p>{article[2] or article[3][:200] + '...'}</p>
-                <a href="/article/{article[0]}" class="btn">阅读全文</a>
-            </div>'''
+            self.redirect('/login')
         
-        if not articles_html:
-            articles_html = '<div class="card"><p>暂无文章</p></div>'
-        
-        content = render_template('index', articles=articles_html)
-        html = render_template('base', title='首页 - Flask博客', content=content, user_menu=get_user_menu())
-        
-        self.send_response(200)
-        self.send_header('Content-type', 'text/html; charset=utf-8')
-        self.end_headers()
-        self.wfile.write(html.encode())
+        else:
+            self.send_error(404)
+    
+    def show_index(self, cursor=None):
+        try:
+            position = decode_cursor(cursor)
+        except ValueError:
+            self.send_error(400)
+            return
+        user = self.current_user
+        render = lambda: self.render_index(position)
+        page = static_site.index(cursor) if static_site and not user else None
+        if page is not None:
+            self.send_page(page)
+        elif user:
+            self.send_cached(('/', cursor, user['id']), ('index', f'user:{user["id"]}'), render)
+        else:
+            self.send_cached(('/', cursor, None), ('index',), render)
+    
+    def render_index(self, position=None):
+        return index_page(position, self.current_user)
+    
+    # 分类页、作者页：与首页一样缓存，随首页一起失效
+    def show_listing(self, kind, owner_id, cursor=None):
+        try:
+            position = decode_cursor(cursor)
+        except ValueError:
+            self.send_error(400)
+            return
+        with get_db() as conn:
+            owner = listing_owner(conn, kind, owner_id)
+        if owner is None:
+            self.send_error(404)
+            return
+        user = self.current_user
+        render = lambda: listing_page(position, user, kind, (owner_id,) + tuple(owner))
+        path = f'/{kind}/{owner_id}'
+        if user:
+            self.send_cached((path, cursor, user['id']), ('index', f'user:{user["id"]}'), render)
+        else:
+            self.send_cached((path, cursor, None), ('index',), render)
     
     def show_article(self, article_id):
-        global current_user
-        
-        conn = get_db()
-        cursor = conn.cursor()
-        
-        # 获取文章信息
-        cursor.execute('''
-            SELECT a.title, a.content, a.created_at, a.updated_at, a.views, u.username, c.name 
-            FROM article a 
-            JOIN user u ON a.author_id = u.id 
-            JOIN category c ON a.category_id = c.id 
-            WHERE a.id = ?
-        ''', (article_id,))
-        article = cursor.fetchone()
-        
+        # 登录用户的浏览会产生写入，只缓存匿名访问的文章页
+        if self.current_user:
+            html = self.render_article(article_id)
+            if html is not None:
+                self.send_html(html)
+                trending.record(article_id)
+            return
+        page = static_site.article(article_id) if static_site else None
+        if page is not None:
+            self.send_page(page)
+            trending.record(article_id)
+        elif self.send_cached((f'/article/{article_id}', None), article_tags([article_id]),
+                              lambda: self.render_article(article_id)):
+            trending.record(article_id)
+    
+    def render_article(self, article_id):
+        current_user = self.current_user
+        article, pending = view_buffer.consistent_read(lambda: load_article(article_id))
         if not article:
-            conn.close()
             self.send_error(404)
-            return
+            return None
+        views = article[4] + pending.get(article_id, 0)
+        # Last-Modified 取文章修改时间；浏览量变化只体现在 ETag（内容哈希）中
+        self.last_modified = article[3]
         
-        # 记录浏览历史（仅登录用户）
+        # 记录浏览历史和浏览计数（仅登录用户）
         if current_user:
-            # 更新或插入浏览记录
-            cursor.execute('''
-                INSERT OR REPLACE INTO article_view_history (user_id, article_id, viewed_at) 
-                VALUES (?, ?, CURRENT_TIMESTAMP)
-            ''', (current_user['id'], article_id))
-            
-            # 更新文章浏览计数
-            cursor.execute('UPDATE article SET views = views + 1 WHERE id = ?', (article_id,))
-            conn.commit()
+            record_view(current_user, article_id)
+            views += 1
         
-        conn.close()
-        
-        content = render_template('article_detail',
-                                 title=article[0],
-                                 content=article[1],
-                                 created_at=article[2],
-                                 updated_at=article[3],
-                                 views=article[4] + (1 if current_user else 0),
-                                 author=article[5],
-                                 category=article[6])
-        
-        html = render_template('base', title=f'{article[0]} - Flask博客', content=content, user_menu=get_user_menu())
-        
-        self.send_response(200)
-        self.send_header('Content-type', 'text/html; charset=utf-8')
-        self.end_headers()
-        self.wfile.write(html.encode())
+        return article_page(article, views, current_user)
     
     def show_login(self):
         content = render_template('login')
-        html = render_template('base', title='登录 - Flask博客', content=content, user_menu=get_user_menu())
-        
-        self.send_response(200)
-        self.send_header('Content-type', 'text/html; charset=utf-8')
-        self.end_headers()
-        self.wfile.write(html.encode())
+        self.send_html(render_page('登录 - Flask博客', content, self.current_user))
     
     def show_register(self):
         content = render_template('register')
-        html = render_template('base', title='注册 - Flask博客', content=content, user_menu=get_user_menu())
-        
-        self.send_response(200)
-        self.send_header('Content-type', 'text/html; charset=utf-8')
-        self.end_headers()
-        self.wfile.write(html.encode())
+        self.send_html(render_page('注册 - Flask博客', content, self.current_user))
     
     def show_browsing_history(self):
-        global current_user
+        current_user = self.current_user
         
         if not current_user:
-            self.send_response(302)
-            self.send_header('Location', '/login')
-            self.end_headers()
+            self.redirect('/login')
             return
         
-        conn = get_db()
-        cursor = conn.cursor()
-        
-        # 获取最近一个月的浏览历史
-        cursor.execute('''
-            SELECT a.title, c.name, h.viewed_at, a.id
-            FROM article_view_history h
-            JOIN article a ON h.article_id = a.id
-            JOIN category c ON a.category_id = c.id
-            WHERE h.user_id = ? AND h.viewed_at >= datetime('now', '-30 days')
-            ORDER BY h.viewed_at DESC
-        ''', (current_user['id'],))
-        
-        history = cursor.fetchall()
-        conn.close()
+        # 先写入缓冲中的浏览记录，保证能看到刚浏览过的文章
+        view_buffer.flush()
         
-        if history:
-            history_html = '<div class="history-list">'
-            for item in history:
-                history_html += f'''
+        # 逐行读取浏览历史并输出，不在内存中拼接整个列表
+        def history_items():
+            yield FLUSH
+            with get_db() as conn:
+                cursor = conn.cursor()
+                
+                # 获取最近一个月的浏览历史，idx_history_user_viewed 覆盖过滤和排序
+                cursor.execute('''
+                    SELECT l.title, l.category_name, h.viewed_at, l.id
+                    FROM article_view_history h
+                    JOIN article_listing l ON h.article_id = l.id
+                    WHERE h.user_id = ? AND h.viewed_at >= datetime('now', ?)
+                    ORDER BY h.viewed_at DESC
+                ''', (current_user['id'], f'-{HISTORY_DAYS} days'))
+                
+                first = cursor.fetchone()
+                if first is None:
+                    yield '''<div class="empty-state">
+                <p>您还没有浏览过任何文章</p>
+                <a href="/" class="btn">去浏览文章</a>
+            </div>'''
+                    return
+                
+                yield '<div class="history-list">'
+                for item in itertools.chain((first,), cursor):
+                    yield f'''
                 <div class="history-item">
                     <div class="history-content">
                         <h3><a href="/article/{item[3]}">{item[0]}</a></h3>
@@ -530,28 +884,266 @@ class BlogHandler(SimpleHTTPRequestHandler):
                         <a href="/article/{item[3]}" class="btn btn-sm">查看文章</a>
                     </div>
                 </div>'''
-            history_html += '</div>'
-        else:
-            history_html = '''<div class="empty-state">
-                <p>您还没有浏览过任何文章</p>
-                <a href="/" class="btn">去浏览文章</a>
-            </div>'''
+                yield '</div>'
         
-        content = render_template('browsing_history', history_content=history_html)
-        html = render_template('base', title='浏览历史 - Flask博客', content=content, user_menu=get_user_menu())
+        content = stream_template('browsing_history', history_content=history_items())
+        self.send_stream(stream_page('浏览历史 - Flask博客', content, current_user))
+    
+    def show_search(self, q, page=1):
+        page = search_page(page)
+        results_html = ''
+        pagination = ''
+        if q:
+            with get_db() as conn:
+                results, has_next = search_articles(conn, q, page)
+            for article_id, title, snippet, created_at in results:
+                results_html += f'''
+            <div class="card">
+                <h3><a href="/article/{article_id}" style="text-decoration: none; color: #333;">{title}</a></h3>
+                <div class="card-meta"><span>发布时间: {created_at}</span></div>
+                <p>{snippet}</p>
+            </div>'''
+            if not results_html:
+                results_html = '<div class="empty-state"><p>没有找到相关文章</p></div>'
+            links = []
+            quoted = urllib.parse.quote(q)
+            if page > 1:
+                links.append(f'<a href="/search?q={quoted}&page={page - 1}" class="btn btn-outline">上一页</a>')
+            if has_next:
+                links.append(f'<a href="/search?q={quoted}&page={page + 1}" class="btn btn-outline">下一页</a>')
+            if links:
+                pagination = '<div class="pagination">' + ''.join(links) + '</div>'
         
+        content = render_template('search', q=html.escape(q), results=results_html, pagination=pagination)
+        title = f'{html.escape(q)} - 搜索 - Flask博客' if q else '搜索 - Flask博客'
+        self.send_html(render_page(title, content, self.current_user))
+    
+    # 静态文件：URL 带当前版本号时允许浏览器长期缓存
+    def show_static(self, name, version=None):
+        content_type = STATIC_TYPES.get(os.path.splitext(name)[1])
+        path = os.path.join(STATIC_DIR, name)
+        if content_type is None or '/' in name or name.startswith('.') or not os.path.isfile(path):
+            self.send_error(404)
+            return
+        page = static_files.get(name)
+        if page is None:
+            with open(path, 'rb') as f:
+                body = f.read()
+            page = CachedPage(body, datetime.datetime.utcfromtimestamp(os.path.getmtime(path)), content_type)
+            static_files[name] = page
+        if version == file_version(path):
+            cache_control = f'public, max-age={STATIC_MAX_AGE}, immutable'
+        else:
+            cache_control = 'no-cache'
+        self.send_page(page, cache_control, 'Accept-Encoding')
+    
+    # 运行状态统计
+    def show_stats(self):
+        body = json.dumps({
+            'db_pool': db_pool.metrics(),
+            'view_buffer': view_buffer.metrics(),
+            'page_cache': page_cache.stats(),
+            'history_pruner': history_pruner.metrics(),
+            'search_indexer': search_indexer.metrics(),
+            'sessions': session_store.metrics(),
+            'password_hasher': password_hasher.metrics(),
+            'static_site': static_site.metrics() if static_site else None,
+            'trending': trending.metrics(),
+            'process': {'pid': os.getpid(), 'worker': process_index},
+            'invalidations': invalidations.metrics(),
+            'db_writer': db_writer.metrics(),
+        }).encode()
         self.send_response(200)
-        self.send_header('Content-type', 'text/html; charset=utf-8')
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    # Prometheus 文本格式的指标
+    def show_metrics(self):
+        text = instrumentation.metrics.render()
+        text += gauge_lines('blog_db_pool', db_pool.metrics())
+        text += gauge_lines('blog_view_buffer', view_buffer.metrics())
+        text += gauge_lines('blog_page_cache', page_cache.stats())
+        text += gauge_lines('blog_history_pruner', history_pruner.metrics())
+        text += gauge_lines('blog_search_indexer', search_indexer.metrics())
+        text += gauge_lines('blog_sessions', session_store.metrics())
+        text += gauge_lines('blog_password_hasher', password_hasher.metrics())
+        if static_site:
+            text += gauge_lines('blog_static_site', static_site.metrics())
+        text += gauge_lines('blog_trending', trending.metrics())
+        text += gauge_lines('blog_invalidations', invalidations.metrics())
+        text += gauge_lines('blog_db_writer', db_writer.metrics())
+        body = text.encode()
+        self.send_response(200)
+        self.send_header('Content-type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
         self.end_headers()
-        self.wfile.write(html.encode())
+        self.wfile.write(body)
 
-def run_server():
+# 并发服务器：固定大小的线程池处理连接，排队的连接数有上限
+class PooledHTTPServer(HTTPServer):
+    request_queue_size = 128
+    
+    def __init__(self, server_address, handler_class, workers=8, max_pending=None, bind_and_activate=True):
+        super().__init__(server_address, handler_class, bind_and_activate)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='blog-worker')
+        # 线程池满且排队已达上限时阻塞 accept，由内核 backlog 承担背压
+        self.slots = threading.BoundedSemaphore(max_pending or workers * 4)
+    
+    def process_request(self, request, client_address):
+        self.slots.acquire()
+        self.pool.submit(self.process_request_worker, request, client_address)
+    
+    def process_request_worker(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+    
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=True)
+
+def handle_sigterm(signum, frame):
+    raise KeyboardInterrupt
+
+# 多进程时关闭监听之前先处理完已经进入本进程 accept 队列的连接：SO_REUSEPORT 下关闭监听套接字
+# 会重置这些连接（Linux 5.14 起可开启 net.ipv4.tcp_migrate_req，由内核转给其他进程）
+def drain_pending(httpd):
+    while select.select([httpd.socket], [], [], 0)[0]:
+        httpd.handle_request()
+
+# 监督进程：执行迁移后启动工作进程，工作进程的命令行是本进程的参数加上 --worker-index 和 --ready-fd
+def run_prefork(processes, argv):
+    init_db()
+    script = os.path.abspath(__file__)
+    supervisor = Supervisor(lambda index, ready_fd: [sys.executable, script, *argv, '--worker-index', str(index),
+                                                     '--ready-fd', str(ready_fd)], processes)
+    print(f'监督进程 {os.getpid()} 启动 {processes} 个工作进程，SIGHUP 滚动重启，SIGTERM 停止')
+    supervisor.run()
+
+def run_server(host='', port=5000, workers=8, slow_ms=500, profile_rate=0.0, profile_dir='profiles',
+               retention_days=HISTORY_DAYS, prune_interval=3600.0, history_archive=None,
+               session_ttl=SESSION_TTL, session_cache=10000, memory_sessions=False, hash_workers=None, hash_queue=None,
+               static_site_dir=None, trending_interval=60.0, processes=1, worker_index=None, ready_fd=None):
+    global db_pool, session_store, static_site, process_index
+    process_index = worker_index
+    # 连接数与工作线程数一致，线程不会因为等连接而排队。连接只读，写入都经过 db_writer
+    db_pool = ConnectionPool(DATABASE, size=workers, factory=InstrumentedConnection, read_only=True)
+    instrumentation.slow_ms = slow_ms
+    instrumentation.profile_rate = profile_rate
+    instrumentation.profile_dir = profile_dir
+    history_pruner.days = retention_days
+    history_pruner.interval = prune_interval
+    history_pruner.archive_path = history_archive
+    session_store = SessionStore(None if memory_sessions else get_db, secret=os.environ.get('BLOG_SECRET_KEY'),
+                                 ttl=session_ttl, max_entries=session_cache, write=db_writer.run)
+    if hash_workers is not None:
+        password_hasher.workers = hash_workers
+    elif processes > 1:
+        # 多个工作进程共用全部 CPU 核
+        password_hasher.workers = max(1, password_hasher.workers // processes)
+    password_hasher.max_pending = hash_queue or max(2, password_hasher.workers * 2)
+    static_site = StaticSite(static_site_dir, get_db) if static_site_dir else None
+    trending.snapshot_interval = trending_interval
+    trending.worker = worker_index or 0
+    trending.workers = processes
     init_db()
-    server_address = ('', 5000)
-    httpd = HTTPServer(server_address, BlogHandler)
-    print('服务器启动在 http://localhost:5000')
-    print('演示账号: demo/demo123')
-    httpd.serve_forever()
+    db_writer.start()
+    trending.load()
+    session_store.setup()
+    password_hasher.warm_up()
+    warm_up()
+    server_address = (host, port)
+    if workers > 1:
+        httpd = PooledHTTPServer(server_address, BlogHandler, workers=workers, bind_and_activate=False)
+    else:
+        httpd = HTTPServer(server_address, BlogHandler, bind_and_activate=False)
+    # 多进程时每个工作进程各自监听同一端口
+    httpd.allow_reuse_port = worker_index is not None
+    try:
+        httpd.server_bind()
+        httpd.server_activate()
+    except Exception:
+        httpd.server_close()
+        raise
+    if worker_index is None:
+        print(f'服务器启动在 http://localhost:{port} (workers={workers})')
+        print('演示数据: python migrations.py seed（账号 demo/demo123）')
+    else:
+        print(f'工作进程 {worker_index} (pid {os.getpid()}) 监听 http://localhost:{port} (workers={workers})',
+              flush=True)
+        invalidations.start()
+        watch_parent()
+    view_buffer.start()
+    # 过期浏览历史的清理和短词索引的补建只需要一个进程
+    if not worker_index:
+        history_pruner.start()
+        search_indexer.start()
+    trending.start()
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    if ready_fd is not None:
+        notify_ready(ready_fd)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if worker_index is not None:
+            drain_pending(httpd)
+        httpd.server_close()
+        history_pruner.stop()
+        search_indexer.stop()
+        trending.stop()
+        password_hasher.shutdown()
+        # 退出前写入所有缓冲中的浏览记录
+        view_buffer.stop()
+        invalidations.stop()
+        db_writer.stop()
+        db_pool.close_all()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='简易博客服务器')
+    parser.add_argument('--host', default='')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=8, help='处理请求的线程数，1 表示单线程')
+    parser.add_argument('--slow-ms', type=float, default=500, help='超过该耗时（毫秒）的请求记为慢请求')
+    parser.add_argument('--profile-rate', type=float, default=0.0, help='开启 cProfile 采样的请求比例，0 表示关闭')
+    parser.add_argument('--profile-dir', default='profiles', help='慢请求 profile 结果保存目录')
+    parser.add_argument('--retention-days', type=int, default=HISTORY_DAYS, help='浏览历史保留天数')
+    parser.add_argument('--prune-interval', type=float, default=3600, help='清理过期浏览历史的间隔（秒），0 表示不清理')
+    parser.add_argument('--history-archive', help='清理前把过期浏览历史按月归档到该数据库文件')
+    parser.add_argument('--session-ttl', type=int, default=SESSION_TTL, help='登录会话有效期（秒）')
+    parser.add_argument('--session-cache', type=int, default=10000, help='内存中缓存的会话数上限')
+    parser.add_argument('--memory-sessions', action='store_true', help='会话只保存在内存中，重启后失效')
+    parser.add_argument('--hash-workers', type=int, help='密码哈希进程数，默认为 CPU 核数，0 表示在请求线程中计算')
+    parser.add_argument('--hash-queue', type=int, help='排队中的密码哈希任务上限，超出时返回 503，默认为进程数的两倍')
+    parser.add_argument('--static-site', help='build_static.py 生成的目录，匿名访问时直接发送其中仍然新鲜的页面'
+                                              '（浏览量为生成时的数值）')
+    parser.add_argument('--trending-interval', type=float, default=60,
+                        help='热门文章榜快照到数据库的间隔（秒），0 表示只在退出时保存')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='工作进程数，大于 1 时由监督进程启动多个进程共同监听端口（需要 SO_REUSEPORT）')
+    # 由监督进程传给工作进程
+    parser.add_argument('--worker-index', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--ready-fd', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.processes > 1 and args.memory_sessions:
+        parser.error('--memory-sessions 的会话只保存在一个进程中，不能与 --processes 同时使用')
+    if args.processes > 1 and not hasattr(socket, 'SO_REUSEPORT'):
+        parser.error('当前平台不支持 SO_REUSEPORT，--processes 只能为 1')
+    return args
 
 if __name__ == '__main__':
-    run_server()
\ No newline at end of file
+    args = parse_args()
+    if args.processes > 1 and args.worker_index is None:
+        run_prefork(args.processes, sys.argv[1:])
+        sys.exit(0)
+    run_server(args.host, args.port, args.workers, args.slow_ms, args.profile_rate, args.profile_dir,
+               args.retention_days, args.prune_interval, args.history_archive,
+               args.session_ttl, args.session_cache, args.memory_sessions, args.hash_workers, args.hash_queue,
+               args.static_site, args.trending_interval, args.processes, args.worker_index, args.ready_fd)
\ No newline at end of file
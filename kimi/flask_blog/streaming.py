@@ -0,0 +1,53 @@
+import zlib
+
+# 流式输出中的空片段表示“立即发送已缓冲的内容”，例如页面框架写完、开始查询数据库之前
+FLUSH = b''
+
+# 分块传输编码（HTTP/1.1 Transfer-Encoding: chunked）：
+# 小片段先在缓冲区中合并，攒够 buffer_size 再作为一个 chunk 写出，减少系统调用次数。
+# 传入 compressor（zlib 压缩对象）时每次写出前压缩，并做 SYNC_FLUSH 保证浏览器能立即解压
+class ChunkedWriter:
+    def __init__(self, wfile, buffer_size=8192, chunked=True, compressor=None):
+        self.wfile = wfile
+        self.buffer_size = buffer_size
+        self.chunked = chunked
+        self.compressor = compressor
+        self._buffer = []
+        self._buffered = 0
+
+    def write(self, data):
+        if not data:
+            self.flush()
+            return
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buffered:
+            return
+        data = b''.join(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        if self.compressor:
+            data = self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        self._write(data)
+
+    def _write(self, data):
+        if not data:
+            return
+        if self.chunked:
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        else:
+            self.wfile.write(data)
+        self.wfile.flush()
+
+    # 写出剩余内容和结束块
+    def close(self):
+        self.flush()
+        if self.compressor:
+            self._write(self.compressor.flush())
+        if self.chunked:
+            self.wfile.write(b'0\r\n\r\n')
+        self.wfile.flush()
@@ -0,0 +1,72 @@
+import string
+
+_formatter = string.Formatter()
+
+# 预编译模板：启动时把 str.format 风格的模板拆成字面量片段和占位符，
+# 渲染时只需填入占位符并拼接，不再重复解析模板
+class CompiledTemplate:
+    def __init__(self, source):
+        self.source = source
+        self.chunks = []
+        self.slots = []
+        for literal, field, spec, conversion in _formatter.parse(source):
+            if literal:
+                self.chunks.append(literal)
+            if field is None:
+                continue
+            if not field.isidentifier():
+                raise ValueError(f'模板占位符只支持简单变量名: {{{field}}}')
+            self.slots.append((len(self.chunks), field, conversion, spec))
+            self.chunks.append(None)
+        # 静态片段预先编码为 UTF-8，输出字节时无需再次编码
+        self.encoded_chunks = [chunk.encode() if chunk is not None else None for chunk in self.chunks]
+        self.names = frozenset(slot[1] for slot in self.slots)
+        self.slot_at = {slot[0]: slot for slot in self.slots}
+
+    def _value(self, kwargs, name, conversion, spec):
+        value = kwargs[name]
+        if conversion == 'r':
+            value = repr(value)
+        elif conversion == 'a':
+            value = ascii(value)
+        elif conversion == 's':
+            value = str(value)
+        if spec:
+            return format(value, spec)
+        return value if isinstance(value, str) else format(value)
+
+    def render(self, **kwargs):
+        parts = self.chunks[:]
+        for index, name, conversion, spec in self.slots:
+            parts[index] = self._value(kwargs, name, conversion, spec)
+        return ''.join(parts)
+
+    # 输出 UTF-8 字节；参数可以直接传入已编码的 bytes（例如嵌套渲染的结果）
+    def render_bytes(self, **kwargs):
+        parts = self.encoded_chunks[:]
+        for index, name, conversion, spec in self.slots:
+            value = kwargs[name]
+            if isinstance(value, bytes) and not conversion and not spec:
+                parts[index] = value
+            else:
+                parts[index] = self._value(kwargs, name, conversion, spec).encode()
+        return b''.join(parts)
+
+    # 逐段输出 UTF-8 字节，参数可以是生成器（逐条产出 str 或 bytes），用于流式响应
+    def iter_bytes(self, **kwargs):
+        for index, chunk in enumerate(self.encoded_chunks):
+            if chunk is not None:
+                yield chunk
+                continue
+            _, name, conversion, spec = self.slot_at[index]
+            value = kwargs[name]
+            if isinstance(value, bytes) and not conversion and not spec:
+                yield value
+            elif isinstance(value, str) or conversion or spec or not hasattr(value, '__iter__'):
+                yield self._value(kwargs, name, conversion, spec).encode()
+            else:
+                for part in value:
+                    yield part if isinstance(part, bytes) else part.encode()
+
+def compile_templates(sources):
+    return {name: CompiledTemplate(source) for name, source in sources.items()}
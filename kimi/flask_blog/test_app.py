@@ -0,0 +1,160 @@
+import datetime
+import importlib
+import os
+import re
+import sqlite3
+
+import flask
+import pytest
+import sqlalchemy
+
+import search
+from content import insert_article, update_article
+from listing import QUERY_PLANS, check_query_plans
+from migrations import migrate, seed_demo
+from search import index_pending, search_articles
+
+# 同一秒内发布的文章数，超过一页
+SAME_SECOND_ARTICLES = 45
+SAME_SECOND = '2030-01-01 12:00:00'
+
+# 临时库：演示数据加上一批 created_at 完全相同的文章（都在分类 1，比演示文章新，排在最前面），
+# 演示用户浏览过其中每一篇。app 只能导入一次，整个测试会话共用
+@pytest.fixture(scope='session')
+def blog(tmp_path_factory):
+    path = tmp_path_factory.mktemp('blog') / 'blog.db'
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    seed_demo(conn)
+    conn.executemany('''INSERT INTO article (title, content, summary, author_id, category_id, created_at, updated_at)
+                        VALUES (?, ?, ?, 1, 1, ?, ?)''',
+                     [(f'同一秒的文章 {i}', '正文', '摘要', SAME_SECOND, SAME_SECOND)
+                      for i in range(SAME_SECOND_ARTICLES)])
+    viewed_at = datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+    conn.execute('INSERT INTO article_view_history (user_id, article_id, viewed_at) SELECT 1, id, ? FROM article',
+                 (viewed_at,))
+    conn.commit()
+    conn.close()
+    os.environ['BLOG_DATABASE_URI'] = f'sqlite:///{path}'
+    os.environ['BLOG_HASH_WORKERS'] = '0'
+    app = importlib.import_module('app')
+    app.app.testing = True
+    app.create_app()
+    return app
+
+@pytest.fixture
+def client(blog):
+    blog.page_cache.invalidate('index')
+    return blog.app.test_client()
+
+ARTICLE_LINK = re.compile(r'href="/article/(\d+)"')
+NEXT_LINK = re.compile(r'href="([^"]*cursor=[^"]+)"[^>]*>下一页')
+
+# 沿“下一页”链接翻完所有页，返回每页的文章 id（每张卡片的标题和“阅读全文”各有一个链接）
+def page_through(client, url, max_pages=20):
+    pages = []
+    while url:
+        assert len(pages) < max_pages, '翻页没有结束，游标没有前进'
+        response = client.get(url)
+        assert response.status_code == 200
+        body = response.get_data(as_text=True)
+        pages.append([int(article_id) for article_id in dict.fromkeys(ARTICLE_LINK.findall(body))])
+        match = NEXT_LINK.search(body)
+        url = match.group(1).replace('&amp;', '&') if match else None
+    return pages
+
+@pytest.mark.parametrize('url', ['/', '/category/1'])
+def test_keyset_pagination_with_identical_created_at(client, blog, url):
+    pages = page_through(client, url)
+    ids = [article_id for page in pages for article_id in page]
+    assert len(pages) > 2
+    assert len(ids) == len(set(ids))
+    with blog.app.app_context():
+        expected = [row.id for row in blog.card_query().filter_by(**({'category_id': 1} if url != '/' else {}))
+                    .order_by(blog.ArticleListing.created_at.desc(), blog.ArticleListing.id.desc())]
+    assert ids == expected
+
+def login(client):
+    response = client.post('/login', data={'username': 'demo', 'password': 'demo123'})
+    assert response.status_code == 302
+
+# 页面执行的 SQL 条数不随文章数、浏览记录数增长（N+1 查询会让这里超出预算）
+@pytest.mark.parametrize('url, rows', [('/', 20), ('/browsing-history', SAME_SECOND_ARTICLES)])
+def test_sql_statements_within_budget(client, blog, url, rows):
+    login(client)
+    with client:
+        response = client.get(url)
+        assert response.status_code == 200
+        assert len(dict.fromkeys(ARTICLE_LINK.findall(response.get_data(as_text=True)))) >= rows
+        assert flask.g.sql_statements <= blog.app.config['SQL_STATEMENT_BUDGET']
+
+# 超出预算时测试中直接失败
+def test_sql_budget_violation_fails_in_tests(client, blog, monkeypatch):
+    login(client)
+    monkeypatch.setitem(blog.app.config, 'SQL_STATEMENT_BUDGET', 0)
+    with pytest.raises(AssertionError, match='超过预算 0'):
+        client.get('/browsing-history')
+
+# 首页、分类页、作者页（含翻页）的查询走各自的列表索引，不用临时 B 树排序
+def test_listing_query_plans(blog):
+    conn = sqlite3.connect(blog.database_path())
+    try:
+        results = check_query_plans(conn)
+    finally:
+        conn.close()
+    indexes = {name: index for name, kind, index in QUERY_PLANS}
+    assert len(results) == 2 * len(indexes)
+    for name, ok, plan in results:
+        assert any(indexes[name.removesuffix('翻页')] in line for line in plan), (name, plan)
+        assert not any('TEMP B-TREE' in line for line in plan), (name, plan)
+        assert ok, (name, plan)
+
+# 一两个字的词走短词索引；刚写入、还在待索引队列中的文章用 LIKE 检查，补建索引前后结果一致
+def test_short_term_search(tmp_path):
+    conn = sqlite3.connect(tmp_path / 'search.db')
+    try:
+        migrate(conn)
+        seed_demo(conn)
+        conn.execute('''INSERT INTO article (title, content, summary, author_id, category_id)
+                        VALUES ('观察鲸鱼', '今天在海边看到了鲸鱼', '摘要', 1, 1)''')
+        conn.commit()
+        for indexed in (False, True):
+            if indexed:
+                while index_pending(conn):
+                    pass
+                conn.commit()
+            assert [row[1] for row in search_articles(conn, '鲸鱼')[0]] == ['观察<mark>鲸鱼</mark>']
+            assert [row[0] for row in search_articles(conn, '学习 Flask入门')[0]] == [1]
+            assert search_articles(conn, '鲸 Flask入门')[0] == []
+        assert conn.execute('SELECT COUNT(*) FROM article_fts_pending').fetchone()[0] == 0
+        conn.execute("UPDATE article SET title = '观察海豚', content = '看到了海豚' WHERE title = '观察鲸鱼'")
+        conn.commit()
+        assert search_articles(conn, '鲸鱼')[0] == []
+        assert len(search_articles(conn, '海豚')[0]) == 1
+    finally:
+        conn.close()
+
+# 翻到最后一页（MAX_SEARCH_PAGE，这里改为 2）后没有下一页，超出的页码按最后一页显示
+def test_search_pagination_stops_at_last_page(client, monkeypatch):
+    monkeypatch.setattr(search, 'MAX_SEARCH_PAGE', 2)
+    for page in (2, 3):
+        body = client.get('/search', query_string={'q': '正文', 'page': page}).get_data(as_text=True)
+        assert len(ARTICLE_LINK.findall(body)) == search.SEARCH_PAGE_SIZE
+        assert '下一页' not in body
+        assert 'page=1' in body
+
+# ORM 连接只读；文章经写线程写入，预计算列同时生成
+def test_article_writes_go_through_writer(client, blog):
+    with blog.app.app_context():
+        blog.db.session.add(blog.Article(title='ORM 文章', content='正文', author_id=1, category_id=2))
+        with pytest.raises(sqlalchemy.exc.OperationalError, match='readonly'):
+            blog.db.session.commit()
+        blog.db.session.rollback()
+    article_id = blog.db_writer.run(insert_article, '写线程文章', '第一段\n\n第二段', '摘要', 1, 2)
+    blog.db_writer.run(update_article, article_id, '写线程文章', '新的正文', '摘要')
+    blog.invalidate_article_pages([article_id])
+    body = client.get(f'/article/{article_id}').get_data(as_text=True)
+    assert '<p>新的正文</p>' in body
+    with blog.app.app_context():
+        article = blog.db.session.get(blog.Article, article_id)
+        assert (article.excerpt, article.word_count) == ('新的正文', 4)
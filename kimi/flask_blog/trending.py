@@ -0,0 +1,262 @@
+import heapq
+import math
+import threading
+import time
+import traceback
+
+from db_writer import direct_writer
+
+# 热门文章榜：每次浏览给文章加一分，分数随时间指数衰减（半衰期），只在内存中维护，
+# 前 K 名用最小堆增量维护，查询只排序这 K 篇，与文章总数无关。定期快照到 SQLite，重启后恢复。
+#
+# 衰减不需要定时修改所有分数：分数都以同一个基准时刻 base 表示，
+# 在时刻 t 的一次浏览加 exp(rate * (t - base))，真实分数为 score * exp(-rate * (now - base))。
+# 所有文章乘的是同一个系数，排名只在有新浏览时变化，且分数只增不减
+#
+# (名称, 标题, 说明, 半衰期秒数)
+BOARDS = (
+    ('trending', '近期热门', '按浏览量排名，热度每 6 小时减半', 6 * 3600),
+    ('popular', '最受欢迎', '按浏览量排名，热度每 30 天减半', 30 * 86400),
+)
+BOARD_LABELS = {name: (label, description) for name, label, description, _ in BOARDS}
+
+# 快照：每个榜单内存中跟踪的全部文章，score 为 saved_at 时刻的真实分数。由 migrations.py 创建
+TRENDING_SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS article_trending (
+        board TEXT NOT NULL,
+        article_id INTEGER NOT NULL,
+        score REAL NOT NULL,
+        saved_at REAL NOT NULL,
+        PRIMARY KEY (board, article_id)
+    ) WITHOUT ROWID''',
+)
+
+# 多进程时每个工作进程只统计分到自己的访问，快照按进程编号 worker 分开保存，恢复时合计。
+# 由 migrations.py 把旧表（没有 worker 列，整表是一个进程的快照）转换为新表，旧快照记为进程 0
+TRENDING_WORKER_TABLE = '''CREATE TABLE article_trending (
+    board TEXT NOT NULL,
+    worker INTEGER NOT NULL,
+    article_id INTEGER NOT NULL,
+    score REAL NOT NULL,
+    saved_at REAL NOT NULL,
+    PRIMARY KEY (board, worker, article_id)
+) WITHOUT ROWID'''
+
+def add_worker_column(conn):
+    if 'worker' in {row[1] for row in conn.execute('PRAGMA table_info(article_trending)')}:
+        return
+    conn.execute('ALTER TABLE article_trending RENAME TO article_trending_old')
+    conn.execute(TRENDING_WORKER_TABLE)
+    conn.execute('''INSERT INTO article_trending (board, worker, article_id, score, saved_at)
+                    SELECT board, 0, article_id, score, saved_at FROM article_trending_old''')
+    conn.execute('DROP TABLE article_trending_old')
+
+# 指数超过该值时把基准时刻移到当前时刻，避免浮点溢出（约 72 个半衰期一次）
+RESCALE_EXPONENT = 50.0
+
+# 单个榜单。不加锁，由 Trending 统一加锁
+class DecayedTopK:
+    def __init__(self, half_life, k=20, capacity=10000, now=None):
+        self.rate = math.log(2) / half_life
+        self.k = k
+        self.capacity = capacity
+        self._base = time.time() if now is None else now
+        self._scores = {}
+        # 前 K 名：{article_id: score}，以及它的最小堆；分数更新后堆中的旧条目过期，弹出时跳过
+        self._top = {}
+        self._heap = []
+        self.trims = 0
+
+    def add(self, article_id, weight=1.0, now=None):
+        now = time.time() if now is None else now
+        exponent = self.rate * (now - self._base)
+        if exponent > RESCALE_EXPONENT:
+            self._rescale(now)
+            exponent = 0.0
+        score = self._scores.get(article_id, 0.0) + weight * math.exp(exponent)
+        self._scores[article_id] = score
+        self._offer(article_id, score)
+        if len(self._scores) > self.capacity:
+            self._trim()
+
+    def _offer(self, article_id, score):
+        if article_id in self._top or len(self._top) < self.k:
+            self._top[article_id] = score
+            heapq.heappush(self._heap, (score, article_id))
+            if len(self._heap) > 4 * self.k:
+                self._heap = [(value, key) for key, value in self._top.items()]
+                heapq.heapify(self._heap)
+            return
+        self._drop_stale()
+        if score > self._heap[0][0]:
+            _, evicted = heapq.heapreplace(self._heap, (score, article_id))
+            del self._top[evicted]
+            self._top[article_id] = score
+
+    def _drop_stale(self):
+        heap = self._heap
+        while heap and self._top.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+
+    # 跟踪的文章超过 capacity 时只保留分数最高的一半（前 K 名总是保留）
+    def _trim(self):
+        keep = heapq.nlargest(self.capacity // 2, self._scores.items(), key=lambda item: item[1])
+        self._scores = dict(keep)
+        self._scores.update(self._top)
+        self.trims += 1
+
+    def _rescale(self, now):
+        factor = math.exp(-self.rate * (now - self._base))
+        self._base = now
+        self._scores = {key: value * factor for key, value in self._scores.items()}
+        self._top = {key: self._scores[key] for key in self._top}
+        self._heap = [(value, key) for key, value in self._top.items()]
+        heapq.heapify(self._heap)
+
+    def _decay(self, now):
+        return math.exp(-self.rate * (now - self._base))
+
+    # 前 n 名 [(article_id, 当前分数)]，按分数从高到低
+    def top(self, n=None, now=None):
+        factor = self._decay(time.time() if now is None else now)
+        ranked = sorted(self._top.items(), key=lambda item: (-item[1], item[0]))
+        return [(key, value * factor) for key, value in ranked[:n]]
+
+    # 所有跟踪中的文章的当前分数，用于快照
+    def items(self, now):
+        factor = self._decay(now)
+        return [(key, value * factor) for key, value in self._scores.items()]
+
+    def load(self, items, now):
+        for article_id, score in items:
+            self.add(article_id, score, now)
+
+    def __len__(self):
+        return len(self._scores)
+
+# 替换本进程的快照，同时删除编号超出当前进程数的旧进程留下的快照
+def write_snapshot(conn, worker, workers, rows):
+    conn.execute('DELETE FROM article_trending WHERE worker = ? OR worker >= ?', (worker, workers))
+    conn.executemany('INSERT INTO article_trending (board, worker, article_id, score, saved_at) '
+                     'VALUES (?, ?, ?, ?, ?)', rows)
+
+# 浏览事件入口和快照线程。
+# connection 是一个返回上下文管理器的函数，上下文产出 DB-API 连接；write 用于写快照（与 ViewBuffer 相同）。
+# 多进程时 worker 为本进程编号，workers 为进程数
+class Trending:
+    def __init__(self, connection, k=20, capacity=10000, snapshot_interval=60.0, boards=BOARDS, write=None,
+                 worker=0, workers=1):
+        self.connection = connection
+        self.write = write or direct_writer(connection)
+        self.worker = worker
+        self.workers = workers
+        self.k = k
+        self.snapshot_interval = snapshot_interval
+        self.boards = {name: DecayedTopK(half_life, k, capacity) for name, _, _, half_life in boards}
+        self._lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._dirty = False
+        # 统计信息
+        self.events = 0
+        self.snapshots = 0
+        self.snapshot_rows = 0
+        self.snapshot_seconds = 0.0
+        self.errors = 0
+
+    def record(self, article_id):
+        now = time.time()
+        with self._lock:
+            for board in self.boards.values():
+                board.add(article_id, 1.0, now)
+            self.events += 1
+            self._dirty = True
+
+    def top(self, name, n=None):
+        with self._lock:
+            return self.boards[name].top(n)
+
+    # 从快照恢复，分数按快照之后经过的时间衰减。还没有 popular 快照时（第一次启动）
+    # 用 article.views 作为初始分数：只在这时按浏览量全表排序一次，有了浏览之后的快照里就有它了。
+    # 各进程的快照合计后按进程数平分：之后每个进程只统计约 1/workers 的访问，各进程的快照合计仍是全部访问
+    def load(self):
+        now = time.time()
+        with self.connection() as conn:
+            rows = conn.execute('SELECT board, article_id, score, saved_at FROM article_trending').fetchall()
+            if 'popular' in self.boards and not any(row[0] == 'popular' for row in rows):
+                capacity = self.boards['popular'].capacity
+                rows += [('popular', article_id, views, now) for article_id, views in conn.execute(
+                    'SELECT id, views FROM article WHERE views > 0 ORDER BY views DESC LIMIT ?', (capacity,))]
+        share = 1.0 / self.workers
+        with self._lock:
+            for name, board in self.boards.items():
+                board.load([(article_id, score * share * math.exp(-board.rate * (now - saved_at)))
+                            for board_name, article_id, score, saved_at in rows if board_name == name], now)
+            self._dirty = False
+        return len(rows)
+
+    def snapshot(self):
+        with self._snapshot_lock:
+            now = time.time()
+            with self._lock:
+                if not self._dirty:
+                    return 0
+                self._dirty = False
+                rows = [(name, self.worker, article_id, score, now)
+                        for name, board in self.boards.items() for article_id, score in board.items(now)]
+            start = time.perf_counter()
+            try:
+                self.write(write_snapshot, self.worker, self.workers, rows)
+            except Exception:
+                with self._lock:
+                    self._dirty = True
+                raise
+            with self._lock:
+                self.snapshots += 1
+                self.snapshot_rows = len(rows)
+                self.snapshot_seconds = time.perf_counter() - start
+            return len(rows)
+
+    def start(self):
+        if self._thread is None and self.snapshot_interval > 0:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='trending', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        # 停止后台线程并保存最后一次快照
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.snapshot()
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.snapshot_interval)
+            if self._stopping:
+                break
+            self._wakeup.clear()
+            try:
+                self.snapshot()
+            except Exception:
+                with self._lock:
+                    self.errors += 1
+                traceback.print_exc()
+
+    def metrics(self):
+        with self._lock:
+            metrics = {
+                'events': self.events,
+                'snapshots': self.snapshots,
+                'snapshot_rows': self.snapshot_rows,
+                'snapshot_ms': round(self.snapshot_seconds * 1000, 3),
+                'errors': self.errors,
+            }
+            for name, board in self.boards.items():
+                metrics[f'{name}_tracked'] = len(board)
+                metrics[f'{name}_trims'] = board.trims
+            return metrics
@@ -0,0 +1,139 @@
+import datetime
+import threading
+import traceback
+
+from db_writer import direct_writer
+
+UPDATE_VIEWS_SQL = 'UPDATE article SET views = views + ? WHERE id = ?'
+
+# 同一用户重复浏览只更新时间，保留原有记录 id
+UPSERT_HISTORY_SQL = '''
+    INSERT INTO article_view_history (user_id, article_id, viewed_at)
+    VALUES (?, ?, ?)
+    ON CONFLICT (user_id, article_id) DO UPDATE SET viewed_at = excluded.viewed_at
+'''
+
+def utc_timestamp():
+    return datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+
+def write_views(conn, views, history):
+    cursor = conn.cursor()
+    cursor.executemany(UPDATE_VIEWS_SQL, [(n, article_id) for article_id, n in views.items()])
+    cursor.executemany(UPSERT_HISTORY_SQL, [(user_id, article_id, viewed_at)
+                                            for (user_id, article_id), viewed_at in history.items()])
+
+# 浏览写缓冲：在内存中累计浏览次数和最近浏览时间，按数量或时间阈值批量写入
+#
+# connection 是一个返回上下文管理器的函数，上下文产出 DB-API 连接。
+# write(fn, *args) 在一个事务中执行 fn(conn, *args)，默认在 connection 借出的连接上执行并提交，
+# 也可以传入 DatabaseWriter.run 交给写线程组提交。
+# 页面展示浏览量时通过 consistent_read() 读取数据库和尚未落库的增量，保证读到自己的写入。
+class ViewBuffer:
+    def __init__(self, connection, max_pending=1000, flush_interval=2.0, on_flush=None, write=None):
+        self.connection = connection
+        self.write = write or direct_writer(connection)
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        self._views = {}
+        self._history = {}
+        self._flushing = False
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        # 统计信息
+        self.flushes = 0
+        self.flushed_views = 0
+        self.flushed_history = 0
+
+    def start(self):
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='view-buffer', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        # 停止后台线程并写入所有剩余数据
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                traceback.print_exc()
+
+    def record(self, user_id, article_id):
+        viewed_at = utc_timestamp()
+        with self._lock:
+            self._views[article_id] = self._views.get(article_id, 0) + 1
+            self._history[(user_id, article_id)] = viewed_at
+            pending = len(self._views) + len(self._history)
+        if pending >= self.max_pending:
+            if self._thread is not None:
+                self._wakeup.set()
+            else:
+                self.flush()
+
+    # 执行 load() 读取数据库，同时返回与之一致的未落库增量 {article_id: n}
+    def consistent_read(self, load):
+        while True:
+            with self._lock:
+                generation = self.flushes
+                flushing = self._flushing
+            if flushing:
+                # 落库进行中，等它结束再读，避免增量被重复计算或遗漏
+                with self._flush_lock:
+                    pass
+                continue
+            value = load()
+            with self._lock:
+                if self.flushes == generation and not self._flushing:
+                    return value, dict(self._views)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                views, self._views = self._views, {}
+                history, self._history = self._history, {}
+                if not views and not history:
+                    return 0
+                self._flushing = True
+            try:
+                self.write(write_views, views, history)
+            except Exception:
+                # 写入失败时放回缓冲，下次再试
+                with self._lock:
+                    for article_id, n in views.items():
+                        self._views[article_id] = self._views.get(article_id, 0) + n
+                    for key, viewed_at in history.items():
+                        self._history[key] = max(viewed_at, self._history.get(key, viewed_at))
+                    self._flushing = False
+                raise
+            with self._lock:
+                self._flushing = False
+                self.flushes += 1
+                self.flushed_views += sum(views.values())
+                self.flushed_history += len(history)
+        if self.on_flush:
+            self.on_flush(set(views))
+        return len(views) + len(history)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'pending_articles': len(self._views),
+                'pending_history': len(self._history),
+                'flushes': self.flushes,
+                'flushed_views': self.flushed_views,
+                'flushed_history': self.flushed_history,
+            }